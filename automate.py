@@ -1,23 +1,23 @@
 """ This module automates the calculation of all generated inputfiles as well as the
 evaluation of the Outputdatabases. Also preselection parameters are specified."""
 
+import multiprocessing
 import os
 import time
-import sys  # to exit the subprocess after the abaqus standard job has finished
-import psutil  # library for retrieving information on running processes
 
+import datreader
+import deckparser
+import jobpool
+import material
 import mathutils
+import odbreader
+import resultstore
 
 
-def preselect(total_grain_amount, martensite_amount):
-    """This function reduces the number of calculations carried out in a increment
-    by preselecting more likely states known from a previous increment. The here
-    defined parameters reduce the number of total calculations for this simulation
-    by a factor of 6 while the results are the same. Note that especially, low
-    fractions at early increments lower the number of total calculations because the
-    number of not transformed grains and all possibilites are related multiplicatively."""
-
+def preselection_fraction(total_grain_amount, martensite_amount):
+    """returns the fraction of all possible transformations calculated in an increment"""
     # here the fraction of all possible transformations is declared
+    calc_fraction = 1
     if martensite_amount < int(total_grain_amount * .7):
         calc_fraction = (1. / 7)
 
@@ -29,246 +29,432 @@ def preselect(total_grain_amount, martensite_amount):
 
     if martensite_amount >= int(total_grain_amount * .95):
         calc_fraction = 1
+    return calc_fraction
 
-    deltas = []
+
+def preselect(total_grain_amount, martensite_amount):
+    """This function reduces the number of calculations carried out in a increment
+    by preselecting more likely states known from a previous increment. The here
+    defined parameters reduce the number of total calculations for this simulation
+    by a factor of 6 while the results are the same. Note that especially, low
+    fractions at early increments lower the number of total calculations because the
+    number of not transformed grains and all possibilites are related multiplicatively."""
+
+    calc_fraction = preselection_fraction(total_grain_amount, martensite_amount)
 
     # variant_preselection is taken from the last state in which
-    # all variant permutations are known
-    allstates = 'saves/allruns_' + str(martensite_amount - 1)
-    with open(allstates, 'r') as allstates:
+    # all variant permutations are known, the largest delta_G first
+    store = resultstore.ResultStore()
+    saved = len(store.runs(martensite_amount - 1)['grain'])
+    if saved or not os.path.isfile('saves/allruns_' + str(martensite_amount - 1)):
+        return store.top(martensite_amount - 1, int(saved * calc_fraction))  # [grainNr, laminate]
+    #
+    # runs saved before the result store hold the text file only
+    deltas = []
+    with open('saves/allruns_' + str(martensite_amount - 1), 'r') as allstates:
         for index, line in enumerate(allstates):
-            line = line.rstrip('\n')
             if index == 0:
                 continue  # ignore the headerline
-            else:
-                # data = [ delta_ener, grain_nr, laminate_nr ]
-                data = [float(line.split()[5]), line.split()[0], line.split()[1]]
-                deltas.append(data)
-                # why del data, python has garbage collection not?
-                del data
-    deltas.sort()  # sort ascending
-    deltas.reverse()  # reverse to get descending sort
+            data = line.split()
+            # data = [ delta_ener, grain_nr, laminate_nr ]
+            deltas.append([float(data[5]), int(data[0]), int(data[1])])
+    deltas.sort(reverse=True)  # descending sort
     amount = int(len(deltas) * calc_fraction)
-    deltas = deltas[0: amount]
-
-    preselection = []
-    for i in deltas:
-        preselection.append([int(i[1]), int(i[2])])  # [grainNr, laminate]
-    return preselection
-
-
-def submitjobs(austenite_grains, martensite_amount, laminate_variants, preselection, selected_variants, timeout):
-    """handles automatic submission of all inputfiles, created in an increment"""
+    return [[grain_nr, laminate] for _, grain_nr, laminate in deltas[0: amount]]
+
+
+def candidate_jobs(martensite_amount, space, skip=()):
+    """returns a job for every candidate of the CandidateSpace of an increment, except the
+    candidates (grainNr, laminate) in 'skip'"""
+    return [jobpool.Job(martensite_amount, austenite_grain[0], laminate, austenite_grain[1])
+            for austenite_grain, laminate in space if (austenite_grain[0], laminate) not in skip]
+
+
+def tune_concurrency(geometry_filename, martensite_amount, space, timeout, default=(6, 2), backend='abaqus',
+                     on_launch=None):
+    """returns the (concurrent jobs, cpus per job) split for this mesh and host. If no
+    split is known yet, it is calibrated with representative candidates of the current
+    increment, whose input files must already exist, and stored for later increments.
+    'on_launch' is called with every calibration job that is started"""
+    mesh_key = deckparser.file_md5(geometry_filename)
+    if backend != 'abaqus':
+        mesh_key += '_' + backend
+    settings = jobpool.ConcurrencySettings()
+    split = settings.get(mesh_key)
+    if split is None:
+        jobs = candidate_jobs(martensite_amount, space)
+        split = jobpool.calibrate(jobpool.SolveTimes().order_longest_first(jobs), timeout, backend=backend,
+                                  on_launch=on_launch)
+        if split is None:
+            return default
+        settings.set(mesh_key, split)
+    return split
+
+
+def grain_number(set_name):
+    """grain number of an element set 'TRANSIG_<nr>', None for other sets like the matrix"""
+    if not set_name.upper().startswith('TRANSIG_'):
+        return None
+    return int(set_name[len('TRANSIG_'):])
+
+
+def get_volumes_and_laminates(filename):
+    """returns [grainNr, grainvolume, grainmaterial] of all grains ordered by number and
+    their total volume Vinner. The volumes are taken from the mesh of an input file, which
+    is read through the deck cache (see deckparser), or from an odb"""
+    if filename.endswith('.odb'):
+        summary = odbreader.summarize_odb(filename)
+        graindata = [[grain_number(set_name), float(volume), material_name]
+                     for set_name, volume, material_name in zip(summary.set_names, summary.volumes, summary.materials)
+                     if grain_number(set_name) is not None]
+    else:
+        deck = deckparser.cached_parse(filename.strip())
+        grain_nrs, volumes = deckparser.grain_volumes(deck)
+        materials = dict((elset, material_name) for elset, orientation, material_name in deck.sections)
+        graindata = [[int(nr), float(volume), materials.get('TRANSIG_' + str(nr), 'AUSTENITE')]
+                     for nr, volume in zip(grain_nrs, volumes)]
+    graindata.sort()
+    return graindata, sum([grain[1] for grain in graindata])
+
+
+def stress_scores(summary):
+    """returns [score, grainNr, laminate] of every austenite grain and laminate of an
+    OdbSummary. The score is the transformation criterion: the double dot product of the
+    volume averaged stress of the grain with the eigenstrain of the laminate minus the
+    specific interface energy barrier of the grain. The stresses are given in the local
+    orientation of the grain, like the eigenstrains."""
+    transforming_strains = material.eigenstrains()
+    sets = [i for i in summary.austenite_sets() if grain_number(summary.set_names[i]) is not None]
+    if not sets:
+        return []
+    # average "effective" stress tensors of the grains against all eigenstrains at once
+    sigmas = mathutils.fill_matrices([summary.mean_stresses[i] for i in sets])
+    spec_driving_stresses = mathutils.doubledot_products(sigmas, transforming_strains)
+    scores = []
+    for row, i in enumerate(sets):
+        spec_grain_drag = material.calc_draggingForces(summary.volumes[i])
+        for laminate in range(1, len(transforming_strains) + 1):
+            scores.append([float(spec_driving_stresses[row, laminate - 1]) - spec_grain_drag,
+                           grain_number(summary.set_names[i]), laminate])
+    return scores
+
+
+def screen(odbname, total_grain_amount, martensite_amount, candidates=None):
+    """preselects the candidates of an increment by their stress based transformation
+    criterion, read in one pass from the odb of the last accepted state. The same fraction
+    as in the preselection table is kept. If 'candidates' ([grainNr, laminate] pairs, e.g.
+    from preselect) are given, only those are ranked, else all austenite grains."""
+    scores = stress_scores(odbreader.summarize_odb(odbname))
+    if candidates is not None:
+        keep = set((grain_nr, laminate) for grain_nr, laminate in candidates)
+        scores = [score for score in scores if (score[1], score[2]) in keep]
+        amount = int(len(candidates) * preselection_fraction(total_grain_amount, martensite_amount))
+    else:
+        amount = int(len(scores) * preselection_fraction(total_grain_amount, martensite_amount))
+    scores.sort(reverse=True)  # highest driving stress first
+    return [[grain_nr, laminate] for _, grain_nr, laminate in scores[0: max(amount, 1)]]
+
+
+def interaction_screen(inputname, grain_nr, austenite_grains, candidates, count,
+                       total_strain_energy_cell_before=0, chemical_drivingForce=0):
+    """keeps the 'count' candidates ([grainNr, laminate] pairs) with the smallest estimated
+    |delta_G|. The total strain energies are estimated from the interaction matrix of the
+    stiffness state of the increment (see fesolver.InteractionMatrix), built from the input
+    file of the candidate 'grain_nr', so only the kept candidates need a FE solution."""
+    import fesolver  # needs SciPy in this interpreter
+    grains = dict((austenite_grain[0], austenite_grain) for austenite_grain in austenite_grains)
+    grain_nrs = sorted(set(grain for grain, laminate in candidates))
+    laminates = sorted(set(laminate for grain, laminate in candidates))
+    energies = fesolver.interaction_matrix(inputname, grain_nr, grain_nrs).energies(laminates)
+    rows = []
+    for grain, laminate in candidates:
+        energy = energies[grain_nrs.index(grain), laminates.index(laminate)]
+        rows.append(evaluation_row(grains[grain], laminate, energy, total_strain_energy_cell_before,
+                                   chemical_drivingForce))
+    rows.sort(key=lambda row: abs(row[0]))
+    return [[row[1], row[2]] for row in rows[0: count]]
+
+
+def submitjobs(martensite_amount, space, pool, on_complete=None, early_stopping=None, skip=(), on_launch=None,
+               admit=None, cache=None):
+    """handles automatic submission of the inputfiles of all candidates of the CandidateSpace
+    of an increment. The jobs run in the 'pool' of the backend (see jobpool.job_runner),
+    which starts the next job as soon as a slot is free. Jobs are queued longest-first
+    based on the solve times of earlier increments. 'on_complete' is called with every job
+    as soon as it has ended, e.g. CandidateEvaluator.consume. With an EarlyStopping the
+    jobs are queued best-first instead and no further job is launched once the best
+    candidate is settled. Candidates in 'skip', e.g. evaluated before a restart, are not
+    run, nor are those whose energy is in the 'cache' (resultcache.IncrementCache), their
+    energies are taken from it by the caller. 'on_launch' is called with every job when it
+    is started, no job is launched while 'admit' returns False and others are running.
+    Returns the jobs that were run."""
     #
-    wait_array = []
-    job_nr_ = 0
-
+    if cache is not None:
+        skip = set(skip) | set(cache.cached(space))
+    jobs = candidate_jobs(martensite_amount, space, skip)
+    solve_times = jobpool.SolveTimes()
+    if early_stopping is not None:
+        jobs = early_stopping.order_best_first(jobs)
+    else:
+        jobs = solve_times.order_longest_first(jobs)
+    finished = pool.run(jobs, on_complete, early_stopping, on_launch, admit)
+    solve_times.record(finished)
+    return finished
+
+
+def evaluation_row(austenite_grain, laminate, total_strain_energy_cell, total_strain_energy_cell_before=0,
+                   chemical_drivingForce=0, drag_energy_spec=None):
+    """returns the evaluation data of a candidate from the total strain energy of its cell
+    [0-delta_G, 1-GrainNr, 2-GrainLaminate, 3-GrainVol, 4-dragEner_spec,
+     5-delta_totalStrain_spec, 6-total_strainEner_cell]. The interface energy barrier is
+    calculated unless it is given, e.g. from the grain registry"""
+    # Calculate difference of free energy density to previous increment:
+    # first calculate specific strain energy of transformed grain
+    delta_total_strain = total_strain_energy_cell - total_strain_energy_cell_before
+    delta_total_strain_spec = delta_total_strain / austenite_grain[1]
+    # next calculate specific interface energy barrier of transformed grain
+    if drag_energy_spec is None:
+        drag_energy_spec = material.calc_draggingForces(austenite_grain[1])
     #
-    for austenite_grain in austenite_grains:
-        for laminate in laminate_variants:
-            if ([austenite_grain[0], laminate] in selected_variants) or not preselection:
-                #
-                job_nr_ += 1
-
-                inputname = 'Inputfile_' + str(martensite_amount) + '_' + \
-                            str(austenite_grain[0]) + '_' + str(laminate) + '.inp'
-                outputname = 'Outputfile_' + str(martensite_amount) + '_' + \
-                             str(austenite_grain[0]) + '_' + str(laminate)
-                #
-                pid = os.fork()  # start (=fork) subprocesses
-                if pid == 0:  # 0 is the child process
-                    # in the child process invoke the standard solver
-                    os.system('/opt/abaqus/Commands/abq6123 job=' + outputname + \
-                              ' interactive cpus=2 scratch=/dev/shm input=' + \
-                              inputname + ' mp_mode=threads standard_parallel=all')
-                    # /dev/shm tmpfs directory
-                    sys.exit()  # close subprocess after the job has finished
-                else:  # in the parent process the child process are managed
-                    process = psutil.Process(pid)
-                    wait_array.append(process)
-                #
-                if job_nr_ % 6 == 0 or (preselection and job_nr_ == len(selected_variants)):
-                    for iprocess in wait_array:
-                        try:
-                            iprocess.wait(timeout)
-                        # timeout is the time in seconds the script waits for completion of the job
-                        except psutil.TimeoutExpired:
-                            print 'process running after timeout, killing proces...'
-                            os.system('killall -9 standard.exe')
-                            time.sleep(30)
-                    wait_array = []  # empty wait array for new processes
-    # Here be dragons and a bit of C
-    del inputname, outputname, wait_array, job_nr_
-
-
-def find_minimum_energy(austenite_grains, martensite_amount, laminate_variants, preselection, selected_variants=[],
-                        total_strain_energy_cell_before=0, chemical_drivingForce=0):
-    """Reads totalstrainergy from outputfiles and evaluates the transformation that minimizes
-       the total strain energy density """
+    # In the first run the chemical_drivingForce is determined as the sum
+    # of dragging energies, thus it a negative value
+    delta_g = chemical_drivingForce - (drag_energy_spec + delta_total_strain_spec)
+    # CAUTION! : line continuation with - \ - gives +! 1--1 = 2!
     #
-    evaluation_data = []  # Define list for calculation results
+    return [delta_g, austenite_grain[0], laminate, austenite_grain[1],
+            drag_energy_spec, delta_total_strain_spec, total_strain_energy_cell]
+
+
+def read_total_strain_energy(outputname, status=None, allie=None):
+    """returns the total strain energy of a job or None if the job did not complete. The
+    value is taken from the .dat file, the odb is only opened if it is not printed there"""
+    if status is None:
+        status, allie = datreader.read_energy(outputname)
+    if status != 'completed':
+        return None
+    if allie is not None:
+        return allie
+    # if the calculation was terminated and a .lck file exist ignore that .odb
+    if not os.path.isfile(outputname + '.odb') or os.path.isfile(outputname + '.lck'):
+        return None
+    return evaluate_odb(outputname + '.odb', var=1)
+
+
+def find_minimum_energy(martensite_amount, space, total_strain_energy_cell_before=0, chemical_drivingForce=0,
+                        processes=None, cache=None):
+    """Reads totalstrainergy from outputfiles of the candidates of a CandidateSpace and
+       evaluates the transformation that minimizes the total strain energy density. The
+       text outputs of all jobs are read in a pool of 'processes' worker processes, the
+       energies of candidates in the 'cache' (resultcache.IncrementCache) are taken from it
+       and those read are added to it """
     #
-    for austenite_grain in austenite_grains:
-        for laminate in laminate_variants:
-            if ([austenite_grain[0], laminate] in selected_variants) or not preselection:
-                #
-                odbname = 'Outputfile_' + str(martensite_amount) + '_' + str(austenite_grain[0]) + \
-                          '_' + str(laminate) + '.odb'
-                #
-                # if the calculation was terminated and a .lck file exist ignore that .odb
-                if os.path.isfile(odbname[0:len(odbname) - 3] + 'lck'):
-                    continue
-                # read the totalstrainenergy of the whole model via the odb file
-                # alternatively it could be extracted from the .dat file
-                else:
-                    total_strain_energy_cell = evaluate_odb.(odbname, var=1)
-                #
-                # Calculate difference of free energy density to previous increment:
-                # first calculate specific strain energy of transformed grain
-                delta_total_strain = total_strain_energy_cell - total_strain_energy_cell_before
-                delta_total_strain_spec = delta_total_strain / austenite_grain[1]
-                # next calculate specific interface energy barrier of transformed grain
-                drag_energy_spec = forces.calc_draggingForces(austenite_grain[1])
-                # where is forces defined
-                #
-                # In the first run the chemical_drivingForce is determined as the sum
-                # of dragging energies, thus it a negative value
-                delta_g = chemical_drivingForce - (drag_energy_spec + delta_total_strain_spec)
-                # CAUTION! : line continuation with - \ - gives +! 1--1 = 2!
-                #
-                evaluation_data.append([delta_g, austenite_grain[0], laminate, austenite_grain[1],
-                                        drag_energy_spec, delta_total_strain_spec, total_strain_energy_cell])
-                #
-                del total_strain_energy_cell, delta_total_strain, delta_total_strain_spec, \
-                    drag_energy_spec, delta_g
+    cached = cache.cached(space) if cache is not None else {}
+    candidates = []
+    for austenite_grain, laminate in space:
+        outputname = 'Outputfile_' + str(martensite_amount) + '_' + str(austenite_grain[0]) + '_' + str(laminate)
+        candidates.append((austenite_grain, laminate, outputname))
+    read = iter(datreader.read_energies([outputname for austenite_grain, laminate, outputname in candidates
+                                         if (austenite_grain[0], laminate) not in cached], processes))
+    #
+    evaluation_data = []  # Define list for calculation results
+    for austenite_grain, laminate, outputname in candidates:
+        if (austenite_grain[0], laminate) in cached:
+            total_strain_energy_cell = cached[(austenite_grain[0], laminate)]
+        else:
+            status, allie = next(read)
+            total_strain_energy_cell = read_total_strain_energy(outputname, status, allie)
+            if cache is not None:
+                cache.store(austenite_grain[0], laminate, total_strain_energy_cell)
+        if total_strain_energy_cell is None:
+            continue
+        evaluation_data.append(evaluation_row(austenite_grain, laminate, total_strain_energy_cell,
+                                              total_strain_energy_cell_before, chemical_drivingForce))
     return evaluation_data
 
 
+def read_allruns(martensite_amount):
+    """returns {(grainNr, laminate): delta_G} of all runs of an increment, an empty dict if
+    the increment was not saved"""
+    deltas = resultstore.ResultStore().deltas(martensite_amount)
+    if deltas:
+        return deltas
+    # runs saved before the result store hold the text file only
+    allstates = 'saves/allruns_' + str(martensite_amount)
+    if not os.path.isfile(allstates):
+        return deltas
+    with open(allstates, 'r') as allstates:
+        for index, line in enumerate(allstates):
+            if index == 0:
+                continue  # ignore the headerline
+            data = line.split()
+            deltas[(int(data[0]), int(data[1]))] = float(data[5])
+    return deltas
+
+
+class EarlyStopping(object):
+    """ranks the candidates of an increment by their delta_G of the previous increment and
+    stops launching jobs once the best delta_G found so far cannot be beaten by any queued
+    candidate. The delta_G of a queued candidate is predicted as its previous value shifted
+    by the mean change between the two increments before, with a margin of 'confidence'
+    standard deviations of that change. Candidates without history are never bounded."""
+
+    def __init__(self, martensite_amount, evaluator, confidence=3.):
+        self.evaluator = evaluator
+        previous = read_allruns(martensite_amount - 1)
+        before = read_allruns(martensite_amount - 2)
+        shifts = [previous[key] - before[key] for key in previous if key in before]
+        if len(shifts) < 2:
+            # nothing is known about how the deltas move, no candidate can be bounded
+            self.predictions = {}
+            self.margin = float('inf')
+        else:
+            mean_shift = sum(shifts) / len(shifts)
+            variance = sum((shift - mean_shift) ** 2 for shift in shifts) / (len(shifts) - 1)
+            self.predictions = dict((key, delta + mean_shift) for key, delta in previous.items())
+            self.margin = confidence * variance ** 0.5
+
+    def lower_bound(self, job):
+        """lower bound of |delta_G| of a candidate, the selection criterion of select_grain"""
+        if job.key() not in self.predictions:
+            return 0.
+        low = self.predictions[job.key()] - self.margin
+        high = self.predictions[job.key()] + self.margin
+        if low <= 0. <= high:
+            return 0.
+        return min(abs(low), abs(high))
+
+    def order_best_first(self, jobs):
+        """candidates without history first since they have to be solved anyway, then by
+        ascending predicted |delta_G|"""
+        def rank(job):
+            if job.key() not in self.predictions:
+                return (0, 0.)
+            return (1, abs(self.predictions[job.key()]))
+        return sorted(jobs, key=rank)
+
+    def __call__(self, queue):
+        best = self.evaluator.best
+        if best is None:
+            return False
+        for job in queue:
+            if self.lower_bound(job) <= abs(best[0]):
+                return False
+        return True
+
+
+class CandidateEvaluator(object):
+    """evaluates the jobs of an increment while the other jobs are still running. Every
+    completed job is handed to a worker pool as soon as its .lck file is released and the
+    best candidate found so far is kept up to date. 'finish' waits for the last outputs
+    and returns the evaluation data of all candidates."""
+
+    def __init__(self, total_strain_energy_cell_before=0, chemical_drivingForce=0, processes=None,
+                 lock_timeout=60, poll_interval=1., journal=None, grains=None, retention=None, cache=None):
+        self.journal = journal  # records every evaluation, see journal.Journal
+        self.cache = cache  # keeps the energies for other runs, see resultcache.IncrementCache
+        self.retention = retention  # removes the outputs of losing candidates, see retention
+        self.grains = grains  # the interface energy barriers of the grain registry
+        self.total_strain_energy_cell_before = total_strain_energy_cell_before
+        self.chemical_drivingForce = chemical_drivingForce
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self.pool = multiprocessing.Pool(processes)
+        self.pending = []  # completed jobs whose .lck file is not released yet
+        self.reading = []  # (job, asynchronous result of read_total_strain_energy)
+        self.evaluation_data = []
+        self.best = None  # evaluation row with minimum |delta_G| so far
+
+    def consume(self, job):
+        """completion event of a job. Jobs that were killed or failed are not evaluated"""
+        if job.status == 'completed':
+            self.pending.append(job)
+        elif job.status != 'skipped':
+            if self.journal is not None:
+                self.journal.record_evaluation(job, None)
+            if self.retention is not None:
+                self.retention.evaluated(job.outputname, None)
+        self.dispatch()
+
+    def dispatch(self):
+        """hands the outputs of unlocked jobs to the workers and evaluates those read. The
+        workers also open the odb if the energy is not printed in the .dat file, so the
+        job submission is never held up by reading an output"""
+        for job in list(self.pending):
+            if not os.path.isfile(job.outputname + '.lck'):
+                self.pending.remove(job)
+                self.reading.append((job, self.pool.apply_async(read_total_strain_energy, (job.outputname,))))
+        self.collect(block=False)
+
+    def collect(self, block):
+        for job, result in list(self.reading):
+            if not block and not result.ready():
+                continue
+            self.reading.remove((job, result))
+            total_strain_energy_cell = result.get()
+            if self.journal is not None:
+                self.journal.record_evaluation(job, total_strain_energy_cell)
+            if self.cache is not None:
+                self.cache.store(job.grain_nr, job.laminate, total_strain_energy_cell, getattr(job, 'backend', None))
+            self.add(job, total_strain_energy_cell)
+
+    def add(self, job, total_strain_energy_cell):
+        if total_strain_energy_cell is None:
+            if self.retention is not None:
+                self.retention.evaluated(job.outputname, None)
+            return
+        drag_energy_spec = self.grains.drag_energy(job.grain_nr) if self.grains is not None else None
+        row = evaluation_row([job.grain_nr, job.grain_volume], job.laminate, total_strain_energy_cell,
+                             self.total_strain_energy_cell_before, self.chemical_drivingForce, drag_energy_spec)
+        self.evaluation_data.append(row)
+        if self.retention is not None:
+            self.retention.evaluated(job.outputname, row[0])
+        if self.best is None or abs(row[0]) < abs(self.best[0]):
+            self.best = row
+
+    def finish(self):
+        """waits at most 'lock_timeout' seconds for the remaining .lck files, outputs which
+        stay locked are ignored, and returns the evaluation data ordered by grain and
+        laminate"""
+        deadline = time.time() + self.lock_timeout
+        self.dispatch()
+        while self.pending and time.time() < deadline:
+            time.sleep(self.poll_interval)
+            self.dispatch()
+        self.pending = []
+        self.collect(block=True)
+        self.pool.close()
+        self.pool.join()
+        self.evaluation_data.sort(key=lambda data: (data[1], data[2]))
+        return self.evaluation_data
+
+
+def select_grain(evaluation_data):
+    """the optimum grain is that with minimum |delta_G|. evaluation_data holds rows
+    [0-delta_G, 1-GrainNr, 2-GrainLaminate, 3-GrainVol, 4-dragEner_spec,
+     5-delta_totalStrain_spec, 6-total_strainEner_cell]"""
+    return min(evaluation_data, key=lambda data: abs(data[0]))
+
+
 def evaluate_odb(odbname, var=0):
     """ this function has three different return values (var = 0, 1, 2)
     per default (0) weighted strain energy densities are returned. var = 1: only the total
     strain energy of the model is returned. var = 2: The transformation criterion for
     the LTC is returned based on the specific IE energy barrier and the double dot product
-    of the averaged strain 	tensor in a grain and its possible eigenstrains"""
-    # create odb singular object
-    odb = openOdb(path=odbname)
-    # go through the object model
-    trans_step = odb.steps['Transformation']
-    last_frame = trans_step.frames[-1]  # [-1] gives last frame
-
+    of the averaged stress tensor in a grain and its possible eigenstrains.
+    All values are taken from the single pass summary of the odb, see odbreader."""
     if var == 1:
-        histreg = trans_step.historyRegions['Assembly Assembly-1']
-        # Assembly Assembly-1 is the default repository key that is generated
-        all_total_energies = histreg.historyOutputs['ALLIE'].data
-        # .data is the key in the dictionary for the Allenergies (total energies) array.
-        odb.close()
-        return all_total_energies[1][1]  # [1][1] is the totalstrainenergy
-
-    # --- integration point variables ---
-    stresses = last_frame.fieldOutputs['S']  # stress tensor components of integration points
-    seners = last_frame.fieldOutputs['SENER']  # strain energy densities of integration points
-    ivols = last_frame.fieldOutputs['IVOL']  # integration point volumes
-    """
-    ---  alternatively wole element variables can be read ---
-    last_frame.fieldOutputs['ESEDEN']    # equivalent to SENER for whole elements
-    last_frame.fieldOutputs['ELSE']     # strain energy for all whole Elements
-    last_frame.fieldOutputs['EVOL']      # equivalent to IVOL for whole elements
-    """
+        return odbreader.read_total_strain_energy(odbname)
     #
-    # initialize variables to be weighted from the integration point level
-    #!total_ave_sener is never being used!
-    total_strain_energy = total_ave_sener = ivol_total = ivol_aust = ivol_mart = 0
-    tot_strainEner_aust = tot_strain_ener_mart = 0
+    summary = odbreader.summarize_odb(odbname)
+    # md = [0 - tot_strainEner, 1 - tot_aveSener, 2 - ivol_aust, 3 - ivol_mart,
+    # 4 - aveSener_aust,  5 - aveSener_mart ]
+    model_data = summary.model_data()
+    if var != 2:
+        return model_data
     #
-    for igrain in odb.sections.values():
-        # or: for i in odb.rootAssembly.elementSets.keys() -> i = set_name from inputfile
-        #
-        material = igrain.material
-        set_name = igrain.name.lstrip('Section-')
-
-        #
-        # 'PART-1-1' is the default name of the first created part if none is specified
-        grain = odb.rootAssembly.instances['PART-1-1'].elementSets[set_name]
-
-        # integration point variable subsets
-        set_stresses = stresses.getSubset(region=grain, position=INTEGRATION_POINT)
-        set_ivol = ivols.getSubset(region=grain, position=INTEGRATION_POINT)
-        set_sener = seners.getSubset(region=grain, position=INTEGRATION_POINT)
-
-        # for whole element variables the same can be done without the parameter position=...
-        #
-        # evaluate the elementset related to the section
-        grain_sener_sum = grain_ges_ivol = 0
-        for i in range(len(set_stresses.values)):  # number of all integration points
-            # in the set SENER must be weighted with the element volume since
-            # not elements are of the same size. Same as ELSE
-            grain_sener_sum = grain_sener_sum + set_sener.values[i].data * set_ivol.values[i].data
-            grain_ges_ivol = grain_ges_ivol + set_ivol.values[i].data
-        grain_ave_sener = grain_sener_sum / grain_ges_ivol
-        total_strain_energy = total_strain_energy + grain_sener_sum
-
-        # the volume of the matrix must not be considered for the random RVE cell !
-        if 'TRANSIG' in set_name:
-            ivol_total = ivol_total + grain_ges_ivol
-
-        #
-        # additionally calculate the strain energy developement in each phase respectively
-        if material == 'AUSTENITE':
-            ivol_aust = ivol_aust + grain_ges_ivol
-            tot_strainEner_aust = tot_strainEner_aust + grain_ave_sener * grain_ges_ivol
-
-        #
-        if 'LAMINATE' in material:
-            ivol_mart = ivol_mart + grain_ges_ivol
-            tot_strain_ener_mart = tot_strain_ener_mart + grain_ave_sener * grain_ges_ivol
-
-        if var == 2 and material == 'AUSTENITE':
-            # initialize transformation strains
-            transforming_strains = eigenstrains()
-            # Define average "effective" stress tensor components
-
-            sigma = [0, 0, 0, 0, 0, 0] #converted from sigma = [sig_eff_11, sig_eff_22, sig_eff_33, sig_eff_12, sig_eff_13, sig_eff_23]
-            #
-            for i in range(len(sigma)):
-                for j in range(len(set_stresses.values)):
-                    sigma[i] += set_stresses.values[j].data[i] * set_ivol.values[j].data
-
-            for i in range(len(set_stress.values)):
-                grain_ges_ivol += set_ivol.values[i].data
-
-            sigma /= grain_ges_ivol
-            sigma = mathutils.fillmatrix(sigma)
-
-            #
-            spec_grain_drag = forces.calc_draggingForces(grain_ges_ivol)
-            for laminate in range(1, 6 + 1):  # = [1,2,3,4,5,6]
-                spec_driving_stress = mathutils.doubledotproduct(transforming_strains[laminate - 1], sigma)
-                check_term = spec_driving_stress - spec_grain_drag
-                if check_term > driving_force:
-                    driving_force = check_term
-                    found_grain = [set_name, laminate, driving_force]
-    odb.close()
-
-    #
-    # calculate total model values
-    #never being used!
-    total_ivol = ivol_aust + ivol_mart
-
-    # note that for the random RVE this is only the graincluster without the matrix
-    total_ave_sener = total_strain_energy / ivol_total
-    #where did you define these variables, they show up being unresolved references
-    total_aveSener_mart = total_strainEner_mart / ivol_mart
-    if ivol_aust != 0: total_aveSener_aust = total_strainEner_aust / ivol_aust
-
-    if var == 2:
-        return found_grain, total_strain_energy, total_ave_sener, ivol_austenite, ivol_transformed, \
-               tot_aveSener_aust, tot_aveSener_mart
-
-    return total_strain_energy, total_ave_sener, ivol_austenite, ivol_transformed, \
-           tot_aveSener_aust, tot_aveSener_mart
-
-
-
-
-
-
+    found_grain = None
+    scores = stress_scores(summary)
+    if scores:
+        driving_force, grain_nr, laminate = max(scores)
+        found_grain = ['TRANSIG_' + str(grain_nr), laminate, driving_force]
+    return (found_grain,) + model_data
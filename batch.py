@@ -0,0 +1,95 @@
+""" This module selects several grains which transform in one increment (batch mode, off
+by default). In the early part of the transformation the grains hardly interact, so the
+energy gain of transforming several of them is nearly the sum of their single gains.
+The best candidates by |delta_G| are taken together as long as every pair is spatially
+separated in the mesh or both candidates' delta_G hardly changed with the transformation
+of the last grain. The combined state is solved once; if its total strain energy deviates
+from the sum of the single changes by more than a tolerance only the best grain
+transforms, as without batches. """
+
+import numpy as np
+# my modules
+import automate
+import deckparser
+
+
+class GrainGeometry(object):
+    """ centroids and equivalent sphere diameters of the grains of a mesh. With 'periodic'
+    the distances are measured across the faces of the box spanned by the nodes (PBC) """
+
+    def __init__(self, filename, periodic):
+        deck = deckparser.cached_parse(filename.strip())
+        grain_nrs, self.centroids, volumes = deckparser.grain_centroids(deck)
+        self.row = dict((int(nr), i) for i, nr in enumerate(grain_nrs))
+        self.diameters = (6. * volumes / np.pi) ** (1. / 3.)
+        self.box = None
+        if periodic:
+            self.box = deck.coordinates.max(axis=0) - deck.coordinates.min(axis=0)
+
+    def distance(self, grain_a, grain_b):
+        """ distance of the centroids in units of the mean diameter of both grains """
+        i, j = self.row[grain_a], self.row[grain_b]
+        d = self.centroids[i] - self.centroids[j]
+        if self.box is not None:
+            d = d - self.box * np.round(d / self.box)  # nearest periodic image
+        return np.sqrt(np.dot(d, d)) / (0.5 * (self.diameters[i] + self.diameters[j]))
+
+
+def select_batch(evaluation_data, size, geometry=None, separation=2., previous=None, interaction=0.1):
+    """ the rows of at most 'size' candidates of different grains, best |delta_G| first.
+    A candidate joins the batch if it is at least 'separation' grain diameters away from
+    every member (with a 'geometry'), or if its relative change of delta_G to the increment
+    before ('previous', {(grainNr, laminate): delta_G}) and that of every member is below
+    'interaction'. The batch ends at the first candidate which does not join """
+    def weak(row):
+        before = previous.get((row[1], row[2])) if previous else None
+        return before is not None and abs(row[0] - before) <= interaction * abs(row[0])
+
+    ranked = sorted(evaluation_data, key=lambda data: abs(data[0]))
+    batch = ranked[0: 1]
+    for row in ranked[1:]:
+        if len(batch) >= size:
+            break
+        if row[1] in [member[1] for member in batch]:
+            continue  # another laminate of a grain in the batch
+        for member in batch:
+            if geometry is not None and geometry.distance(row[1], member[1]) >= separation:
+                continue
+            if weak(row) and weak(member):
+                continue
+            return batch
+        batch.append(row)
+    return batch
+
+
+def predicted_energy(batch, total_strain_energy_cell_before):
+    """ the total strain energy of the cell if the changes of the single transformations add up """
+    return total_strain_energy_cell_before + sum([row[6] - total_strain_energy_cell_before for row in batch])
+
+
+def deviation(batch, combined_energy, total_strain_energy_cell_before):
+    """ the deviation of the solved combined state from the predicted one, relative to the
+    changes of the single transformations """
+    changes = sum([abs(row[6] - total_strain_energy_cell_before) for row in batch])
+    return abs(combined_energy - predicted_energy(batch, total_strain_energy_cell_before)) / max(changes, 1e-30)
+
+
+def batch_rows(batch, combined_energy, total_strain_energy_cell_before, chemical_drivingForce):
+    """ the evaluation rows of the accepted grains as consecutive increments and the chemical
+    driving force after each. The states in between are the predicted ones, the last state
+    is the solved combined one. The first row equals the single evaluation """
+    rows, forces = [], []
+    before = total_strain_energy_cell_before
+    for i, row in enumerate(batch):
+        if i < len(batch) - 1:
+            after = before + row[6] - total_strain_energy_cell_before
+        else:
+            after = combined_energy
+        row = automate.evaluation_row([row[1], row[3]], row[2], after, before, chemical_drivingForce, row[4])
+        # if delta_G reaches a new negative maximum the chemical driving force is increased
+        if row[0] < 0:
+            chemical_drivingForce = row[0]
+        rows.append(row)
+        forces.append(chemical_drivingForce)
+        before = after
+    return rows, forces
@@ -0,0 +1,305 @@
+""" This module measures the overhead of the increment driver without the standard solver.
+It builds a synthetic grain structure, runs the full increment pipeline of driver with a
+stand-in solver and reports increments per hour and the time spent in every stage. The
+stand-in solver sleeps for a modeled runtime and writes the .dat and .sta outputs read by
+datreader, with a total strain energy (ALLIE) that depends only on the grains and laminates
+of the deck, so two runs of the same structure select the same grains.
+
+Structures:
+    pbc    - the 128 equally sized grains of the regular tesselation. The octahedra are
+             replaced by equal blocks of hexahedra, only the number and volume of the
+             grains matter to the pipeline
+    random - a random RVE of 'grains' grains: a hexahedral grid whose cells belong to the
+             nearest of random (periodic) seeds, so the grain volumes differ
+
+Usage (key=value arguments, see run_benchmark):
+    python benchmark.py structure=random grains=500 increments=5 runtime=0.5 slots=6
+The stand-in solver itself is run by the job pool as 'python benchmark.py solve job=.. input=..'
+with the backend 'fake' (see jobpool.Job.command). """
+
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+# my modules
+import automate
+import driver
+import grains
+import jobpool
+import write
+
+# environment of the stand-in solver, set by run_benchmark and passed on by the job pool
+RUNTIME_VARIABLE = 'BENCHMARK_RUNTIME'
+JITTER_VARIABLE = 'BENCHMARK_JITTER'
+# total strain energy of the untransformed cell and the scale of the energy a transformed
+# grain adds, of the order of the interface energy barrier of a grain of the PBC model
+BASE_ENERGY = 1.0e-3
+ENERGY_SCALE = 3.0e-6
+# volume of a grain of the regular tesselation, see transEnergymin
+PBC_GRAIN_VOLUME = 268000.0
+PBC_GRAIN_AMOUNT = 128
+# stages of an increment and the functions whose time is charged to them. Time spent in a
+# nested stage is only charged to the inner one
+STAGES = [('deck writing', write.DeckTemplate, 'write_inputfile'),
+          ('submission', jobpool.JobPool, 'launch'),
+          ('waiting', automate, 'submitjobs'),
+          ('extraction', automate.CandidateEvaluator, 'collect'),
+          ('extraction', automate.CandidateEvaluator, 'finish'),
+          ('result saving', write.FileOutputWriter, 'write_saves'),
+          ('preselection', driver.IncrementDriver, 'update_preselection'),
+          ('checkpointing', driver.IncrementDriver, 'write_checkpoint'),
+          ('other', driver.IncrementDriver, 'run_increment')]
+
+
+# -----< synthetic grain structures >------------------------------------------------------#
+
+def pbc_cell(cells_per_grain=2):
+    """ grain numbers (cells,) of a grid of 8 x 4 x 4 blocks of cells_per_grain^3 cells and
+    the edge length of a cell, so that every grain has the volume of the PBC model """
+    blocks = np.arange(PBC_GRAIN_AMOUNT).reshape(8, 4, 4) + 1
+    grain_of_cell = blocks.repeat(cells_per_grain, 0).repeat(cells_per_grain, 1).repeat(cells_per_grain, 2)
+    spacing = (PBC_GRAIN_VOLUME / cells_per_grain ** 3) ** (1. / 3.)
+    return grain_of_cell, spacing
+
+
+def random_rve(grain_amount, cells_per_edge=None, seed=0):
+    """ grain numbers (cells,) of a cubic grid in which every cell belongs to the nearest
+    of 'grain_amount' random seeds in the periodic unit cell, and the edge length of a
+    cell for the mean grain volume of the PBC model. Grains without a cell are dropped """
+    random = np.random.RandomState(seed)
+    if cells_per_edge is None:
+        cells_per_edge = max(8, int(round((8. * grain_amount) ** (1. / 3.))))
+    seeds = random.rand(grain_amount, 3)
+    centers = (np.indices((cells_per_edge,) * 3).reshape(3, -1).T + 0.5) / cells_per_edge
+    nearest = np.empty(len(centers), dtype=int)
+    for start in range(0, len(centers), 4096):
+        distance = np.abs(centers[start: start + 4096, np.newaxis, :] - seeds[np.newaxis, :, :])
+        distance = np.minimum(distance, 1. - distance)  # periodic
+        nearest[start: start + 4096] = np.argmin((distance ** 2).sum(axis=2), axis=1)
+    # number the grains that got cells consecutively
+    used, grain_of_cell = np.unique(nearest, return_inverse=True)
+    spacing = (PBC_GRAIN_VOLUME * len(used) / len(centers)) ** (1. / 3.)
+    return (grain_of_cell + 1).reshape((cells_per_edge,) * 3), spacing
+
+
+def write_geometry(filename, grain_of_cell, spacing, seed=0):
+    """ writes nodes, hexahedra, the element set transig_<grainNr> and a random
+    orientation Ori_<grainNr> of every grain. Returns the grain numbers, the volumes and
+    the orientation vectors (grains, 2, 3) """
+    random = np.random.RandomState(seed + 1)
+    shape = np.array(grain_of_cell.shape)
+    node_ids = np.arange(np.prod(shape + 1)).reshape(shape + 1) + 1
+    coordinates = np.indices(shape + 1).reshape(3, -1).T * spacing
+    i, j, k = [index.ravel() for index in np.indices(shape)]
+    connectivity = np.column_stack([node_ids[i, j, k], node_ids[i + 1, j, k], node_ids[i + 1, j + 1, k],
+                                    node_ids[i, j + 1, k], node_ids[i, j, k + 1], node_ids[i + 1, j, k + 1],
+                                    node_ids[i + 1, j + 1, k + 1], node_ids[i, j + 1, k + 1]])
+    grain_of_element = grain_of_cell.ravel()
+    grain_nrs = np.unique(grain_of_element)
+    volumes = np.bincount(grain_of_element)[grain_nrs] * spacing ** 3
+    # two orthogonal vectors of a random rotation per grain
+    orientations = np.array([np.linalg.qr(random.randn(3, 3))[0].T[0:2] for _ in grain_nrs])
+    with open(filename, 'w') as geometry:
+        geometry.write('*Node\n')
+        for label, (x, y, z) in zip(node_ids.ravel(), coordinates):
+            geometry.write('{0}, {1:.6f}, {2:.6f}, {3:.6f}\n'.format(label, x, y, z))
+        geometry.write('*Element, type=C3D8\n')
+        for label, nodes in enumerate(connectivity):
+            geometry.write(str(label + 1) + ', ' + ', '.join([str(node) for node in nodes]) + '\n')
+        for grain_nr, (a, b) in zip(grain_nrs, orientations):
+            labels = np.flatnonzero(grain_of_element == grain_nr) + 1
+            geometry.write('*Elset, elset=transig_' + str(grain_nr) + '\n')
+            for start in range(0, len(labels), 16):
+                geometry.write(', '.join([str(label) for label in labels[start: start + 16]]) + '\n')
+            geometry.write('*Orientation, name=Ori_' + str(grain_nr) + '\n')
+            geometry.write(', '.join(['{0:.8f}'.format(value) for value in list(a) + list(b)]) + '\n')
+    return grain_nrs, volumes, orientations
+
+
+def write_material_jobdata(filename, laminate_variants):
+    """ writes the materials and the step. The stand-in solver does not read them, the
+    stiffness and eigenstrains of austenite and the laminates are those of material """
+    with open(filename, 'w') as jobdata:
+        for name in ['AUSTENITE'] + ['laminate' + str(laminate) for laminate in laminate_variants]:
+            jobdata.write('*Material, name=' + name + '\n*Elastic\n70e-9, 0.4\n')
+        jobdata.write('*Step, name=Transformation\n*Static\n*Energy Print\n*End Step\n')
+
+
+# -----< stand-in solver >-----------------------------------------------------------------#
+
+def unit_hash(*values):
+    """ a number in [0, 1) that only depends on the values """
+    return int(hashlib.md5(repr(values).encode('utf-8')).hexdigest()[:8], 16) / float(1 << 32)
+
+
+def transformed_sections(inputname):
+    """ (grainNr, laminate) of the sections of a deck assigned to a laminate """
+    sections = []
+    with open(inputname, 'r') as deck:
+        for line in deck:
+            if line.startswith('*Solid Section') and 'material=laminate' in line:
+                grain_nr = int(line.split('elset=transig_')[1].split(',')[0])
+                sections.append((grain_nr, int(line.split('material=laminate')[1])))
+    return sections
+
+
+def solve(jobname, inputname):
+    """ the stand-in solver: holds the .lck file for the modeled runtime and writes the
+    outputs of a completed job. Every transformed grain adds an energy that only depends
+    on the grain and its laminate """
+    sections = transformed_sections(inputname)
+    runtime = float(os.environ.get(RUNTIME_VARIABLE, 1.))
+    jitter = float(os.environ.get(JITTER_VARIABLE, 0.))
+    with open(jobname + '.lck', 'w'):
+        pass
+    time.sleep(max(0., runtime * (1. + jitter * (2. * unit_hash(jobname) - 1.))))
+    allie = BASE_ENERGY + sum([ENERGY_SCALE * (0.5 + unit_hash(grain_nr, laminate))
+                               for grain_nr, laminate in sections])
+    with open(jobname + '.dat', 'w') as dat:
+        dat.write('\n                              S T A N D - I N   S O L V E R\n\n')
+        dat.write(' MODEL DATA\t' + '\t'.join(['{0:.6e}'.format(value) for value in [allie, allie, 0., 0., 0., 0.]])
+                  + '\n')
+        dat.write(' INTERNAL ENERGY (ALLIE)\t' + '{0:.9e}'.format(allie) + '\n')
+    with open(jobname + '.sta', 'w') as sta:
+        sta.write(' THE ANALYSIS HAS COMPLETED SUCCESSFULLY\n')
+    os.remove(jobname + '.lck')
+
+
+# -----< stage timing >--------------------------------------------------------------------#
+
+class StageTimer(object):
+    """ charges the time spent in wrapped functions to stages. A function called from
+    another wrapped function is charged to its own stage only """
+
+    def __init__(self):
+        self.totals = {}
+        self.calls = {}
+        self.nested = []  # time of the inner stages of every running stage
+        self.patched = []
+
+    def wrap(self, owner, name, stage):
+        """ replaces the function 'name' of a module or class by a timed one """
+        function = owner.__dict__[name]
+        timer = self
+
+        def timed(*args, **kwargs):
+            return timer.call(stage, function, args, kwargs)
+        timed.__name__ = name
+        timed.__doc__ = function.__doc__
+        setattr(owner, name, timed)
+        self.patched.append((owner, name, function))
+
+    def call(self, stage, function, args, kwargs):
+        start = time.time()
+        self.nested.append(0.)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = time.time() - start
+            inner = self.nested.pop()
+            self.totals[stage] = self.totals.get(stage, 0.) + elapsed - inner
+            self.calls[stage] = self.calls.get(stage, 0) + 1
+            if self.nested:
+                self.nested[-1] += elapsed
+
+    def restore(self):
+        for owner, name, function in reversed(self.patched):
+            setattr(owner, name, function)
+        self.patched = []
+
+
+# -----< benchmark run >-------------------------------------------------------------------#
+
+def run_benchmark(structure='pbc', grain_amount=None, increments=5, runtime=1., jitter=0.2, slots=6, cpus=1,
+                  backend='fake', selected_steps=(1,), preselection=True, directory=None, seed=0, keep=False):
+    """ runs 'increments' increments of the driver on a synthetic structure in a scratch
+    directory (a new temporary one unless 'directory' is given) and returns the report,
+    see report. 'runtime' and 'jitter' model the solve time of a candidate in seconds """
+    laminate_variants = [1, 2, 3, 4, 5, 6]
+    work_directory = directory if directory is not None else tempfile.mkdtemp(prefix='benchmark_')
+    if not os.path.isdir(work_directory):
+        os.makedirs(work_directory)
+    cwd = os.getcwd()
+    timer = StageTimer()
+    increment_driver = None
+    try:
+        # the driver works in and removes files from the working directory
+        os.chdir(work_directory)
+        if not os.path.isdir('structure'):
+            os.mkdir('structure')
+        if structure == 'pbc':
+            grain_of_cell, spacing = pbc_cell()
+        elif structure == 'random':
+            grain_of_cell, spacing = random_rve(grain_amount or PBC_GRAIN_AMOUNT, seed=seed)
+        else:
+            raise ValueError('unknown structure ' + repr(structure))
+        start = time.time()
+        grain_nrs, volumes, orientations = write_geometry('structure/geometry.inp', grain_of_cell, spacing, seed)
+        write_material_jobdata('structure/material_jobdata.inp', laminate_variants)
+        structure_time = time.time() - start
+        #
+        os.environ[RUNTIME_VARIABLE] = str(runtime)
+        os.environ[JITTER_VARIABLE] = str(jitter)
+        increment_driver = driver.IncrementDriver(True, 'structure/geometry.inp', 'structure/material_jobdata.inp',
+                                                  laminate_variants, preselection, selected_steps,
+                                                  calibrate_concurrency=False, total_grain_amount=len(grain_nrs),
+                                                  grain_volume=PBC_GRAIN_VOLUME, max_session_jobs=sys.maxint,
+                                                  backend=backend)
+        # the grains of the structure replace the equal octahedra of the regular tesselation
+        increment_driver.grains = grains.GrainRegistry(grain_nrs, volumes, orientations)
+        increment_driver.total_grain_amount = len(grain_nrs)
+        increment_driver.split = (slots, cpus)
+        for stage, owner, name in STAGES:
+            timer.wrap(owner, name, stage)
+        start = time.time()
+        increment_driver.run(increments)
+        elapsed = time.time() - start
+    finally:
+        timer.restore()
+        if increment_driver is not None and increment_driver.includes is not None:
+            increment_driver.includes.remove()
+        os.chdir(cwd)
+        if not keep and directory is None:
+            shutil.rmtree(work_directory, ignore_errors=True)
+    done = increment_driver.martensite_amount - 1
+    return report(timer, done, elapsed, len(grain_nrs), structure_time)
+
+
+def report(timer, increments, elapsed, grain_amount, structure_time=0.):
+    """ prints and returns the increments per hour and the time of every stage """
+    result = {'grains': grain_amount, 'increments': increments, 'elapsed': elapsed,
+              'increments_per_hour': increments * 3600. / elapsed if elapsed > 0 else 0.,
+              'structure_time': structure_time, 'stages': dict(timer.totals), 'calls': dict(timer.calls)}
+    print('grains: ' + str(grain_amount) + '   increments: ' + str(increments) + '   ' +
+          '{0:.1f}'.format(elapsed) + ' s   ' + '{0:.2f}'.format(result['increments_per_hour']) +
+          ' increments per hour   (structure written in ' + '{0:.2f}'.format(structure_time) + ' s)')
+    print('stage\t\t\ttotal [s]\tper increment [s]\tshare\tcalls')
+    stages = []
+    for stage, owner, name in STAGES:
+        if stage not in stages:
+            stages.append(stage)
+    for stage in stages:
+        total = timer.totals.get(stage, 0.)
+        print(stage.ljust(16) + '\t' + '{0:.3f}'.format(total) + '\t\t' +
+              '{0:.3f}'.format(total / max(increments, 1)) + '\t\t\t' +
+              '{0:.1%}'.format(total / elapsed if elapsed > 0 else 0.) + '\t' + str(timer.calls.get(stage, 0)))
+    return result
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'solve':
+        arguments = dict(argument.split('=', 1) for argument in sys.argv[2:] if '=' in argument)
+        solve(arguments['job'], arguments['input'])
+    else:
+        arguments = dict(argument.split('=', 1) for argument in sys.argv[1:] if '=' in argument)
+        run_benchmark(structure=arguments.get('structure', 'pbc'),
+                      grain_amount=int(arguments['grains']) if 'grains' in arguments else None,
+                      increments=int(arguments.get('increments', 5)),
+                      runtime=float(arguments.get('runtime', 1.)), jitter=float(arguments.get('jitter', 0.2)),
+                      slots=int(arguments.get('slots', 6)), cpus=int(arguments.get('cpus', 1)),
+                      backend=arguments.get('backend', 'fake'), directory=arguments.get('directory'),
+                      seed=int(arguments.get('seed', 0)), keep=arguments.get('keep') == 'true')
@@ -0,0 +1,72 @@
+""" This module holds the candidate space of an increment: every not transformed grain
+times every laminate variant, with a boolean mask of the candidates which are calculated.
+The input file creation, the job submission and the evaluation iterate over the same
+space, so they always agree on the candidates of an increment. """
+
+import numpy as np
+
+
+class CandidateSpace(object):
+    """ the candidates (grain, laminate) of an increment. 'austenite_grains' are the
+    records [grainNr, grainvolume, grainmaterial] of the not transformed grains. Membership
+    is a lookup in the mask, iteration follows the order of the grains and laminates """
+
+    def __init__(self, austenite_grains, laminate_variants):
+        self.grains = [list(austenite_grain) for austenite_grain in austenite_grains]
+        self.laminates = list(laminate_variants)
+        self.grain_index = dict((grain[0], i) for i, grain in enumerate(self.grains))
+        self.laminate_index = dict((laminate, j) for j, laminate in enumerate(self.laminates))
+        self.mask = np.ones((len(self.grains), len(self.laminates)), dtype=bool)
+
+    def index(self, candidate):
+        """ (row, column) of a candidate [grainNr, laminate], None if it is not in the space """
+        i = self.grain_index.get(candidate[0])
+        j = self.laminate_index.get(candidate[1])
+        if i is None or j is None:
+            return None
+        return i, j
+
+    def __contains__(self, candidate):
+        index = self.index(candidate)
+        return index is not None and bool(self.mask[index])
+
+    def __len__(self):
+        return int(self.mask.sum())
+
+    def __iter__(self):
+        """ yields (austenite grain record, laminate) of the selected candidates """
+        for i, j in zip(*np.nonzero(self.mask)):
+            yield self.grains[i], self.laminates[j]
+
+    def pairs(self):
+        """ the selected candidates as [grainNr, laminate] pairs """
+        return [[grain[0], laminate] for grain, laminate in self]
+
+    def select(self, candidates):
+        """ keeps only the given candidates ([grainNr, laminate] pairs, e.g. from the
+        preselection), returns the space """
+        selected = np.zeros(self.mask.shape, dtype=bool)
+        for candidate in candidates:
+            index = self.index(candidate)
+            if index is not None:
+                selected[index] = True
+        self.mask &= selected
+        return self
+
+    def remove_grain(self, grain_nr):
+        """ removes a transformed grain with all of its candidates """
+        i = self.grain_index.get(grain_nr)
+        if i is None:
+            return
+        del self.grains[i]
+        self.mask = np.delete(self.mask, i, axis=0)
+        self.grain_index = dict((grain[0], k) for k, grain in enumerate(self.grains))
+
+
+def candidate_space(austenite_grains, laminate_variants, preselection, selected_variants):
+    """ the space of an increment: all candidates, or only the 'selected_variants' if
+    the preselection is used """
+    space = CandidateSpace(austenite_grains, laminate_variants)
+    if preselection:
+        space.select(selected_variants)
+    return space
@@ -0,0 +1,92 @@
+""" This module reads the total strain energy (ALLIE) and the completion status of a job
+from the solver's text outputs (.dat and .sta) without opening the output database. It only
+uses the standard library, so it runs in a plain CPython process pool as well as in the
+Abaqus Python environment. The energies are printed to the .dat file if the step of the
+material and job data file requests them with *ENERGY PRINT. """
+
+import multiprocessing
+import os
+import re
+
+# bytes read from the end of the .dat file before the whole file is scanned
+TAIL_SIZE = 1 << 16
+
+NUMBER = r'([-+]?(?:\d+\.?\d*|\.\d+)(?:[EeDd][-+]?\d+)?)'
+# the whole model internal energy, either labelled with its history output name or
+# with the description of the energy print. The value is taken from the label's own line
+# only, a table header or the step number of a later line must not be read as the energy
+ALLIE_PATTERN = re.compile(r'\b(?:ALLIE|INTERNAL ENERGY)\b[^\d\n]*?(?<![\w.])' + NUMBER)
+
+
+def read_status(jobname):
+    """ returns 'completed', 'failed', 'running' or 'missing' from the .sta file """
+    staname = jobname + '.sta'
+    if not os.path.isfile(staname):
+        return 'missing'
+    with open(staname, 'r') as sta:
+        text = sta.read()
+    if 'COMPLETED SUCCESSFULLY' in text:
+        return 'completed'
+    if 'NOT BEEN COMPLETED' in text:
+        return 'failed'
+    return 'running'
+
+
+def last_allie(text):
+    """ the last ALLIE value in the text, None if there is none """
+    matches = ALLIE_PATTERN.findall(text)
+    if not matches:
+        return None
+    return float(matches[-1].replace('D', 'E').replace('d', 'e'))
+
+
+def read_allie(jobname):
+    """ returns the last printed ALLIE of the .dat file, None if it is not found. The end
+    of the file is read first since the energies of the last increment are printed there """
+    datname = jobname + '.dat'
+    if not os.path.isfile(datname):
+        return None
+    with open(datname, 'r') as dat:
+        dat.seek(0, os.SEEK_END)
+        size = dat.tell()
+        dat.seek(max(0, size - TAIL_SIZE))
+        allie = last_allie(dat.read())
+        if allie is None and size > TAIL_SIZE:
+            dat.seek(0)
+            allie = last_allie(dat.read())
+    return allie
+
+
+def read_model_data(jobname):
+    """ returns the model data printed by the native solver to the .dat file (see
+    odbreader.OdbSummary.model_data), None if the file does not hold them """
+    datname = jobname + '.dat'
+    if not os.path.isfile(datname):
+        return None
+    with open(datname, 'r') as dat:
+        for line in dat:
+            if line.strip().startswith('MODEL DATA'):
+                return tuple(float(value) for value in line.split()[2:])
+    return None
+
+
+def read_energy(jobname):
+    """ returns (status, ALLIE) of a job, ALLIE is None if the text outputs do not hold it
+    or the job did not complete. A job that timed out or is still writing leaves the
+    ALLIE of an intermediate increment in its .dat file """
+    status = read_status(jobname)
+    if status != 'completed':
+        return status, None
+    return status, read_allie(jobname)
+
+
+def read_energies(jobnames, processes=None):
+    """ reads (status, ALLIE) of many jobs in a process pool """
+    if processes == 1 or len(jobnames) < 2:
+        return [read_energy(jobname) for jobname in jobnames]
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(read_energy, jobnames)
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,484 @@
+""" This module parses the abaqus input decks of the simulation: nodes, elements, element
+and node sets, orientations, section assignments, elastic material data, equations and
+boundary conditions. *INCLUDE files are followed, so the candidate decks which only hold
+the section assignments are read together with the shared mesh and material files.
+Parts and instances are not resolved, labels are expected to be unique in the deck.
+
+The data lines are converted by NumPy in one call per keyword block. A large included file
+(the mesh) is parsed once and kept in the deck cache as an uncompressed .npz named after
+the md5 of the file, whose arrays are memory mapped when it is read again, see
+cached_parse. The grain volumes follow from the element volumes, see grain_volumes. """
+
+import hashlib
+import json
+import os
+import re
+import struct
+import zipfile
+
+import numpy as np
+
+SPLIT = re.compile(r'[,\s]+')
+LETTERS = re.compile(r'[A-Za-z_]')
+# the parsed included files larger than CACHE_MIN_BYTES are kept here
+DECK_CACHE_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'transEnergymin', 'decks')
+CACHE_MIN_BYTES = 1 << 20
+CACHE_VERSION = 1
+
+
+def keyword_parameters(line):
+    """ returns the keyword and a dict of its parameters of a keyword line like
+    '*Element, type=C3D4, elset=transig_1'. Names are converted to upper case """
+    entries = [entry.strip() for entry in line[1:].split(',')]
+    keyword = entries[0].upper()
+    parameters = {}
+    for entry in entries[1:]:
+        if not entry:
+            continue
+        if '=' in entry:
+            name, value = entry.split('=', 1)
+            parameters[name.strip().upper()] = value.strip()
+        else:
+            parameters[entry.upper()] = True
+    return keyword, parameters
+
+
+def tokens(lines):
+    """ all comma or blank separated entries of the data lines """
+    return [token for token in SPLIT.split(' '.join(lines)) if token]
+
+
+def numbers(lines):
+    """ all entries of the data lines as floats, converted in one call """
+    return np.fromstring(' '.join(lines).replace(',', ' '), sep=' ')
+
+
+def strip_instance(name):
+    """ 'PART-1-1.5' -> '5', labels and set names may be given with the instance name """
+    return name.rsplit('.', 1)[-1] if '.' in name else name
+
+
+def keyword_blocks(filename, cache=False, included=None):
+    """ yields (keyword, parameters, data lines) of a deck and all included files. With
+    'cache' an included file of at least CACHE_MIN_BYTES is not read but yielded as
+    ('INCLUDE', {'INPUT': filename}, []) to be taken from the deck cache. The names of the
+    files read are appended to 'included' """
+    keyword = None
+    parameters = {}
+    data = []
+    with open(filename, 'r') as deck:
+        for line in deck:
+            line = line.strip()
+            if not line or line.startswith('**'):
+                continue
+            if line.startswith('*'):
+                if keyword is not None:
+                    yield keyword, parameters, data
+                keyword, parameters = keyword_parameters(line)
+                data = []
+                if keyword == 'INCLUDE':
+                    include = parameters['INPUT']
+                    if not os.path.isabs(include):
+                        include = os.path.join(os.path.dirname(filename), include)
+                    if cache and os.path.getsize(include) >= CACHE_MIN_BYTES:
+                        yield keyword, {'INPUT': include}, []
+                    else:
+                        if included is not None:
+                            included.append(os.path.abspath(include))
+                        for block in keyword_blocks(include, cache, included):
+                            yield block
+                    keyword = None
+            elif keyword is not None:
+                data.append(line)
+    if keyword is not None:
+        yield keyword, parameters, data
+
+
+class Deck(object):
+    """ the model data of an input deck. Nodes are held as label and coordinate arrays,
+    elements as one (labels, connectivity) pair per element type. Set, orientation and
+    material names are upper case like in the output database. """
+
+    def __init__(self):
+        self.node_labels = []
+        self.coordinates = []
+        self.elements = {}  # type -> [labels, connectivity]
+        self.elsets = {}  # name -> element labels
+        self.nsets = {}  # name -> node labels
+        self.orientations = {}  # name -> (a, b, additional rotation axis, angle in degrees)
+        self.sections = []  # (elset, orientation, material)
+        self.materials = {}  # name -> (elastic type, values)
+        self.equations = []  # [(node or nset, dof, coefficient), ...]
+        self.boundaries = []  # (node or nset, first dof, last dof, value)
+
+    def set_labels(self, name, sets):
+        name = strip_instance(name).upper()
+        return sets[name] if name in sets else np.array([int(name)])
+
+    def element_labels(self, name):
+        return self.set_labels(name, self.elsets)
+
+    def node_labels_of(self, name):
+        return self.set_labels(name, self.nsets)
+
+    def merge(self, deck):
+        """ adds the data of a complete deck, e.g. of an included file from the cache, to
+        this deck while it is read """
+        self.node_labels.append(deck.node_labels)
+        self.coordinates.append(deck.coordinates)
+        for element_type, (labels, connectivity) in deck.elements.items():
+            block = self.elements.setdefault(element_type, [[], []])
+            block[0].append(labels)
+            block[1].append(connectivity)
+        for sets, merged_sets in [(self.elsets, deck.elsets), (self.nsets, deck.nsets)]:
+            for name, labels in merged_sets.items():
+                if name in sets:
+                    add_set(sets, name, labels)
+                else:
+                    sets[name] = labels  # already unique
+        self.orientations.update(deck.orientations)
+        self.sections.extend(deck.sections)
+        self.materials.update(deck.materials)
+        self.equations.extend(deck.equations)
+        self.boundaries.extend(deck.boundaries)
+
+    def finish(self):
+        """ joins the arrays of the blocks once the deck is read """
+        self.node_labels = np.concatenate(self.node_labels) if self.node_labels else np.array([], dtype=int)
+        self.coordinates = np.concatenate(self.coordinates) if self.coordinates else np.zeros((0, 3))
+        for element_type, (labels, connectivity) in self.elements.items():
+            self.elements[element_type] = [np.concatenate(labels), np.concatenate(connectivity)]
+        return self
+
+
+def set_data(parameters, data, sets):
+    """ the labels of an *Elset or *Nset block """
+    if 'GENERATE' in parameters:
+        labels = []
+        values = numbers(data).astype(int).reshape(-1, 3)
+        for start, end, step in values:
+            labels.append(np.arange(start, end + 1, step))
+        return np.concatenate(labels)
+    if not LETTERS.search(' '.join(data)):
+        return numbers(data).astype(int)  # only labels
+    labels = []
+    for token in tokens(data):
+        token = strip_instance(token)
+        if token.upper() in sets:
+            labels.append(sets[token.upper()])
+        else:
+            labels.append(np.array([int(token)]))
+    return np.concatenate(labels) if labels else np.array([], dtype=int)
+
+
+def add_set(sets, name, labels):
+    name = strip_instance(name).upper()
+    if name in sets:
+        labels = np.concatenate([sets[name], labels])
+    sets[name] = np.unique(labels)
+
+
+# number of nodes of the supported element types
+ELEMENT_NODES = {'C3D4': 4, 'C3D10': 10, 'C3D8': 8, 'C3D8R': 8}
+
+
+def parse(filename, cache=True):
+    """ parses an input deck and returns its Deck. With 'cache' large included files are
+    taken from the deck cache """
+    deck = Deck()
+    read_blocks(deck, keyword_blocks(filename, cache))
+    return deck.finish()
+
+
+def read_blocks(deck, blocks):
+    """ adds the keyword blocks to the deck """
+    material = None
+    for keyword, parameters, data in blocks:
+        if keyword == 'INCLUDE':
+            deck.merge(cached_parse(parameters['INPUT']))
+            material = None
+        elif keyword == 'NODE':
+            values = numbers(data).reshape(-1, 4)
+            deck.node_labels.append(values[:, 0].astype(int))
+            deck.coordinates.append(values[:, 1:])
+            if 'NSET' in parameters:
+                add_set(deck.nsets, parameters['NSET'], values[:, 0].astype(int))
+        elif keyword == 'ELEMENT':
+            element_type = parameters['TYPE'].upper()
+            if element_type not in ELEMENT_NODES:
+                raise ValueError('element type ' + element_type + ' is not supported')
+            values = numbers(data).astype(int).reshape(-1, ELEMENT_NODES[element_type] + 1)
+            block = deck.elements.setdefault(element_type, [[], []])
+            block[0].append(values[:, 0])
+            block[1].append(values[:, 1:])
+            if 'ELSET' in parameters:
+                add_set(deck.elsets, parameters['ELSET'], values[:, 0])
+        elif keyword == 'ELSET':
+            add_set(deck.elsets, parameters['ELSET'], set_data(parameters, data, deck.elsets))
+        elif keyword == 'NSET':
+            add_set(deck.nsets, parameters['NSET'], set_data(parameters, data, deck.nsets))
+        elif keyword == 'ORIENTATION':
+            values = numbers(data[0:1])
+            axis, angle = 3, 0.
+            if len(data) > 1:
+                rotation = numbers(data[1:2])
+                axis = int(rotation[0])
+                angle = rotation[1] if len(rotation) > 1 else 0.
+            deck.orientations[parameters['NAME'].upper()] = (values[0:3], values[3:6], axis, angle)
+        elif keyword == 'SOLID SECTION':
+            orientation = parameters.get('ORIENTATION')
+            deck.sections.append((strip_instance(parameters['ELSET']).upper(),
+                                  orientation.upper() if orientation else None, parameters['MATERIAL'].upper()))
+        elif keyword == 'MATERIAL':
+            material = parameters['NAME'].upper()
+        elif keyword == 'ELASTIC' and material is not None:
+            deck.materials[material] = (parameters.get('TYPE', 'ISOTROPIC').upper(), numbers(data))
+        elif keyword == 'EQUATION':
+            entries = tokens(data)
+            position = 0
+            while position < len(entries):
+                n_terms = int(entries[position])
+                terms = entries[position + 1: position + 1 + 3 * n_terms]
+                deck.equations.append([(strip_instance(terms[3 * i]), int(terms[3 * i + 1]),
+                                        float(terms[3 * i + 2])) for i in range(n_terms)])
+                position += 1 + 3 * n_terms
+        elif keyword == 'BOUNDARY':
+            for line in data:
+                entries = [entry.strip() for entry in line.split(',') if entry.strip()]
+                if entries[1].upper() == 'ENCASTRE':
+                    first, last, value = 1, 3, 0.
+                elif entries[1].upper() == 'PINNED':
+                    first, last, value = 1, 3, 0.
+                elif entries[1].upper().endswith('SYMM'):
+                    raise ValueError('symmetry boundary conditions are not supported')
+                else:
+                    first = int(entries[1])
+                    last = int(entries[2]) if len(entries) > 2 else first
+                    value = float(entries[3]) if len(entries) > 3 else 0.
+                deck.boundaries.append((strip_instance(entries[0]), first, min(last, 3), value))
+
+
+# -----< deck cache >----------------------------------------------------------------------#
+
+def file_md5(filename):
+    """ md5 hexdigest of a file, read in chunks """
+    md5 = hashlib.md5()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def cached_parse(filename, directory=DECK_CACHE_DIRECTORY):
+    """ the Deck of a file from the deck cache. The cache entry is named after the md5 of
+    the file, so every copy of a mesh shares it, and it is parsed again if a file it
+    includes has changed """
+    md5 = file_md5(filename)
+    cachename = os.path.join(directory, md5 + '.npz')
+    if os.path.isfile(cachename):
+        try:
+            deck, includes = load_deck(cachename)
+            if all([os.path.isfile(include) and file_md5(include) == include_md5
+                    for include, include_md5 in includes]):
+                return deck
+        except (IOError, ValueError, KeyError, zipfile.BadZipfile) as error:
+            print('deck cache ' + cachename + ' can not be read: ' + str(error))
+    included = []
+    deck = Deck()
+    read_blocks(deck, keyword_blocks(filename, included=included))
+    deck.finish()
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    tmpname = cachename + '.' + str(os.getpid()) + '.tmp.npz'
+    save_deck(deck, tmpname, [(include, file_md5(include)) for include in included])
+    os.rename(tmpname, cachename)
+    return deck
+
+
+def save_deck(deck, filename, includes=()):
+    """ writes the arrays of a deck to an uncompressed .npz, the remaining data as JSON """
+    arrays = {'node_labels': deck.node_labels, 'coordinates': deck.coordinates}
+    element_types = sorted(deck.elements)
+    for i, element_type in enumerate(element_types):
+        arrays['element_labels_' + str(i)], arrays['connectivity_' + str(i)] = deck.elements[element_type]
+    elsets = sorted(deck.elsets)
+    for i, name in enumerate(elsets):
+        arrays['elset_' + str(i)] = deck.elsets[name]
+    nsets = sorted(deck.nsets)
+    for i, name in enumerate(nsets):
+        arrays['nset_' + str(i)] = deck.nsets[name]
+    meta = {'version': CACHE_VERSION, 'element_types': element_types, 'elsets': elsets, 'nsets': nsets,
+            'orientations': dict((name, [list(a), list(b), axis, angle])
+                                 for name, (a, b, axis, angle) in deck.orientations.items()),
+            'sections': deck.sections,
+            'materials': dict((name, [elastic_type, list(values)])
+                              for name, (elastic_type, values) in deck.materials.items()),
+            'equations': deck.equations, 'boundaries': deck.boundaries, 'includes': list(includes)}
+    arrays['meta'] = np.array(json.dumps(meta))
+    np.savez(filename, **arrays)
+
+
+def npz_arrays(filename):
+    """ the arrays of an uncompressed .npz, each memory mapped from its position in the
+    archive """
+    with open(filename, 'rb') as npz:
+        infos = zipfile.ZipFile(npz).infolist()
+        arrays = {}
+        for info in infos:
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(info.filename + ' is compressed')
+            # the data follows the local file header of the member
+            npz.seek(info.header_offset)
+            header = npz.read(30)
+            name_length, extra_length = struct.unpack('<HH', header[26:30])
+            npz.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(npz)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(npz)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(npz)
+            name = info.filename[:-len('.npy')]
+            if dtype.hasobject:
+                raise ValueError(info.filename + ' holds python objects')
+            if not shape:
+                arrays[name] = np.fromfile(npz, dtype=dtype, count=1).reshape(())
+            elif not np.prod(shape):
+                arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(filename, dtype=dtype, mode='r', offset=npz.tell(), shape=shape,
+                                         order='F' if fortran_order else 'C')
+    return arrays
+
+
+def load_deck(filename):
+    """ the Deck of a cache entry and the (filename, md5) of the files it includes """
+    arrays = npz_arrays(filename)
+    meta = json.loads(str(arrays['meta']))
+    if meta['version'] != CACHE_VERSION:
+        raise ValueError('deck cache version ' + str(meta['version']))
+    deck = Deck()
+    deck.node_labels = arrays['node_labels']
+    deck.coordinates = arrays['coordinates']
+    for i, element_type in enumerate(meta['element_types']):
+        deck.elements[str(element_type)] = [arrays['element_labels_' + str(i)], arrays['connectivity_' + str(i)]]
+    for i, name in enumerate(meta['elsets']):
+        deck.elsets[str(name)] = arrays['elset_' + str(i)]
+    for i, name in enumerate(meta['nsets']):
+        deck.nsets[str(name)] = arrays['nset_' + str(i)]
+    for name, (a, b, axis, angle) in meta['orientations'].items():
+        deck.orientations[str(name)] = (np.array(a), np.array(b), axis, angle)
+    deck.sections = [tuple([str(entry) if entry is not None else None for entry in section])
+                     for section in meta['sections']]
+    for name, (elastic_type, values) in meta['materials'].items():
+        deck.materials[str(name)] = (str(elastic_type), np.array(values))
+    deck.equations = [[(str(node), dof, coefficient) for node, dof, coefficient in equation]
+                      for equation in meta['equations']]
+    deck.boundaries = [(str(node), first, last, value) for node, first, last, value in meta['boundaries']]
+    return deck, [(str(include), str(md5)) for include, md5 in meta['includes']]
+
+
+# -----< volumes >-------------------------------------------------------------------------#
+
+# natural coordinates of the corner nodes of a hexahedron
+HEX_CORNERS = np.array([[-1, -1, -1], [1, -1, -1], [1, 1, -1], [-1, 1, -1],
+                        [-1, -1, 1], [1, -1, 1], [1, 1, 1], [-1, 1, 1]], dtype=float)
+VOLUME_CHUNK = 100000
+
+
+def node_indices(deck, labels):
+    """ positions of node labels in the coordinate array """
+    order = np.argsort(deck.node_labels, kind='mergesort')
+    return order[np.searchsorted(deck.node_labels[order], labels)]
+
+
+def element_volumes(deck):
+    """ labels and volumes of all elements. Tetrahedra are measured by their corner nodes,
+    which is exact for straight edges, hexahedra by a 2x2x2 Gauss integration of the
+    Jacobian, which is exact for trilinear elements """
+    all_labels, all_volumes = [], []
+    for element_type, (labels, connectivity) in deck.elements.items():
+        volumes = np.empty(len(labels))
+        for start in range(0, len(labels), VOLUME_CHUNK):
+            X = deck.coordinates[node_indices(deck, connectivity[start: start + VOLUME_CHUNK])]
+            if element_type in ('C3D4', 'C3D10'):
+                a, b, c = X[:, 1] - X[:, 0], X[:, 2] - X[:, 0], X[:, 3] - X[:, 0]
+                chunk = np.abs(np.einsum('ei,ei->e', np.cross(a, b), c)) / 6.
+            else:
+                chunk = np.zeros(len(X))
+                g = 1. / np.sqrt(3.)
+                for point in g * HEX_CORNERS:
+                    # derivatives of the trilinear shape functions at the Gauss point
+                    factors = 1. + HEX_CORNERS * point
+                    dN = np.empty((8, 3))
+                    dN[:, 0] = HEX_CORNERS[:, 0] * factors[:, 1] * factors[:, 2] / 8.
+                    dN[:, 1] = HEX_CORNERS[:, 1] * factors[:, 0] * factors[:, 2] / 8.
+                    dN[:, 2] = HEX_CORNERS[:, 2] * factors[:, 0] * factors[:, 1] / 8.
+                    chunk += np.abs(np.linalg.det(np.einsum('eni,nj->eij', X[:, 0:8], dN)))
+            volumes[start: start + VOLUME_CHUNK] = chunk
+        all_labels.append(labels)
+        all_volumes.append(volumes)
+    if not all_labels:
+        return np.array([], dtype=int), np.zeros(0)
+    return np.concatenate(all_labels), np.concatenate(all_volumes)
+
+
+def grain_volumes(deck, prefix='TRANSIG_'):
+    """ grain numbers and volumes of the element sets '<prefix><grainNr>' """
+    names = [name for name in deck.elsets if name.startswith(prefix) and name[len(prefix):].isdigit()]
+    grain_nrs = np.array(sorted([int(name[len(prefix):]) for name in names]), dtype=int)
+    if not len(grain_nrs):
+        return grain_nrs, np.zeros(0)
+    labels, volumes = element_volumes(deck)
+    order = np.argsort(labels, kind='mergesort')
+    labels, volumes = labels[order], volumes[order]
+    sets = [deck.elsets[prefix + str(nr)] for nr in grain_nrs]
+    members = np.concatenate(sets)
+    grain_of_member = np.repeat(np.arange(len(grain_nrs)), [len(labels_of_set) for labels_of_set in sets])
+    return grain_nrs, np.bincount(grain_of_member, weights=volumes[np.searchsorted(labels, members)],
+                                  minlength=len(grain_nrs))
+
+
+def element_centroids(deck):
+    """ labels and centroids of all elements, the mean of their corner nodes """
+    all_labels, all_centroids = [], []
+    for element_type, (labels, connectivity) in deck.elements.items():
+        corners = 4 if element_type in ('C3D4', 'C3D10') else 8
+        centroids = np.empty((len(labels), 3))
+        for start in range(0, len(labels), VOLUME_CHUNK):
+            X = deck.coordinates[node_indices(deck, connectivity[start: start + VOLUME_CHUNK, 0:corners])]
+            centroids[start: start + VOLUME_CHUNK] = X.mean(axis=1)
+        all_labels.append(labels)
+        all_centroids.append(centroids)
+    if not all_labels:
+        return np.array([], dtype=int), np.zeros((0, 3))
+    return np.concatenate(all_labels), np.concatenate(all_centroids)
+
+
+def grain_centroids(deck, prefix='TRANSIG_'):
+    """ grain numbers, volume weighted centroids and volumes of the element sets
+    '<prefix><grainNr>' """
+    grain_nrs, volumes = grain_volumes(deck, prefix)
+    centroids = np.zeros((len(grain_nrs), 3))
+    if not len(grain_nrs):
+        return grain_nrs, centroids, volumes
+    # both functions return the elements in the same order
+    labels, element_volume = element_volumes(deck)
+    element_centroid = element_centroids(deck)[1]
+    order = np.argsort(labels, kind='mergesort')
+    labels, element_volume, element_centroid = labels[order], element_volume[order], element_centroid[order]
+    for i, nr in enumerate(grain_nrs):
+        rows = np.searchsorted(labels, deck.elsets[prefix + str(nr)])
+        centroids[i] = np.dot(element_volume[rows], element_centroid[rows]) / volumes[i]
+    return grain_nrs, centroids, volumes
+
+
+def grain_orientations(deck, grain_nrs, prefix='ORI_'):
+    """ the orientation vectors (grains, 2, 3) of the orientations '<prefix><grainNr>',
+    None if one is missing """
+    orientations = []
+    for nr in grain_nrs:
+        orientation = deck.orientations.get(prefix + str(nr))
+        if orientation is None:
+            return None
+        orientations.append([orientation[0], orientation[1]])
+    return np.array(orientations, dtype=float)
@@ -0,0 +1,498 @@
+""" This module runs the candidate jobs of an increment on several hosts. The driver's
+process is the coordinator: it listens on a TCP port and hands the candidate decks to the
+workers that connected to it. A worker runs on every compute node, advertises its number
+of slots, solves the decks with its local solver (see jobpool) and returns only the
+extracted values, the completion status, ALLIE and the model data, instead of the output
+database. The coordinator writes them as .dat and .sta files, so the evaluation of the
+increment reads them like the outputs of a local job.
+
+The messages are JSON objects, one per line. The shared include files of the decks (mesh,
+material and job data, matrix) are sent once per worker connection and are cached by the
+worker under their md5. Include files nested in other include files are sent as well, their
+*INCLUDE lines are rewritten to the worker's names. Jobs of a worker whose connection is
+lost or which stops sending heartbeats are queued again; a worker that lost its connection
+kills its jobs and reconnects.
+
+The coordinator listens on COORDINATOR_HOST only and accepts a worker only if its hello
+holds the shared token, taken from the environment variable TRANSENERGYMIN_TOKEN or the
+file TOKEN_FILENAME (e.g. in the home directory shared by the nodes). A worker only writes
+files of plain names into its directory.
+
+Start a worker on every node (several workers on localhost for a test):
+    python distributed.py worker host=<coordinator host> port=5710 slots=4 cpus=2 backend=abaqus directory=worker1
+and use the backend 'distributed' in transEnergymin.py. """
+
+import Queue
+import hashlib
+import hmac
+import json
+import os
+import select
+import socket
+import sys
+import threading
+import time
+# my modules
+import automate
+import datreader
+import jobpool
+import resultcache
+
+# the interface the coordinator listens on, e.g. the host name of the driver's node in the
+# cluster network. The default only accepts workers on the same host
+COORDINATOR_HOST = 'localhost'
+COORDINATOR_PORT = 5710
+TOKEN_VARIABLE = 'TRANSENERGYMIN_TOKEN'
+TOKEN_FILENAME = os.path.join(os.path.expanduser('~'), '.config', 'transEnergymin', 'token')
+POLL_INTERVAL = 1.
+HEARTBEAT_INTERVAL = 10.
+# a worker is considered lost if nothing was received from it for this many seconds
+HEARTBEAT_TIMEOUT = 60.
+RECONNECT_INTERVAL = 5.
+
+
+def send_message(connection, message, lock=None):
+    data = json.dumps(message) + '\n'
+    if lock is None:
+        connection.sendall(data)
+    else:
+        with lock:
+            connection.sendall(data)
+
+
+def shared_token():
+    """ the token a worker has to present to the coordinator """
+    token = os.environ.get(TOKEN_VARIABLE)
+    if not token and os.path.isfile(TOKEN_FILENAME):
+        with open(TOKEN_FILENAME, 'r') as token_file:
+            token = token_file.read().strip()
+    if not token:
+        raise ValueError('no shared token of the distributed backend: set ' + TOKEN_VARIABLE + ' or write ' +
+                         TOKEN_FILENAME)
+    return token
+
+
+def plain_name(name):
+    """ a file name sent by the coordinator, which must not leave the worker's directory """
+    if not name or name in ('.', '..') or '/' in name or os.sep in name or '\0' in name or \
+            (os.altsep is not None and os.altsep in name):
+        raise ValueError('the coordinator sent the file name ' + repr(name))
+    return name
+
+
+def split_messages(buffer):
+    """ the complete messages of the received data and the rest of it """
+    lines = buffer.split('\n')
+    return [json.loads(line) for line in lines[:-1] if line.strip()], lines[-1]
+
+
+def write_outputs(outputname, status, allie, model_data):
+    """ the .dat and .sta files of a job solved by a worker, in the form read by datreader """
+    with open(outputname + '.dat', 'w') as dat:
+        dat.write('\n                              D I S T R I B U T E D   J O B\n\n')
+        if model_data is not None:
+            dat.write(' MODEL DATA\t' + '\t'.join(['{0:.6e}'.format(value) for value in model_data]) + '\n')
+        if allie is not None:
+            dat.write(' INTERNAL ENERGY (ALLIE)\t' + '{0:.9e}'.format(allie) + '\n')
+    with open(outputname + '.sta', 'w') as sta:
+        if status == 'completed':
+            sta.write(' THE ANALYSIS HAS COMPLETED SUCCESSFULLY\n')
+        else:
+            sta.write(' THE ANALYSIS HAS NOT BEEN COMPLETED\n')
+
+
+# -----< coordinator >---------------------------------------------------------------------#
+
+class WorkerConnection(object):
+    """ a connected worker as seen by the coordinator """
+
+    def __init__(self, connection, address):
+        self.connection = connection
+        self.address = address
+        self.name = address[0] + ':' + str(address[1])
+        self.slots = 0  # known after the worker's hello
+        self.backend = None  # the worker's local solver, known after the hello
+        self.running = {}  # outputname -> job
+        self.includes = set()  # md5 of the include files the worker has
+        self.last_seen = time.time()
+        self.lock = threading.Lock()
+        self.alive = True
+
+    def send(self, message):
+        send_message(self.connection, message, self.lock)
+
+    def close(self):
+        self.alive = False
+        try:
+            self.connection.close()
+        except socket.error:
+            pass
+
+
+class Coordinator(object):
+    """ runs jobs on the connected workers like jobpool.JobPool.run runs them on this
+    host. Workers may connect and leave at any time, also between increments """
+
+    def __init__(self, host=COORDINATOR_HOST, port=COORDINATOR_PORT, timeout=1200,
+                 heartbeat_timeout=HEARTBEAT_TIMEOUT, token=None):
+        self.token = token if token is not None else shared_token()
+        self.timeout = timeout
+        self.heartbeat_timeout = heartbeat_timeout
+        self.workers = []
+        self.events = Queue.Queue()  # (worker, message), message None if the connection is lost
+        # filename -> (mtime, size, [(included filename, md5)], md5, content, nested include files)
+        self.include_cache = {}
+        self.skipped = []
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen(16)
+        self.closed = False
+        thread = threading.Thread(target=self.accept)
+        thread.daemon = True
+        thread.start()
+
+    def accept(self):
+        """ starts a receiving thread for every new connection. A failing accept, e.g. a
+        connection reset before it was accepted or too many open files, is reported and
+        the coordinator keeps accepting """
+        while not self.closed:
+            try:
+                connection, address = self.server.accept()
+            except socket.error as error:
+                if self.closed:
+                    break
+                print('accepting a worker failed: ' + str(error))
+                time.sleep(POLL_INTERVAL)
+                continue
+            worker = WorkerConnection(connection, address)
+            thread = threading.Thread(target=self.receive, args=(worker,))
+            thread.daemon = True
+            thread.start()
+
+    def close(self):
+        """ stops listening and drops all workers """
+        self.closed = True
+        self.server.close()
+        for worker in self.workers:
+            worker.close()
+        self.workers = []
+
+    def receive(self, worker):
+        """ puts the messages of a worker on the event queue """
+        buffer = ''
+        try:
+            while True:
+                data = worker.connection.recv(1 << 16)
+                if not data:
+                    break
+                messages, buffer = split_messages(buffer + data)
+                for message in messages:
+                    self.events.put((worker, message))
+        except (socket.error, ValueError):
+            pass
+        self.events.put((worker, None))
+
+    def rewrite(self, lines, parents=()):
+        """ the lines of a deck with the *INCLUDE files replaced by the worker's copies, the
+        files included directly [(filename, md5)] and {md5: content} of all include files """
+        rewritten = []
+        children = []
+        files = {}
+        for line in lines:
+            if line.upper().startswith('*INCLUDE'):
+                filename = line[line.upper().index('INPUT=') + len('INPUT='):].strip()
+                md5, content, nested = self.include(filename, parents)
+                children.append((filename, md5))
+                files[md5] = content
+                files.update(nested)
+                line = '*INCLUDE, INPUT=include_' + md5 + '.inp\n'
+            rewritten.append(line)
+        return rewritten, children, files
+
+    def include(self, filename, parents=()):
+        """ (md5, content, {md5: content} of its nested include files) of an include file
+        with its own *INCLUDE lines rewritten. It is read again only if it or a file it
+        includes changed """
+        if filename in parents:
+            raise ValueError('the include file ' + filename + ' includes itself')
+        stat = os.stat(filename)
+        cached = self.include_cache.get(filename)
+        if cached is not None and cached[0:2] == (stat.st_mtime, stat.st_size) and \
+                all([self.include(child, parents + (filename,))[0] == md5 for child, md5 in cached[2]]):
+            return cached[3], cached[4], cached[5]
+        with open(filename, 'r') as include:
+            lines, children, nested = self.rewrite(include, parents + (filename,))
+        content = ''.join(lines)
+        cached = (stat.st_mtime, stat.st_size, children, hashlib.md5(content).hexdigest(), content, nested)
+        self.include_cache[filename] = cached
+        return cached[3], cached[4], cached[5]
+
+    def job_message(self, worker, job):
+        """ the deck of a job with its include files replaced by the worker's copies, and
+        the include files the worker does not have yet """
+        with open(job.inputname, 'r') as deck:
+            lines, children, files = self.rewrite(deck)
+        includes = dict((md5, content) for md5, content in files.items() if md5 not in worker.includes)
+        return {'type': 'job', 'id': job.outputname, 'increment': job.martensite_amount, 'grain': job.grain_nr,
+                'laminate': job.laminate, 'inputname': job.inputname, 'deck': ''.join(lines),
+                'includes': includes, 'timeout': self.timeout}
+
+    def solver_family(self):
+        """ the solver family (see resultcache.solver_family) of the connected workers, None
+        if no worker is connected or they run different solvers """
+        families = set([resultcache.solver_family(worker.backend) for worker in self.workers])
+        if len(families) != 1 or None in families:
+            return None
+        return families.pop()
+
+    def launch(self, worker, job):
+        message = self.job_message(worker, job)
+        worker.send(message)
+        worker.includes.update(message['includes'])
+        worker.running[job.outputname] = job
+        job.start_time = time.time()
+        job.status = 'running'
+        job.worker = worker.name
+        job.backend = worker.backend
+
+    def lose(self, worker, queue):
+        """ drops a worker and queues its jobs again, in front of the others """
+        if worker in self.workers:
+            self.workers.remove(worker)
+            print('worker ' + worker.name + ' lost, ' + str(len(worker.running)) + ' jobs are queued again')
+        worker.close()
+        for job in worker.running.values():
+            job.status = 'queued'
+            job.start_time = None
+            queue.append(job)
+        worker.running = {}
+
+    def end(self, job, status, finished, on_complete):
+        job.status = status
+        job.end_time = time.time()
+        finished.append(job)
+        if on_complete is not None:
+            on_complete(job)
+
+    def authentic(self, token):
+        """ whether a worker presented the shared token, compared in constant time """
+        if not isinstance(token, basestring):
+            return False
+        digest = lambda value: hashlib.sha256(value.encode('utf-8')).digest()
+        return hmac.compare_digest(digest(token), digest(self.token))
+
+    def handle(self, worker, message, queue, finished, on_complete):
+        if message is None:
+            self.lose(worker, queue)
+            return
+        if message['type'] == 'hello' and not self.authentic(message.get('token')):
+            print('worker ' + worker.name + ' rejected, it did not present the shared token')
+            worker.close()
+            return
+        if message['type'] != 'hello' and worker not in self.workers:
+            worker.close()  # a connection that did not say hello first
+            return
+        worker.last_seen = time.time()
+        if message['type'] == 'hello':
+            worker.name = message.get('worker', worker.name)
+            worker.slots = int(message['slots'])
+            worker.backend = message.get('backend')
+            if worker not in self.workers:
+                self.workers.append(worker)
+            print('worker ' + worker.name + ' connected with ' + str(worker.slots) + ' slots')
+        elif message['type'] == 'result':
+            job = worker.running.pop(message['id'], None)
+            if job is None:
+                return  # a job that was killed or queued again in the meantime
+            write_outputs(job.outputname, message['status'], message['allie'], message['model_data'])
+            job.returncode = message.get('returncode')
+            job.cpu_time = message.get('cpu_time')
+            self.end(job, message['status'], finished, on_complete)
+
+    def run(self, jobs, on_complete=None, should_stop=None, on_launch=None, admit=None):
+        """ runs all jobs on the workers and returns them once every job has ended, with the
+        arguments of jobpool.JobPool.run. Jobs are killed after 'timeout' seconds """
+        queue = list(jobs)
+        queue.reverse()  # pop from the end keeps the given order
+        for job in queue:
+            job.queue_time = time.time()
+        finished = []
+        self.skipped = []
+        waiting_reported = False
+        while queue or any([worker.running for worker in self.workers]):
+            for worker in list(self.workers):
+                while queue and len(worker.running) < worker.slots:
+                    if admit is not None and any([w.running for w in self.workers]) and not admit():
+                        break
+                    if should_stop is not None and should_stop(queue):
+                        for job in queue:
+                            job.status = 'skipped'
+                        self.skipped = queue[::-1]
+                        queue = []
+                        break
+                    job = queue.pop()
+                    try:
+                        self.launch(worker, job)
+                    except socket.error:
+                        queue.append(job)
+                        self.lose(worker, queue)
+                        break
+                    if on_launch is not None:
+                        on_launch(job)
+            if queue and not self.workers and not waiting_reported:
+                print('waiting for workers on port ' + str(self.server.getsockname()[1]))
+                waiting_reported = True
+            try:
+                worker, message = self.events.get(timeout=POLL_INTERVAL)
+                self.handle(worker, message, queue, finished, on_complete)
+            except Queue.Empty:
+                pass
+            now = time.time()
+            for worker in list(self.workers):
+                if now - worker.last_seen > self.heartbeat_timeout:
+                    self.lose(worker, queue)
+                    continue
+                for outputname, job in list(worker.running.items()):
+                    if now - job.start_time > self.timeout:
+                        print('job ' + outputname + ' running after timeout on ' + worker.name + ', killing it...')
+                        del worker.running[outputname]
+                        try:
+                            worker.send({'type': 'kill', 'id': outputname})
+                        except socket.error:
+                            pass
+                        write_outputs(outputname, 'timeout', None, None)
+                        self.end(job, 'timeout', finished, on_complete)
+        return finished
+
+
+_coordinator = None
+
+
+def coordinator(timeout=1200, host=COORDINATOR_HOST, port=COORDINATOR_PORT):
+    """ the coordinator of this process. It is started on first use and kept for all
+    increments, so the workers stay connected """
+    global _coordinator
+    if _coordinator is None:
+        _coordinator = Coordinator(host, port, timeout)
+    _coordinator.timeout = timeout
+    return _coordinator
+
+
+# -----< worker >--------------------------------------------------------------------------#
+
+def extract(job):
+    """ (status, ALLIE, model data) of an ended job, read from its outputs """
+    if job.status != 'completed':
+        return job.status, None, None
+    allie = automate.read_total_strain_energy(job.outputname)
+    if allie is None:
+        return 'failed', None, None
+    model_data = datreader.read_model_data(job.outputname)
+    if model_data is None and os.path.isfile(job.outputname + '.odb'):
+        try:
+            model_data = automate.evaluate_odb(job.outputname + '.odb', var=0)
+        except ImportError:
+            pass  # the odb API is only available in the Abaqus Python environment
+    return 'completed', allie, list(model_data) if model_data is not None else None
+
+
+class Worker(object):
+    """ solves the decks of a coordinator with 'slots' concurrent local jobs of 'cpus'
+    cpus each in 'directory'. It presents 'token' (default shared_token) to the coordinator """
+
+    def __init__(self, host, port=COORDINATOR_PORT, slots=2, cpus=2, backend='abaqus', directory='worker',
+                 name=None, token=None):
+        self.address = (host, port)
+        self.token = token if token is not None else shared_token()
+        self.name = name if name is not None else socket.gethostname() + '_' + str(os.getpid())
+        self.pool = jobpool.JobPool(slots=slots, cpus=cpus, backend=backend)
+        self.directory = directory
+        self.running = {}  # outputname -> job
+
+    def serve(self):
+        """ works for the coordinator and reconnects whenever the connection is lost """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        os.chdir(self.directory)
+        while True:
+            try:
+                self.session()
+            except (socket.error, ValueError) as error:
+                print('connection to ' + self.address[0] + ':' + str(self.address[1]) + ' lost: ' + str(error))
+            time.sleep(RECONNECT_INTERVAL)
+
+    def session(self):
+        connection = socket.create_connection(self.address)
+        try:
+            send_message(connection, {'type': 'hello', 'worker': self.name, 'slots': self.pool.slots,
+                                      'backend': self.pool.backend, 'token': self.token})
+            buffer = ''
+            last_heartbeat = time.time()
+            while True:
+                readable, _, _ = select.select([connection], [], [], POLL_INTERVAL)
+                if readable:
+                    data = connection.recv(1 << 16)
+                    if not data:
+                        raise socket.error('closed by the coordinator')
+                    messages, buffer = split_messages(buffer + data)
+                    for message in messages:
+                        self.handle(message)
+                now = time.time()
+                for outputname, job in list(self.running.items()):
+                    if self.pool.check(job, now):
+                        del self.running[outputname]
+                        self.report(connection, job)
+                if now - last_heartbeat > HEARTBEAT_INTERVAL:
+                    send_message(connection, {'type': 'heartbeat'})
+                    last_heartbeat = now
+        finally:
+            # the coordinator queues the jobs of a lost worker again
+            for job in self.running.values():
+                jobpool.kill_process_tree(job.process.pid)
+                self.remove_outputs(job)
+            self.running = {}
+            connection.close()
+
+    def handle(self, message):
+        if message['type'] == 'job':
+            for md5, content in message['includes'].items():
+                with open(plain_name('include_' + md5 + '.inp'), 'w') as include:
+                    include.write(content)
+            job = jobpool.Job(message['increment'], message['grain'], message['laminate'])
+            job.outputname = plain_name(message['id'])
+            job.inputname = plain_name(message['inputname'])
+            with open(job.inputname, 'w') as deck:
+                deck.write(message['deck'])
+            self.pool.timeout = message['timeout']
+            self.pool.launch(job)
+            self.running[job.outputname] = job
+        elif message['type'] == 'kill':
+            job = self.running.pop(message['id'], None)
+            if job is not None:
+                jobpool.kill_process_tree(job.process.pid)
+                job.process.wait()
+                self.remove_outputs(job)
+
+    def report(self, connection, job):
+        status, allie, model_data = extract(job)
+        send_message(connection, {'type': 'result', 'id': job.outputname, 'status': status, 'allie': allie,
+                                  'model_data': model_data, 'returncode': job.returncode,
+                                  'runtime': job.runtime(), 'cpu_time': job.cpu_time})
+        self.remove_outputs(job)
+
+    def remove_outputs(self, job):
+        """ the deck and outputs of a job are not needed once its values are sent """
+        for filename in [job.inputname] + [name for name in os.listdir('.') if name.startswith(job.outputname + '.')]:
+            if os.path.isfile(filename):
+                os.remove(filename)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'worker':
+        arguments = dict(argument.split('=', 1) for argument in sys.argv[2:] if '=' in argument)
+        Worker(arguments.get('host', 'localhost'), int(arguments.get('port', COORDINATOR_PORT)),
+               int(arguments.get('slots', 2)), int(arguments.get('cpus', 2)), arguments.get('backend', 'abaqus'),
+               arguments.get('directory', 'worker'), arguments.get('name'), arguments.get('token')).serve()
+    else:
+        print(__doc__)
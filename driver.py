@@ -0,0 +1,591 @@
+""" This module holds the increment driver. One driver object runs any number of
+increments in the same process and keeps the state of the transformation in memory.
+After every increment the state is written to 'saves/continuing_data' as a durable
+snapshot, from which a new driver resumes after a restart. Within an increment the
+evaluated candidates are journaled (see journal), so a restarted increment only solves
+the candidates that were not evaluated before. The stages and jobs of every increment are
+traced (see tracing). """
+
+import cPickle as pickle  # Phython module to save intermediate results conveniently
+import shutil  # high level file operations like copying
+import glob  # Unix style pathname pattern expansion
+import os  # miscellaneous operating system interfaces
+import numpy as np
+# my modules
+import write
+import automate
+import batch
+import candidates
+import deckparser
+import grains
+import jobpool
+import journal
+import material
+import resultcache
+import resultstore
+import retention
+import tracing
+
+CHECKPOINT_FILENAME = 'saves/continuing_data'
+PREVIOUS_CHECKPOINT_FILENAME = CHECKPOINT_FILENAME + '.prev'
+# first entry of a snapshot with a grain registry, older snapshots start with the increment
+SNAPSHOT_FORMAT = 'grain-registry-1'
+FINISH_FILENAME = 'saves/finish_loop'
+
+
+class IncrementDriver(object):
+    """ runs the energy minimizing transformation increment by increment. The parameters
+    are the script-parameters of transEnergymin.py. """
+
+    def __init__(self, pbc, geometry_filename, material_jobData_filename, laminate_variants,
+                 preselection=True, selected_steps=(), timeout=1200, calibrate_concurrency=True,
+                 total_grain_amount=None, grain_volume=None, orientation_filename=None,
+                 max_session_jobs=900, best_first=False, early_stop_confidence=3., screening=None,
+                 backend='abaqus', interaction_confirm=12, keep_outputs=3, output_budget=None,
+                 scratch_min_free=None, batch_size=1, batch_separation=2., batch_interaction=0.1,
+                 batch_tolerance=0.05, result_cache_size=None):
+        self.pbc = pbc
+        self.geometry_filename = geometry_filename
+        self.material_jobData_filename = material_jobData_filename
+        self.laminate_variants = laminate_variants
+        self.preselection = preselection
+        self.selected_steps = selected_steps
+        self.timeout = timeout
+        self.calibrate_concurrency = calibrate_concurrency
+        # submit candidates best-first and stop once the minimum is settled, see
+        # automate.EarlyStopping
+        self.best_first = best_first
+        self.early_stop_confidence = early_stop_confidence
+        # None: preselection table only, 'stress': the stress based criterion of the last
+        # accepted state replaces the table, 'combined': it ranks the table's candidates,
+        # 'interaction': the energies of the interaction matrix of the increment rank the
+        # table's candidates and only the best 'interaction_confirm' are calculated
+        self.screening = screening
+        self.interaction_confirm = interaction_confirm
+        self.orientation_filename = orientation_filename
+        # 'abaqus' runs the candidates with the standard solver, 'native' with fesolver and
+        # 'native-update' with fesolver's factorization update in this process, 'distributed'
+        # on the workers connected to this process (see distributed)
+        self.backend = backend
+        if screening in ('stress', 'combined') and backend != 'abaqus':
+            raise ValueError("the screening '" + screening + "' needs the odb of the accepted state, the backend '" +
+                             backend + "' does not write it")
+        # Abaqus only allows a maximum number of around 1000 jobs in one interactive
+        # Python session, the driver stops before this number would be exceeded
+        self.max_session_jobs = max_session_jobs
+        # only the outputs of the best 'keep_outputs' candidates are kept during an increment,
+        # no further job is launched while the outputs exceed 'output_budget' bytes or the
+        # scratch directory has less than 'scratch_min_free' bytes left, see retention
+        self.keep_outputs = keep_outputs
+        self.output_budget = output_budget
+        self.scratch_min_free = scratch_min_free
+        # up to 'batch_size' grains transform in one increment if they are 'batch_separation'
+        # grain diameters apart or their delta_G changed by less than 'batch_interaction' in
+        # the increment before, and the solved combined state deviates by less than
+        # 'batch_tolerance' from the sum of the single changes, see batch
+        self.batch_size = batch_size
+        self.batch_separation = batch_separation
+        self.batch_interaction = batch_interaction
+        self.batch_tolerance = batch_tolerance
+        self.batch_geometry = None  # batch.GrainGeometry of the mesh
+        # the energies of solved configurations are kept across runs in a cache of at most
+        # 'result_cache_size' bytes (None: no cache), see resultcache
+        self.result_cache = resultcache.ResultCache(result_cache_size) if result_cache_size is not None else None
+        self.input_md5s = None  # md5s of the geometry and the material and job data
+        self.until = None
+        self.session_jobs = 0
+        self.split = None  # (concurrent jobs, cpus per job)
+        self.includes = None  # shared include files of the input decks
+        self.screened_variants = []  # candidates of the current increment
+        self.trace = None  # trace of the current increment, see tracing
+        #
+        if os.path.isfile(CHECKPOINT_FILENAME):
+            self.load_checkpoint()
+            journal.remove_stale(self.martensite_amount)
+        else:
+            self.prepare(total_grain_amount, grain_volume)
+
+    # -----< STATE >-------------------------------------------------------------------------#
+
+    @property
+    def austenite_grains(self):
+        """ austeniteGrains [grainNr, grainvolume, grainmaterial] """
+        return self.grains.austenite_grains()
+
+    @property
+    def martensite_grains(self):
+        """ martensiteGrains [grainNr, laminate] in the order they transformed """
+        return self.grains.martensite_grains()
+
+    @property
+    def oris(self):
+        """ orientations of the grains of the random microstructure """
+        orientations = self.grains.orientations()
+        return orientations if orientations is not None else 0
+
+    def prepare(self, total_grain_amount, grain_volume):
+        """ creates the save directory and files and the initial state """
+        self.selected_variants = []
+        self.martensite_amount = 1
+        self.chemical_drivingForce = 0
+        self.total_strain_energy_cell_before = 0
+        if not os.path.isdir('saves'):
+            os.mkdir('saves')  # create directory where results are saved
+        # the results of the increments are kept in the result store, a store left from
+        # an earlier run in this directory is replaced
+        shutil.rmtree(resultstore.RESULTS_DIRECTORY, ignore_errors=True)
+        resultstore.ResultStore()
+        #
+        if self.pbc == False:
+            self.odbname = self.geometry_filename
+            # the grain volumes from the mesh, the orientations are given explicitly since
+            # they are also used for the averaging of the material properties
+            graindata, Vinner = automate.get_volumes_and_laminates(self.geometry_filename)
+            grain_nrs = [grain[0] for grain in graindata]
+            orientations = None
+            orientation_source = (self.orientation_filename or self.geometry_filename).strip()
+            if not orientation_source.endswith('.odb'):
+                orientations = deckparser.grain_orientations(deckparser.cached_parse(orientation_source), grain_nrs)
+            self.grains = grains.GrainRegistry(grain_nrs, [grain[1] for grain in graindata], orientations)
+        elif grain_volume is None:
+            self.odbname = ''
+            graindata, Vinner = automate.get_volumes_and_laminates(self.geometry_filename)
+            self.grains = grains.GrainRegistry([grain[0] for grain in graindata], [grain[1] for grain in graindata])
+        else:
+            self.odbname = ''
+            # recall that the grain volume is equal for all octahedra
+            self.grains = grains.GrainRegistry(range(1, total_grain_amount + 1), [grain_volume] * total_grain_amount)
+        self.total_grain_amount = len(self.grains)  # get Nr of grains in the ESCM
+
+    def load_checkpoint(self):
+        """ loads the last snapshot, or the one before if it can not be read """
+        for filename in (CHECKPOINT_FILENAME, PREVIOUS_CHECKPOINT_FILENAME):
+            try:
+                self.read_snapshot(filename)
+                return
+            except (IOError, EOFError, pickle.UnpicklingError) as error:
+                print('snapshot ' + filename + ' can not be read: ' + str(error))
+        raise IOError('no readable snapshot in saves/')
+
+    def read_snapshot(self, filename):
+        """ reads a snapshot in the same order it was written. Snapshots written before
+        the grain registry hold the grain lists, they are converted """
+        with open(filename, 'rb') as cont:
+            first = pickle.load(cont)
+            if first == SNAPSHOT_FORMAT:
+                self.martensite_amount = pickle.load(cont)
+                self.grains = grains.GrainRegistry(None, None, records=pickle.load(cont))
+                self.chemical_drivingForce = pickle.load(cont)
+                self.total_strain_energy_cell_before = pickle.load(cont)
+                self.selected_variants = pickle.load(cont).tolist()
+            else:
+                self.martensite_amount = first
+                oris = pickle.load(cont) if self.pbc == False else 0
+                martensite_grains = pickle.load(cont)
+                austenite_grains = pickle.load(cont)
+                self.grains = grains.GrainRegistry.from_lists(austenite_grains, martensite_grains,
+                                                              None if isinstance(oris, int) else oris)
+                self.chemical_drivingForce = pickle.load(cont)
+                self.total_strain_energy_cell_before = pickle.load(cont)
+                self.selected_variants = pickle.load(cont)
+        # get amount of grains for the randomly generated microstructure
+        self.total_grain_amount = len(self.grains)
+        # Define name of .odb file containing latest evaluated result
+        self.odbname = 'saves/Outputfile_' + str(self.martensite_amount - 1) + '_' + \
+                       str(self.martensite_grains[-1][0]) + '_' + str(self.martensite_grains[-1][1]) + '.odb'
+
+    def write_checkpoint(self):
+        """ writes the state for the next increment. The snapshot is written to a temporary
+        file which is flushed to disk and then renamed, so 'continuing_data' always holds
+        a complete state, even if the node goes down while writing. The snapshot before is
+        kept as 'continuing_data.prev'. """
+        # it is crucial that the values are 'loaded' in the same order they are 'dumped'.
+        # The binary protocol stores the grain records and the selected variants as raw arrays
+        tmpname = CHECKPOINT_FILENAME + '.tmp'
+        with open(tmpname, 'wb') as cont:
+            for value in [SNAPSHOT_FORMAT, self.martensite_amount, self.grains.records, self.chemical_drivingForce,
+                          self.total_strain_energy_cell_before,
+                          np.array(self.selected_variants, dtype='<i4').reshape(-1, 2)]:
+                pickle.dump(value, cont, pickle.HIGHEST_PROTOCOL)
+            cont.flush()
+            os.fsync(cont.fileno())
+        if os.path.isfile(CHECKPOINT_FILENAME):
+            shutil.copy2(CHECKPOINT_FILENAME, PREVIOUS_CHECKPOINT_FILENAME)
+        os.rename(tmpname, CHECKPOINT_FILENAME)
+
+    def finished(self):
+        return self.martensite_amount > self.total_grain_amount
+
+    # -----< INCREMENT >---------------------------------------------------------------------#
+
+    def candidate_count(self, preselection):
+        if not preselection:
+            return len(self.grains.austenite_rows()) * len(self.laminate_variants)
+        return len(self.screened_variants)
+
+    def run(self, until=None):
+        """ runs increments until the transformation is finished or the increment 'until'
+        (a number of transformed grains) is done. Returns early if the next increment
+        would exceed the jobs allowed in this solver session; the caller then recycles the
+        session and a new driver continues from the snapshot. Returns True when the whole
+        transformation is finished. """
+        self.until = until
+        while not self.finished():
+            if until is not None and self.martensite_amount > until:
+                break
+            self.trace = tracing.Trace(self.martensite_amount)
+            with self.trace.stage('preselection'):
+                preselection = self.update_preselection()
+            if self.session_jobs and \
+                    self.session_jobs + self.candidate_count(preselection) > self.max_session_jobs:
+                self.trace.close(interrupted='session')
+                break
+            self.run_increment(preselection)
+        return self.finished()
+
+    def track_outputs(self, outputs, martensite_amount, grain_nr, laminate):
+        """ the deck and outputs of a candidate are managed by 'outputs' """
+        job = jobpool.Job(martensite_amount, grain_nr, laminate)
+        outputs.track(job.outputname, job.inputname)
+
+    def record_job(self, job):
+        """ traces a job that has ended """
+        self.trace.record_job(job, self.timeout)
+
+    def job_runner(self, slots, cpus):
+        """ runs the candidate jobs with the backend of the run, see jobpool.job_runner """
+        return jobpool.job_runner(self.backend, self.timeout, slots, cpus)
+
+    def count_session_job(self, job):
+        """ counts a job that is not a candidate, e.g. of the calibration, against the
+        jobs of this solver session """
+        self.session_jobs += 1
+
+    def update_preselection(self):
+        """ returns whether the preselection is used in the current increment and updates
+        the selected variants from the last fully calculated increment or the stress based
+        screening of the last accepted state """
+        if self.preselection == False:
+            return False
+        if (self.martensite_amount - 1) in self.selected_steps:
+            self.selected_variants = automate.preselect(self.total_grain_amount, self.martensite_amount)
+        # calculate all possible states only in every selected stepwidth
+        if self.martensite_amount in self.selected_steps:
+            return False
+        # the screening needs the odb of an accepted state
+        if self.screening in ('stress', 'combined') and self.odbname.endswith('.odb') and \
+                os.path.isfile(self.odbname):
+            if self.screening == 'stress':
+                self.screened_variants = automate.screen(self.odbname, self.total_grain_amount,
+                                                         self.martensite_amount)
+            else:
+                self.screened_variants = automate.screen(self.odbname, self.total_grain_amount,
+                                                         self.martensite_amount, self.selected_variants)
+            return True
+        if self.screening in ('stress', 'combined'):
+            # e.g. the energy of an accepted batch was taken from the result cache
+            print('increment ' + str(self.martensite_amount) + ': no odb of the accepted state, the ' +
+                  self.screening + ' screening falls back to the preselection table')
+            if self.trace is not None:
+                self.trace.record('screening', screening=self.screening, fallback='table', odb=self.odbname)
+        self.screened_variants = self.selected_variants
+        return True
+
+    def self_consistent_matrix(self, transforming=()):
+        """ calculates the averaged material properties from the last energy-minimizing
+        state for the matrix of the random microstructure. The grains 'transforming'
+        ([grainNr, laminate]) are taken as transformed, e.g. the members of a batch """
+        if self.pbc == True:
+            return 0
+        # list [grainnumber,  grainvolume,  grainmaterial] of the grain registry, necessary
+        # for averaging anisotropic data. Snapshots written before the registry did not
+        # hold the volumes of the transformed grains, they are taken from the mesh
+        if np.isnan(self.grains.volumes).any():
+            graindata, Vinner = automate.get_volumes_and_laminates(self.geometry_filename)
+            self.grains.records['volume'] = [grain[1] for grain in graindata]
+        graindata = self.grains.graindata()
+        if transforming:
+            laminates = dict((grain_nr, laminate) for grain_nr, laminate in transforming)
+            graindata = [[nr, volume, 'LAMINATE' + str(laminates[nr]) if nr in laminates else grainmaterial]
+                         for nr, volume, grainmaterial in graindata]
+        Vinner = float(self.grains.volumes.sum())
+        # the average is updated by the last transformed grain, in the selected steps it
+        # is checked against the sum over all grains
+        return material.selfconsistent_matrix(self.oris, graindata, Vinner,
+                                              validate=self.martensite_amount in self.selected_steps)
+
+    def increment_cache(self, C_ave, martensite_grains):
+        """ the result cache of the candidates in the state with 'martensite_grains'
+        transformed and the matrix 'C_ave', None without a cache or if the distributed
+        workers run different solvers """
+        if self.result_cache is None:
+            return None
+        solver = resultcache.solver_family(self.backend)
+        if self.backend == 'distributed':
+            # the energies depend on the solver of the workers, without a common one the
+            # increment is solved without the cache
+            import distributed
+            solver = distributed.coordinator(self.timeout).solver_family()
+            if solver is None:
+                return None
+        if self.input_md5s is None:
+            self.input_md5s = resultcache.input_md5s(self.geometry_filename, self.material_jobData_filename)
+        return resultcache.IncrementCache(self.result_cache, self.input_md5s, self.pbc, C_ave, martensite_grains,
+                                          solver)
+
+    def batch_limit(self, martensite_amount):
+        """ the number of grains which may transform in an increment. The first increment
+        sets the chemical driving force and the selected steps are calculated completely,
+        a batch does not skip over them nor over the increment 'until' """
+        if self.batch_size < 2 or martensite_amount == 1 or martensite_amount in self.selected_steps:
+            return 1
+        limit = min(self.batch_size, self.total_grain_amount - martensite_amount + 1)
+        later = [step for step in self.selected_steps if step > martensite_amount]
+        if later:
+            limit = min(limit, min(later) - martensite_amount)
+        if self.until is not None:
+            limit = min(limit, self.until - martensite_amount + 1)
+        return max(limit, 1)
+
+    def confirm_batch(self, martensite_amount, evaluation_data, limit, outputs, slots, cpus):
+        """ returns the evaluation rows of the grains which transform in this increment and
+        the chemical driving force after each of them: the batch if the solved combined
+        state confirms it, otherwise only the best grain and None """
+        if self.batch_geometry is None and self.batch_separation is not None and \
+                not self.geometry_filename.strip().endswith('.odb'):
+            self.batch_geometry = batch.GrainGeometry(self.geometry_filename, self.pbc)
+        members = batch.select_batch(evaluation_data, limit, self.batch_geometry, self.batch_separation,
+                                     automate.read_allruns(martensite_amount - 1), self.batch_interaction)
+        if len(members) < 2:
+            return members, None
+        # the combined state is the candidate of the last member in the state in which the
+        # other members are transformed, it is named like that candidate of its increment
+        last_amount = martensite_amount + len(members) - 1
+        grain_nr, laminate = members[-1][1], members[-1][2]
+        transforming = [[member[1], member[2]] for member in members[:-1]]
+        transformed = set([member[1] for member in members[:-1]])
+        austenite_grains = [grain for grain in self.austenite_grains if grain[0] not in transformed]
+        C_ave = self.self_consistent_matrix(transforming)
+        combined_cache = self.increment_cache(C_ave, self.martensite_grains + transforming)
+        combined_energy = combined_cache.lookup(grain_nr, laminate) if combined_cache is not None else None
+        if combined_energy is None:
+            template = write.DeckTemplate(last_amount, austenite_grains, self.martensite_grains + transforming,
+                                          self.pbc, self.includes, C_ave)
+            self.track_outputs(outputs, last_amount, grain_nr, laminate)
+            template.write_inputfile(self.grains.austenite_grain(grain_nr), laminate)
+            space = candidates.candidate_space(austenite_grains, self.laminate_variants, True, [[grain_nr, laminate]])
+            jobs = automate.submitjobs(last_amount, space, self.job_runner(slots, cpus),
+                                       on_complete=self.record_job)
+            self.session_jobs += len(jobs)
+            if self.pbc == False:
+                os.remove(os.path.join(self.includes.directory, 'matrix_' + str(last_amount) + '.inp'))
+            combined_energy = automate.read_total_strain_energy(
+                jobpool.Job(last_amount, grain_nr, laminate).outputname)
+            if combined_cache is not None:
+                combined_cache.store(grain_nr, laminate, combined_energy)
+        if combined_energy is None or \
+                batch.deviation(members, combined_energy, self.total_strain_energy_cell_before) > self.batch_tolerance:
+            return members[0: 1], None
+        return batch.batch_rows(members, combined_energy, self.total_strain_energy_cell_before,
+                                self.chemical_drivingForce)
+
+    def run_increment(self, preselection):
+        """ evaluates the grain-laminate pair which minimizes the total free energy density
+        upon transformation of one more grain and moves to the next increment """
+        martensite_amount = self.martensite_amount
+        trace = self.trace if self.trace is not None else tracing.Trace(martensite_amount)
+        with trace.stage('matrix'):
+            C_ave = self.self_consistent_matrix()
+        #
+        # -----< INPUTFILE CREATION >---------------------------------------------------------#
+        # the mesh and material data are shared by all candidates, each input file only
+        # holds the section assignments rendered from the template of this increment
+        outputs = retention.OutputRetention(self.keep_outputs, self.output_budget,
+                                            '/dev/shm' if os.path.isdir('/dev/shm') else None, self.scratch_min_free)
+        with trace.stage('deck writing'):
+            if self.includes is None:
+                self.includes = write.SharedIncludes(self.geometry_filename, self.material_jobData_filename)
+            template = write.DeckTemplate(martensite_amount, self.austenite_grains, self.martensite_grains,
+                                          self.pbc, self.includes, C_ave)
+        if preselection == True and self.screening == 'interaction' and self.screened_variants:
+            with trace.stage('screening'):
+                # the deck of one candidate defines the stiffness state of the increment
+                grain_nr, laminate = self.screened_variants[0]
+                austenite_grain = self.grains.austenite_grain(grain_nr)
+                self.track_outputs(outputs, martensite_amount, grain_nr, laminate)
+                self.screened_variants = automate.interaction_screen(
+                    template.write_inputfile(austenite_grain, laminate), grain_nr, self.austenite_grains,
+                    self.screened_variants, self.interaction_confirm, self.total_strain_energy_cell_before,
+                    self.chemical_drivingForce)
+        # All possible or preselected states of one more transformed grain are evaluated,
+        # every not transformed grain can transform in multiple ways. The input files, the
+        # submission and the evaluation share this candidate space
+        space = candidates.candidate_space(self.austenite_grains, self.laminate_variants, preselection,
+                                           self.screened_variants)
+        if preselection == True and len(space) == 0:
+            # all preselected grains are transformed already
+            print('increment ' + str(martensite_amount) + ': no preselected candidate is left, all candidates '
+                  'are calculated')
+            space = candidates.candidate_space(self.austenite_grains, self.laminate_variants, False, None)
+        with trace.stage('deck writing'):
+            for austenite_grain, laminate in space:
+                self.track_outputs(outputs, martensite_amount, austenite_grain[0], laminate)
+                template.write_inputfile(austenite_grain, laminate)
+        #
+        # -----< JOB SUBMISSION of all Jobs that were created >-------------------------------#
+        if self.split is None:
+            # the candidates of the 'native-update' backend are solved one after another, the
+            # workers of the 'distributed' backend advertise their own slots
+            if self.calibrate_concurrency == True and self.backend not in ('native-update', 'distributed'):
+                with trace.stage('calibration'):
+                    self.split = automate.tune_concurrency(self.geometry_filename, martensite_amount, space,
+                                                           self.timeout, backend=self.backend,
+                                                           on_launch=self.count_session_job)
+            else:
+                self.split = (6, 2)
+        slots, cpus = self.split
+        # every submission and evaluation is journaled, the candidates evaluated before a
+        # restart of this increment are taken from the journal instead of solving them again
+        increment_journal = journal.Journal(martensite_amount,
+                                            journal.state_key(martensite_amount, self.martensite_grains))
+        # candidates solved in this configuration before, e.g. by an earlier run, are taken
+        # from the result cache
+        increment_cache = self.increment_cache(C_ave, self.martensite_grains)
+        # the outputs are evaluated while the remaining jobs are still running. In the
+        # first increment the chemical driving force follows from the evaluation itself
+        if martensite_amount == 1:
+            evaluator = automate.CandidateEvaluator(journal=increment_journal, grains=self.grains, retention=outputs,
+                                                    cache=increment_cache)
+        else:
+            evaluator = automate.CandidateEvaluator(self.total_strain_energy_cell_before, self.chemical_drivingForce,
+                                                    journal=increment_journal, grains=self.grains, retention=outputs,
+                                                    cache=increment_cache)
+        for (grain_nr, laminate), (status, energy) in increment_journal.evaluated.items():
+            evaluator.add(jobpool.Job(martensite_amount, grain_nr, laminate, self.grains.volume(grain_nr)), energy)
+        cached = increment_cache.cached(space) if increment_cache is not None else {}
+        for (grain_nr, laminate), energy in cached.items():
+            if (grain_nr, laminate) not in increment_journal.evaluated:
+                evaluator.add(jobpool.Job(martensite_amount, grain_nr, laminate, self.grains.volume(grain_nr)), energy)
+        # jobs that were running when the increment was interrupted left their lock files
+        for grain_nr, laminate in increment_journal.submitted:
+            lckname = jobpool.Job(martensite_amount, grain_nr, laminate).outputname + '.lck'
+            if (grain_nr, laminate) not in increment_journal.evaluated and os.path.isfile(lckname):
+                os.remove(lckname)
+        # all candidates are needed in the first increment, which sets the chemical driving
+        # force, and in the selected steps, from which the preselection is taken
+        early_stopping = None
+        if self.best_first and martensite_amount > 1 and martensite_amount not in self.selected_steps:
+            early_stopping = automate.EarlyStopping(martensite_amount, evaluator, self.early_stop_confidence)
+        def on_complete(job):
+            trace.record_job(job, self.timeout)
+            evaluator.consume(job)
+        with trace.stage('solving'):
+            jobs = automate.submitjobs(martensite_amount, space, self.job_runner(slots, cpus), on_complete=on_complete,
+                                       early_stopping=early_stopping, skip=increment_journal.evaluated,
+                                       on_launch=increment_journal.record_submission, admit=outputs.admit,
+                                       cache=increment_cache)
+        self.session_jobs += len(jobs)
+        #
+        # -----< EVALUATE ALL jobs and SET PARAMETERS for the transformation of the next grain >--#
+        with trace.stage('output read'):
+            evaluation_data = evaluator.finish()
+        if not evaluation_data:
+            # the journal is removed, so a restart solves the candidates again instead of
+            # taking their failures from it
+            increment_journal.remove()
+            trace.close(interrupted='no energy')
+            self.trace = None
+            raise ValueError('increment ' + str(martensite_amount) + ': none of the ' + str(len(space)) +
+                             ' candidates returned an energy, see the .sta files of the jobs')
+        # evaluation_data =  [0-delta_G, 1-GrainNr, 2-GrainLaminate, 3-GrainVol,
+        #             4-dragEner_spec, 5-delta_totalStrain_spec,   6-total_strainEner_cell]
+        if martensite_amount == 1:
+            self.chemical_drivingForce = max(evaluation_data)[0]  # note that this is a negative value
+        with trace.stage('selection'):
+            found_grain = automate.select_grain(evaluation_data)
+            # the outputs of a candidate evaluated before a restart may be lost, the found
+            # grain is solved again for the files that are saved
+            if not os.path.isfile('Outputfile_' + str(martensite_amount) + '_' + str(found_grain[1]) + '_' +
+                                  str(found_grain[2]) + '.dat'):
+                found_space = candidates.candidate_space(self.austenite_grains, self.laminate_variants, True,
+                                                         [[found_grain[1], found_grain[2]]])
+                automate.submitjobs(martensite_amount, found_space, self.job_runner(slots, cpus),
+                                    on_complete=self.record_job)
+        # the rows of the grains which transform in this increment, more than the found
+        # grain in batch mode, and the chemical driving force after each of them
+        accepted, forces = [found_grain], None
+        limit = self.batch_limit(martensite_amount)
+        if limit > 1:
+            with trace.stage('batch'):
+                accepted, forces = self.confirm_batch(martensite_amount, evaluation_data, limit, outputs, slots, cpus)
+        #
+        # if delta_G reaches a new negative maximum the chemical driving force
+        # has to be increased for further transformations
+        if forces is None:
+            if found_grain[0] < 0:  # if delta_G < 0
+                self.chemical_drivingForce = found_grain[0]
+            forces = [self.chemical_drivingForce]
+        else:
+            self.chemical_drivingForce = forces[-1]
+        #
+        self.total_strain_energy_cell_before = accepted[-1][6]
+        #
+        # -----< WRITE DATA of all runs and energy-minimizing configuration to files >---------#
+        # the further grains of a batch are saved as the following increments
+        with trace.stage('result saving'):
+            write.FileOutputWriter(write.RunResults(martensite_amount, evaluation_data, forces[0],
+                                                    found_grain)).write_saves()
+            for i in range(1, len(accepted)):
+                write.FileOutputWriter(write.RunResults(martensite_amount + i, [accepted[i]], forces[i],
+                                                        accepted[i])).write_saves()
+        #
+        # -----< MOVE FOUNDGRAIN from austeniteGrains to martensiteGrains >--------------------#
+        # remove foundgrain from selected_variants if preselection is used
+        if self.preselection == True:
+            selected = candidates.candidate_space(self.austenite_grains, self.laminate_variants, True,
+                                                  self.selected_variants)
+            for row in accepted:
+                selected.remove_grain(row[1])
+            self.selected_variants = selected.pairs()
+        # the found grain - material pair moves from austeniteGrains to martensiteGrains
+        for row in accepted:
+            self.grains.transform(row[1], row[2])
+        #
+        last_amount = martensite_amount + len(accepted) - 1
+        self.martensite_amount = last_amount + 1
+        self.odbname = 'saves/Outputfile_' + str(last_amount) + '_' + str(accepted[-1][1]) + \
+                       '_' + str(accepted[-1][2]) + '.odb'
+        #
+        # -----< SAVE FILES OF FOUNDGRAIND AND DELETE THE REST >-------------------------------#
+        # of a batch also the files of the solved combined state
+        savefilenames = glob.glob('*_' + str(martensite_amount) + '_' + str(found_grain[1]) + \
+                                  '_' + str(found_grain[2]) + '*')  # example '*_17_44_5*'
+        if len(accepted) > 1:
+            savefilenames += glob.glob('*_' + str(last_amount) + '_' + str(accepted[-1][1]) + '_' +
+                                       str(accepted[-1][2]) + '*')
+        for i in savefilenames:
+            shutil.move(i, 'saves')  # generally: src --> destination, here: i --> saves
+        #
+        # -----< SAVE EVALUATED NECESSARY VARIABLES for the next increment >-------------------#
+        with trace.stage('checkpointing'):
+            self.write_checkpoint()
+            increment_journal.remove()
+            #
+            # delete the decks and outputs of all other candidates
+            outputs.finish()
+            if self.result_cache is not None:
+                self.result_cache.evict()
+            if self.pbc == False:
+                os.remove(os.path.join(self.includes.directory, 'matrix_' + str(martensite_amount) + '.inp'))
+        trace.close(grain=found_grain[1], laminate=found_grain[2], candidates=len(space), jobs=len(jobs),
+                    batch=len(accepted), cached=len(cached))
+        self.trace = None
+        #
+        # -----< CREATE STOPPINGFILE >-------------------------------------------------------#
+        # kept for external scripts that wait for the end of the transformation
+        if self.finished():
+            self.includes.remove()
+            # the text files of the results for external scripts
+            resultstore.ResultStore().export()
+            with open(FINISH_FILENAME, 'w'):
+                pass
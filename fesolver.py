@@ -0,0 +1,726 @@
+""" This module is a native linear elastic finite element backend for the candidate
+calculations. It reads the same input decks as the standard solver (see deckparser),
+assembles the stiffness matrix with the rotated elastic tensors of the material module and
+the eigenstrain loads of the laminates, solves the system with SciPy's sparse solvers and
+returns the strain energy (ALLIE) and the per-grain values as an odbreader.OdbSummary.
+
+Materials named 'austenite' and 'laminate<k>' take their elastic constants from the
+material module, a laminate carries the eigenstrain k of material.eigenstrains(), both in
+the local orientation of the grain. Other materials, like the self consistent matrix, are
+read from their *Elastic data. Linear constraints are taken from *Equation (e.g. the PBC
+equations) and *Boundary; if the deck has no *Boundary the rigid body translations
+(and, without equations, rotations) are suppressed at corner nodes.
+
+The candidates of an increment only differ in the material of one grain. CandidateSolver
+solves them in one process: the base state of the increment is factorized once and each
+candidate is solved with a Woodbury update over the degrees of freedom of its grain.
+
+Called as a script it runs one job like the standard solver and writes the energies to
+the .dat file and the completion status to the .sta file:
+    python fesolver.py job=Outputfile_1_2_3 input=Inputfile_1_2_3.inp """
+
+import os
+import sys
+import time
+
+import numpy as np
+import scipy.linalg as linalg
+import scipy.sparse as sparse
+import scipy.sparse.linalg as sparse_linalg
+# my modules
+import deckparser
+import material
+import mathutils
+import odbreader
+
+# elements are processed in chunks to bound the size of the temporary arrays
+CHUNK_SIZE = 20000
+# strain operators are kept in memory for repeated assembly up to this size
+MAX_CACHE_BYTES = 512 * 2 ** 20
+
+
+# -----< element formulation >-------------------------------------------------------------#
+
+def shape_tet4(xi):
+    """ shape function derivatives of the linear tetrahedron """
+    return np.array([[-1., -1., -1.], [1., 0., 0.], [0., 1., 0.], [0., 0., 1.]])
+
+
+def shape_tet10(xi):
+    """ shape function derivatives of the quadratic tetrahedron in abaqus node order """
+    L = [1. - xi[0] - xi[1] - xi[2], xi[0], xi[1], xi[2]]
+    dL = shape_tet4(xi)
+    dN = [(4. * L[i] - 1.) * dL[i] for i in range(4)]
+    for a, b in [(0, 1), (1, 2), (2, 0), (0, 3), (1, 3), (2, 3)]:
+        dN.append(4. * (L[a] * dL[b] + L[b] * dL[a]))
+    return np.array(dN)
+
+
+HEX_CORNERS = np.array([[-1, -1, -1], [1, -1, -1], [1, 1, -1], [-1, 1, -1],
+                        [-1, -1, 1], [1, -1, 1], [1, 1, 1], [-1, 1, 1]], dtype=float)
+
+
+def shape_hex8(xi):
+    """ shape function derivatives of the trilinear hexahedron in abaqus node order """
+    factors = 1. + HEX_CORNERS * np.asarray(xi)
+    dN = np.empty((8, 3))
+    for k in range(3):
+        others = [m for m in range(3) if m != k]
+        dN[:, k] = 0.125 * HEX_CORNERS[:, k] * factors[:, others[0]] * factors[:, others[1]]
+    return dN
+
+
+_a, _b = 0.5854101966249685, 0.1381966011250105
+_g = 1. / 3 ** 0.5
+HEX_POINTS = [(i * _g, j * _g, k * _g) for k in (-1, 1) for j in (-1, 1) for i in (-1, 1)]
+# shape function derivatives, integration points and weights of the element types
+ELEMENT_TYPES = {
+    'C3D4': (shape_tet4, [(.25, .25, .25)], [1. / 6]),
+    'C3D10': (shape_tet10, [(_b, _b, _b), (_a, _b, _b), (_b, _a, _b), (_b, _b, _a)], [1. / 24] * 4),
+    'C3D8': (shape_hex8, HEX_POINTS, [1.] * 8),
+    # reduced integration is not reproduced, the element is fully integrated
+    'C3D8R': (shape_hex8, HEX_POINTS, [1.] * 8),
+}
+
+
+def strain_operator(element_type, X):
+    """ returns the strain operators B (ne, ng, 6, 3*nn) and the integration weights times
+    the jacobian determinant (ne, ng) of the elements with node coordinates X (ne, nn, 3) """
+    shape, points, weights = ELEMENT_TYPES[element_type]
+    ne, nn = X.shape[0], X.shape[1]
+    B = np.zeros((ne, len(points), 6, nn, 3))
+    wdet = np.empty((ne, len(points)))
+    for g, (point, weight) in enumerate(zip(points, weights)):
+        dN = shape(point)
+        J = np.einsum('enk,nj->ekj', X, dN)
+        wdet[:, g] = weight * np.linalg.det(J)
+        dNdx = np.einsum('nj,ejk->enk', dN, np.linalg.inv(J))
+        for i, (k, l) in enumerate(mathutils.VOIGT_PAIRS):  # engineering shear strains
+            B[:, g, i, :, k] = dNdx[:, :, l]
+            B[:, g, i, :, l] = dNdx[:, :, k]
+    return B.reshape(ne, len(points), 6, 3 * nn), wdet
+
+
+# -----< material data >-------------------------------------------------------------------#
+
+def voigt_stiffness(C):
+    """ 6x6 stiffness of a fourth order tensor for engineering shear strains """
+    return mathutils.stiffness_matrices(C)
+
+
+def tensor_stiffness(D):
+    """ fourth order tensor of a 6x6 stiffness """
+    return mathutils.stiffness_tensors(D)
+
+
+def voigt_strain(eps):
+    """ [e11, e22, e33, 2e12, 2e13, 2e23] of a strain tensor """
+    return mathutils.strain_vectors(eps)
+
+
+def elastic_stiffness(elastic_type, values):
+    """ 6x6 stiffness of the *Elastic data of a deck """
+    D = np.zeros((6, 6))
+    if elastic_type == 'ANISOTROPIC':
+        # upper triangle given column by column: D1111, D1122, D2222, D1133, ...
+        position = 0
+        for J in range(6):
+            for I in range(J + 1):
+                D[I, J] = D[J, I] = values[position]
+                position += 1
+    elif elastic_type == 'ISOTROPIC':
+        E, nu = values[0], values[1]
+        lame = E * nu / ((1 + nu) * (1 - 2 * nu))
+        shear = E / (2 * (1 + nu))
+        D[:3, :3] = lame
+        D[range(3), range(3)] += 2 * shear
+        D[range(3, 6), range(3, 6)] = shear
+    else:
+        raise ValueError('elastic type ' + elastic_type + ' is not supported')
+    return D
+
+
+def laminate_number(material_name):
+    """ k of a material named 'laminate<k>', None for other materials """
+    if material_name.startswith('LAMINATE') and material_name[len('LAMINATE'):].isdigit():
+        return int(material_name[len('LAMINATE'):])
+    return None
+
+
+def eigenstresses(D, eps):
+    """ D : eps* of every section """
+    return np.einsum('sij,sj->si', D, eps)
+
+
+def factorize(K):
+    """ returns a function solving K x = b, with CHOLMOD if scikit-sparse is installed,
+    else with SuperLU """
+    try:
+        from sksparse.cholmod import cholesky
+        return cholesky(K.tocsc())
+    except ImportError:
+        return sparse_linalg.splu(K.tocsc()).solve
+
+
+# -----< model >---------------------------------------------------------------------------#
+
+class Model(object):
+    """ the finite element model of a parsed input deck """
+
+    def __init__(self, deck):
+        self.deck = deck
+        self.node_index = -np.ones(deck.node_labels.max() + 1, dtype=np.int64)
+        self.node_index[deck.node_labels] = np.arange(len(deck.node_labels))
+        self.n_dofs = 3 * len(deck.node_labels)
+        #
+        # the sections in the order of the deck, each element belongs to one of them
+        self.set_names = [elset for elset, orientation, material_name in deck.sections]
+        self.materials = [material_name for elset, orientation, material_name in deck.sections]
+        self.rotations = []
+        for elset, orientation, material_name in deck.sections:
+            if orientation is None:
+                self.rotations.append(np.identity(3))
+            else:
+                self.rotations.append(mathutils.orientation_basis(*deck.orientations[orientation]))
+        max_label = max(labels.max() for labels, connectivity in deck.elements.values())
+        section_of_label = -np.ones(max_label + 1, dtype=np.int64)
+        for index, elset in enumerate(self.set_names):
+            section_of_label[deck.elsets[elset]] = index
+        #
+        self.blocks = []  # (element type, node indices (ne, nn), section indices (ne,))
+        for element_type, (labels, connectivity) in sorted(deck.elements.items()):
+            sections = section_of_label[labels]
+            if (sections < 0).any():
+                raise ValueError('elements of type ' + element_type + ' without section')
+            self.blocks.append((element_type, self.node_index[connectivity], sections))
+        self.operator_cache = None
+        self.T, self.g = self.constraints()
+
+    # -----< geometry >--------------------------------------------------------------------#
+
+    def operators(self):
+        """ yields (dofs, sections, B, wdet) for chunks of elements. The operators are
+        cached if they fit into MAX_CACHE_BYTES """
+        if self.operator_cache is not None:
+            for chunk in self.operator_cache:
+                yield chunk
+            return
+        cache = []
+        size = 0
+        for element_type, nodes, sections in self.blocks:
+            for start in range(0, len(nodes), CHUNK_SIZE):
+                chunk_nodes = nodes[start: start + CHUNK_SIZE]
+                B, wdet = strain_operator(element_type, self.deck.coordinates[chunk_nodes])
+                dofs = (3 * chunk_nodes[:, :, np.newaxis] + np.arange(3)).reshape(len(chunk_nodes), -1)
+                chunk = (dofs, sections[start: start + CHUNK_SIZE], B, wdet)
+                size += B.nbytes
+                if cache is not None:
+                    cache = cache + [chunk] if size <= MAX_CACHE_BYTES else None
+                yield chunk
+        self.operator_cache = cache
+
+    def state_key(self, materials):
+        """ identifies the stiffness and eigenstrain state of the model with 'materials' """
+        deck_materials = tuple((name, elastic_type, tuple(values))
+                               for name, (elastic_type, values) in sorted(self.deck.materials.items()))
+        return (self.n_dofs, tuple(self.set_names), tuple(materials), deck_materials)
+
+    def section_of_grain(self, grain_nr):
+        """ index of the section of the element set 'TRANSIG_<grain_nr>' """
+        return self.set_names.index('TRANSIG_' + str(grain_nr))
+
+    def section_nodes(self, section):
+        """ indices of the nodes of the elements of a section """
+        return np.unique(np.concatenate([nodes[sections == section].ravel()
+                                         for element_type, nodes, sections in self.blocks]))
+
+    # -----< material state >-------------------------------------------------------------#
+
+    def section_properties(self, materials=None):
+        """ returns the global 6x6 stiffness (ns, 6, 6) and the global eigenstrain in Voigt
+        notation (ns, 6) of every section. 'materials' replaces the material names of the
+        sections, e.g. to assign another laminate to a grain """
+        materials = self.materials if materials is None else materials
+        Ca = np.array(material.austenite_stiffness(), dtype=float)
+        Cm = np.array(material.martensite_stiffness(), dtype=float)
+        transforming_strains = np.array(material.eigenstrains(), dtype=float)
+        C = np.empty((len(materials), 3, 3, 3, 3))
+        eps_local = np.zeros((len(materials), 3, 3))
+        for index, material_name in enumerate(materials):
+            laminate = laminate_number(material_name)
+            if material_name == 'AUSTENITE':
+                C[index] = Ca
+            elif laminate is not None:
+                C[index] = Cm
+                eps_local[index] = transforming_strains[laminate - 1]
+            else:
+                C[index] = tensor_stiffness(elastic_stiffness(*self.deck.materials[material_name]))
+        # all sections in one pass, rotate_elastic_tensors(C, R) gives R_mi R_nj R_ok R_pl C_mnop
+        Q = np.array(self.rotations[0: len(materials)], dtype=float)
+        D = voigt_stiffness(mathutils.rotate_elastic_tensors(C, np.swapaxes(Q, 1, 2)))
+        eps = voigt_strain(mathutils.rotate_matrices(eps_local, Q))
+        return D, eps
+
+    def assemble(self, D, eigenstress, sections=None):
+        """ returns the stiffness matrix and the eigenstrain load vector for the section
+        stiffnesses D and eigenstresses D : eps*. If 'sections' is given, only the elements
+        of these sections are assembled """
+        rows, cols, values = [], [], []
+        f = np.zeros(self.n_dofs)
+        for dofs, chunk_sections, B, wdet in self.operators():
+            if sections is not None:
+                inside = np.in1d(chunk_sections, sections)
+                if not inside.any():
+                    continue
+                dofs, chunk_sections, B, wdet = dofs[inside], chunk_sections[inside], B[inside], wdet[inside]
+            DB = np.einsum('eij,egjb->egib', D[chunk_sections], B)
+            Ke = np.einsum('eg,egia,egib->eab', wdet, B, DB)
+            fe = np.einsum('eg,egia,ei->ea', wdet, B, eigenstress[chunk_sections])
+            n = dofs.shape[1]
+            rows.append(np.repeat(dofs, n, axis=1).ravel())
+            cols.append(np.tile(dofs, (1, n)).ravel())
+            values.append(Ke.ravel())
+            np.add.at(f, dofs.ravel(), fe.ravel())
+        if not values:
+            return sparse.csr_matrix((self.n_dofs, self.n_dofs)), f
+        K = sparse.coo_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+                              shape=(self.n_dofs, self.n_dofs)).tocsr()
+        return K, f
+
+    # -----< constraints >----------------------------------------------------------------#
+
+    def dof(self, node_label, direction):
+        return 3 * self.node_index[int(node_label)] + direction - 1
+
+    def nodes_of(self, name):
+        return self.deck.node_labels_of(name)
+
+    def constraints(self):
+        """ returns T and g with u = T u_reduced + g, eliminating the first degree of
+        freedom of every equation and the prescribed degrees of freedom """
+        dependent = {}  # dof -> ({dof: coefficient}, constant)
+        for equation in self.deck.equations:
+            node_lists = [self.nodes_of(node) for node, direction, coefficient in equation]
+            size = max(len(nodes) for nodes in node_lists)
+            for k in range(size):
+                terms = [(self.dof(nodes[k if len(nodes) > 1 else 0], direction), coefficient)
+                         for nodes, (node, direction, coefficient) in zip(node_lists, equation)]
+                first, first_coefficient = terms[0]
+                dependent[first] = (dict((d, -c / first_coefficient) for d, c in terms[1:]), 0.)
+        for node, first, last, value in self.deck.boundaries:
+            for label in self.nodes_of(node):
+                for direction in range(first, last + 1):
+                    dependent[self.dof(label, direction)] = ({}, value)
+        if not self.deck.boundaries:
+            self.suppress_rigid_body_motion(dependent)
+        #
+        # resolve dependent degrees of freedom used in other equations
+        for sweep in range(100):
+            changed = False
+            for d, (expression, constant) in dependent.items():
+                if not any(i in dependent for i in expression):
+                    continue
+                changed = True
+                new_expression = {}
+                for i, c in expression.items():
+                    if i in dependent:
+                        sub_expression, sub_constant = dependent[i]
+                        constant += c * sub_constant
+                        for j, cj in sub_expression.items():
+                            new_expression[j] = new_expression.get(j, 0.) + c * cj
+                    else:
+                        new_expression[i] = new_expression.get(i, 0.) + c
+                dependent[d] = (new_expression, constant)
+            if not changed:
+                break
+        else:
+            raise ValueError('cyclic equations')
+        #
+        independent = np.ones(self.n_dofs, dtype=bool)
+        independent[list(dependent)] = False
+        reduced_index = -np.ones(self.n_dofs, dtype=np.int64)
+        reduced_index[independent] = np.arange(independent.sum())
+        rows = list(np.flatnonzero(independent))
+        cols = list(reduced_index[independent])
+        values = [1.] * len(rows)
+        g = np.zeros(self.n_dofs)
+        for d, (expression, constant) in dependent.items():
+            g[d] = constant
+            for i, c in expression.items():
+                rows.append(d)
+                cols.append(reduced_index[i])
+                values.append(c)
+        T = sparse.coo_matrix((values, (rows, cols)), shape=(self.n_dofs, int(independent.sum()))).tocsr()
+        return T, g
+
+    def suppress_rigid_body_motion(self, dependent):
+        """ fixes the translations of the corner node with the smallest coordinates. Without
+        equations, i.e. without periodicity, the rotations are fixed at the nodes with the
+        largest x and y coordinate as well (3-2-1 support) """
+        used = np.unique(np.concatenate([nodes.ravel() for element_type, nodes, sections in self.blocks]))
+        free = [n for n in used if not any(3 * n + k in dependent for k in range(3))]
+        X = self.deck.coordinates[free]
+        supports = [(free[np.argmin(X.sum(axis=1))], (0, 1, 2))]
+        if not self.deck.equations:
+            supports.append((free[np.argmax(X[:, 0])], (1, 2)))
+            supports.append((free[np.argmax(X[:, 1])], (2,)))
+        for node, directions in supports:
+            for k in directions:
+                dependent[3 * node + k] = ({}, 0.)
+
+    # -----< solution >-------------------------------------------------------------------#
+
+    def reduce(self, K, f, active=None):
+        """ returns the reduced system and the reduced degrees of freedom with stiffness.
+        'active' gives these degrees of freedom, e.g. of the base state, for a change of
+        the system """
+        K_reduced = (self.T.T * K * self.T).tocsr()
+        f_reduced = self.T.T * (f - K * self.g)
+        if active is None:
+            active = np.flatnonzero(K_reduced.diagonal() != 0.)
+        return K_reduced[active][:, active], f_reduced[active], active
+
+    def expand(self, u_active, active):
+        u_reduced = np.zeros(self.T.shape[1])
+        u_reduced[active] = u_active
+        return self.T * u_reduced + self.g
+
+    def solve(self, materials=None):
+        """ solves the model and returns its OdbSummary """
+        D, eps = self.section_properties(materials)
+        K, f = self.assemble(D, eigenstresses(D, eps))
+        K_active, f_active, active = self.reduce(K, f)
+        u = self.expand(factorize(K_active)(f_active), active)
+        return self.summary(u, D, eps, materials)
+
+    def section_integrals(self, u, D, eps):
+        """ volume, strain energy 1/2 (e - e*) : C : (e - e*) and integrated global stress
+        [S11, S22, S33, S12, S13, S23] of every section """
+        n_sections = len(self.set_names)
+        volumes = np.zeros(n_sections)
+        energies = np.zeros(n_sections)
+        stresses = np.zeros((n_sections, 6))
+        for dofs, sections, B, wdet in self.operators():
+            De = D[sections]
+            elastic = np.einsum('egia,ea->egi', B, u[dofs]) - eps[sections][:, np.newaxis, :]
+            sigma = np.einsum('eij,egj->egi', De, elastic)
+            energies += np.bincount(sections, weights=0.5 * np.einsum('egi,egi,eg->e', elastic, sigma, wdet),
+                                    minlength=n_sections)
+            volumes += np.bincount(sections, weights=wdet.sum(axis=1), minlength=n_sections)
+            for i in range(6):
+                stresses[:, i] += np.bincount(sections, weights=np.einsum('eg,eg->e', sigma[:, :, i], wdet),
+                                              minlength=n_sections)
+        return volumes, energies, stresses
+
+    def summary(self, u, D, eps, materials=None):
+        """ strain energy, volume and volume averaged stress in the local orientation of
+        every section """
+        volumes, energies, stresses = self.section_integrals(u, D, eps)
+        stresses /= np.where(volumes > 0, volumes, 1.)[:, np.newaxis]
+        # Q^T sigma Q of all sections
+        Q = np.swapaxes(np.array(self.rotations, dtype=float), 1, 2)
+        mean_stresses = mathutils.matrix_elements(mathutils.rotate_matrices(mathutils.fill_matrices(stresses), Q))
+        materials = self.materials if materials is None else materials
+        return odbreader.OdbSummary(energies.sum(), self.set_names, materials, volumes, energies, mean_stresses)
+
+    def unit_loads(self, D, sections):
+        """ the loads of unit eigenstrains in the given sections as a sparse (n_dofs, 6 * ns)
+        matrix, column 6 * i + j belongs to the Voigt component j in sections[i] """
+        column_of = -np.ones(len(self.set_names), dtype=np.int64)
+        column_of[sections] = 6 * np.arange(len(sections))
+        rows, cols, values = [], [], []
+        for dofs, chunk_sections, B, wdet in self.operators():
+            columns = column_of[chunk_sections]
+            inside = columns >= 0
+            if not inside.any():
+                continue
+            fe = np.einsum('eg,egia,eij->eaj', wdet[inside], B[inside], D[chunk_sections[inside]])
+            rows.append(np.repeat(dofs[inside][:, :, np.newaxis], 6, axis=2).ravel())
+            cols.append((columns[inside][:, np.newaxis, np.newaxis] + np.arange(6) +
+                         np.zeros(fe.shape, dtype=np.int64)).ravel())
+            values.append(fe.ravel())
+        return sparse.coo_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+                                 shape=(self.n_dofs, 6 * len(sections))).tocsr()
+
+
+# -----< candidates of an increment >------------------------------------------------------#
+
+# largest number of changed degrees of freedom for which a candidate is solved by an update
+# of the base factorization instead of a factorization of its own
+MAX_UPDATE_SIZE = 4000
+# right hand sides solved at once while the update of a grain is built
+UPDATE_BLOCK_SIZE = 256
+# bytes of the grain updates kept per base system, each holds three dense (s, s) matrices
+MAX_CACHED_UPDATE_BYTES = 1 << 30
+
+# the factorized base system of the current increment, replaced by the next increment's
+_base_cache = {}
+
+
+class GrainUpdate(object):
+    """ the change of the base system if one grain transforms. All laminates share the
+    martensite stiffness, so the stiffness change A on the degrees of freedom S of the grain
+    is the same for every laminate, only the eigenstrain load differs. With Z = (K^-1)_SS
+    the Woodbury identity gives the solution of (K + P A P^T) u = f + df as
+        u = y + K^-1 P (df_S - w),  w = (I + A Z)^-1 A (y_S + Z df_S),  y = K^-1 f
+    i.e. one solve with the base factor per candidate. The update holds the three dense
+    (s, s) matrices A, Z and the LU factorization of I + A Z. The stiffness change also
+    changes the load of the prescribed displacements g by -dK g, which is kept as well. """
+
+    def __init__(self, base, section, material_name):
+        model = base.model
+        D = np.zeros_like(base.D)
+        D_candidate, eps = model.section_properties(base.replaced(section, material_name))
+        D[section] = D_candidate[section] - base.D[section]
+        dK, df = model.assemble(D, np.zeros_like(base.eps), [section])
+        # without an eigenstress the reduced load is the term -T^T dK g of the prescribed
+        # displacements
+        dK_active, self.prescribed_load, active = model.reduce(dK, df, base.active)
+        dK_active = dK_active.tocoo()
+        self.dofs = np.unique(np.concatenate([dK_active.row, dK_active.col]))
+        self.section = section
+        self.A = dK_active.tocsr()[self.dofs][:, self.dofs].toarray()
+        # (I + A Z) w = A y_S is solved with a factorization for every laminate
+        self.Z = base.columns_of_inverse(self.dofs)
+        self.lu = linalg.lu_factor(np.identity(len(self.dofs)) + np.dot(self.A, self.Z))
+        self.nbytes = self.A.nbytes + self.Z.nbytes + self.lu[0].nbytes
+
+    def solve(self, base, df_active):
+        """ the active degrees of freedom of the candidate with the load change df """
+        outside = np.ones(len(df_active), dtype=bool)
+        outside[self.dofs] = False
+        if outside.any() and np.abs(df_active[outside]).max() > 0.:
+            raise ValueError('the load change exceeds the degrees of freedom of the grain')
+        df_S = df_active[self.dofs]
+        w = linalg.lu_solve(self.lu, np.dot(self.A, base.y[self.dofs] + np.dot(self.Z, df_S)))
+        rhs = np.zeros(len(df_active))
+        rhs[self.dofs] = df_S - w
+        return base.y + base.solve(rhs)
+
+
+class BaseSystem(object):
+    """ the system of an increment in which every grain that is still austenite is
+    austenite. It is factorized once and every candidate of the increment is solved as an
+    update of it (see GrainUpdate) """
+
+    def __init__(self, model, materials):
+        self.model = model
+        self.materials = list(materials)
+        self.D, self.eps = model.section_properties(self.materials)
+        K, f = model.assemble(self.D, eigenstresses(self.D, self.eps))
+        K_active, f_active, self.active = model.reduce(K, f)
+        self.solve = factorize(K_active)
+        self.y = self.solve(f_active)
+        self.updates = []  # (section, GrainUpdate), most recently used last
+
+    def replaced(self, section, material_name):
+        materials = list(self.materials)
+        materials[section] = material_name
+        return materials
+
+    def columns_of_inverse(self, dofs):
+        """ (K^-1)[dofs][:, dofs], solved in blocks of unit vectors """
+        Z = np.empty((len(dofs), len(dofs)))
+        for start in range(0, len(dofs), UPDATE_BLOCK_SIZE):
+            block = dofs[start: start + UPDATE_BLOCK_SIZE]
+            E = np.zeros((len(self.active), len(block)))
+            E[block, np.arange(len(block))] = 1.
+            Z[:, start: start + len(block)] = self.solve(E)[dofs]
+        return Z
+
+    def update(self, section, material_name):
+        for index, (cached_section, grain_update) in enumerate(self.updates):
+            if cached_section == section:
+                self.updates.append(self.updates.pop(index))
+                return grain_update
+        grain_update = GrainUpdate(self, section, material_name)
+        self.updates.append((section, grain_update))
+        # the least recently used updates are dropped, the new one is always kept
+        while len(self.updates) > 1 and \
+                sum([cached_update.nbytes for _, cached_update in self.updates]) > MAX_CACHED_UPDATE_BYTES:
+            self.updates.pop(0)
+        return grain_update
+
+    def solve_candidate(self, section, material_name):
+        """ returns the OdbSummary of the candidate in which 'section' has 'material_name' """
+        model = self.model
+        materials = self.replaced(section, material_name)
+        D, eps = model.section_properties(materials)
+        grain_update = self.update(section, material_name)
+        # the base grain carries no eigenstrain, so the load change is the candidate's
+        # eigenstrain load and the change of the load of the prescribed displacements
+        df = model.assemble(D, eigenstresses(D, eps), [section])[1]
+        df_active = (model.T.T * df)[self.active] + grain_update.prescribed_load
+        u = model.expand(grain_update.solve(self, df_active), self.active)
+        return model.summary(u, D, eps, materials)
+
+
+def base_system(model, materials):
+    """ the cached base system of these materials. The cache holds the base of one
+    increment, it is evicted when the base of the next increment is requested. The
+    returned base may hold an earlier, equal model """
+    key = model.state_key(materials)
+    if key not in _base_cache:
+        _base_cache.clear()
+        _base_cache[key] = BaseSystem(model, materials)
+    return _base_cache[key]
+
+
+class InteractionMatrix(object):
+    """ the strain energy of eigenstrains added to the grains of a fixed stiffness state.
+    With the changes de of the global eigenstrains (6 Voigt components per grain)
+        E = E0 + b . de + 1/2 de . M . de
+    where b_g = -V_g sigma_g is the negative integrated stress of grain g in the base state
+    and M_gh = delta_gh V_g D_g - F_g^T K^-1 F_h with the loads F_g of unit eigenstrains.
+    Since one grain transforms per candidate only the 6x6 blocks M_gg are computed, six
+    solves per grain. The stiffness change of a transforming grain is not contained, the
+    energies are estimates to rank the candidates. """
+
+    def __init__(self, base, sections):
+        model = base.model
+        self.sections = list(sections)
+        u = model.expand(base.y, base.active)
+        volumes, energies, stresses = model.section_integrals(u, base.D, base.eps)
+        self.energy = energies.sum()
+        self.b = -stresses[self.sections]
+        #
+        F = (model.T.T * model.unit_loads(base.D, self.sections)).tocsc()[base.active]
+        G = len(self.sections)
+        grains_per_block = max(1, UPDATE_BLOCK_SIZE // 6)
+        self.M_gg = np.empty((G, 6, 6))
+        for start in range(0, G, grains_per_block):
+            count = min(grains_per_block, G - start)
+            F_block = F[:, 6 * start: 6 * (start + count)]
+            FKF = (F_block.T * base.solve(F_block.toarray())).reshape(count, 6, count, 6)
+            self.M_gg[start: start + count] = -FKF[np.arange(count), :, np.arange(count), :]
+        for i, section in enumerate(self.sections):
+            self.M_gg[i] += volumes[section] * base.D[section]
+        self.rotations = np.array([model.rotations[section] for section in self.sections])
+
+    def strain_changes(self, laminates):
+        """ global Voigt eigenstrains (grains, laminates, 6) of the given laminates """
+        transforming_strains = material.eigenstrains()
+        eps = np.array([transforming_strains[laminate - 1] for laminate in laminates], dtype=float)
+        Q = self.rotations[:, np.newaxis]
+        return voigt_strain(mathutils.rotate_matrices(eps[np.newaxis], Q))
+
+    def energies(self, laminates):
+        """ estimated total strain energy (grains, laminates) if one grain transforms """
+        de = self.strain_changes(laminates)
+        return self.energy + np.einsum('gi,gki->gk', self.b, de) + \
+               0.5 * np.einsum('gki,gij,gkj->gk', de, self.M_gg, de)
+
+
+def interaction_matrix(inputname, grain_nr, grain_nrs):
+    """ the InteractionMatrix of the grains 'grain_nrs' for the stiffness state of a
+    candidate deck with 'grain_nr' reset to austenite. It is cached with the base system """
+    model = Model(deckparser.parse(inputname))
+    materials = list(model.materials)
+    materials[model.section_of_grain(grain_nr)] = 'AUSTENITE'
+    base = base_system(model, materials)
+    sections = [base.model.section_of_grain(nr) for nr in grain_nrs]
+    if getattr(base, 'interaction', None) is None or base.interaction.sections != sections:
+        base.interaction = InteractionMatrix(base, sections)
+    return base.interaction
+
+
+class CandidateSolver(object):
+    """ solves the candidate jobs of an increment in this process, reusing the base
+    factorization for every candidate (see BaseSystem). It runs the jobs like
+    jobpool.JobPool.run and writes the same outputs as the script. Candidates whose grain
+    has more than 'max_update_size' changed degrees of freedom get a factorization of their
+    own. """
+
+    def __init__(self, max_update_size=MAX_UPDATE_SIZE):
+        self.max_update_size = max_update_size
+        self.model = None
+        self.skipped = []
+
+    def solve(self, job):
+        model = self.model
+        if model is None:
+            model = self.model = Model(deckparser.parse(job.inputname))
+            # the deck of the first job holds its own grain as laminate, the base state
+            # has it as austenite like all other candidates
+            self.base_materials = list(model.materials)
+            self.base_materials[model.section_of_grain(job.grain_nr)] = 'AUSTENITE'
+        base = base_system(model, self.base_materials)
+        model = base.model
+        section = model.section_of_grain(job.grain_nr)
+        material_name = 'LAMINATE' + str(job.laminate)
+        if 3 * len(model.section_nodes(section)) > self.max_update_size:
+            return model.solve(base.replaced(section, material_name))
+        return base.solve_candidate(section, material_name)
+
+    def run(self, jobs, on_complete=None, should_stop=None, on_launch=None, admit=None):
+        """ solves the jobs in the given order and returns them. 'on_complete',
+        'should_stop' and 'on_launch' are used like in jobpool.JobPool.run. 'admit' is not
+        needed, the outputs of a job are evaluated before the next one is solved """
+        queue = list(jobs)
+        for job in queue:
+            job.queue_time = time.time()
+        finished = []
+        self.skipped = []
+        while queue:
+            if should_stop is not None and should_stop(queue):
+                for job in queue:
+                    job.status = 'skipped'
+                self.skipped = queue
+                break
+            job = queue.pop(0)
+            job.start_time = time.time()
+            cpu_start = sum(os.times()[0:2])
+            job.status = 'running'
+            if on_launch is not None:
+                on_launch(job)
+            try:
+                write_outputs(job.outputname, self.solve(job))
+                job.returncode = 0
+                job.status = 'completed'
+            except Exception as error:
+                print('job ' + job.outputname + ' failed: ' + str(error))
+                with open(job.outputname + '.sta', 'w') as sta:
+                    sta.write(' THE ANALYSIS HAS NOT BEEN COMPLETED\n')
+                job.returncode = 1
+                job.status = 'failed'
+            job.end_time = time.time()
+            job.cpu_time = sum(os.times()[0:2]) - cpu_start
+            finished.append(job)
+            if on_complete is not None:
+                on_complete(job)
+        return finished
+
+
+# -----< job interface >-------------------------------------------------------------------#
+
+def write_outputs(jobname, summary):
+    """ writes the per-set values, the model data and ALLIE to the .dat file in the form
+    read by datreader, and the completion status to the .sta file """
+    with open(jobname + '.dat', 'w') as dat:
+        dat.write('\n                              N A T I V E   S O L V E R\n\n')
+        dat.write(' ELEMENT SET\t\tMATERIAL\t\tVOLUME\t\tSTRAIN ENERGY\n')
+        for set_name, material_name, volume, energy in zip(summary.set_names, summary.materials,
+                                                           summary.volumes, summary.strain_energies):
+            dat.write(' ' + set_name + '\t\t' + material_name + '\t\t' + '{0:.6e}'.format(volume) + '\t' +
+                      '{0:.6e}'.format(energy) + '\n')
+        dat.write('\n MODEL DATA\t' + '\t'.join(['{0:.6e}'.format(value) for value in summary.model_data()]) + '\n')
+        dat.write(' INTERNAL ENERGY (ALLIE)\t' + '{0:.9e}'.format(summary.allie) + '\n')
+    with open(jobname + '.sta', 'w') as sta:
+        sta.write(' THE ANALYSIS HAS COMPLETED SUCCESSFULLY\n')
+
+
+def run_job(jobname, inputname):
+    """ solves an input deck like a standard solver job """
+    try:
+        summary = Model(deckparser.parse(inputname)).solve()
+    except Exception:
+        with open(jobname + '.sta', 'w') as sta:
+            sta.write(' THE ANALYSIS HAS NOT BEEN COMPLETED\n')
+        raise
+    write_outputs(jobname, summary)
+    return summary
+
+
+if __name__ == '__main__':
+    arguments = dict(argument.split('=', 1) for argument in sys.argv[1:] if '=' in argument)
+    run_job(arguments['job'], arguments['input'])
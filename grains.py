@@ -0,0 +1,131 @@
+""" This module holds the grain registry: the state of all grains of the RVE as columns of
+one structured NumPy array instead of the lists 'austenite_grains' ([grainNr, grainvolume,
+grainmaterial]) and 'martensite_grains' ([grainNr, laminate]). A grain is found by its
+number in a dict, so the transformation of a grain only changes one record. The specific
+interface energy barrier (material.calc_draggingForces) is calculated once per grain.
+The lists are still available for the input file creation and the candidate space. """
+
+import numpy as np
+# my modules
+import material
+
+AUSTENITE = 0
+MARTENSITE = 1
+
+# one record per grain. 'order' is the increment in which the grain transformed (-1 if it
+# did not), 'orientation' holds the two orientation vectors of the random microstructure
+GRAIN_DTYPE = [('id', '<i4'), ('volume', '<f8'), ('phase', 'i1'), ('laminate', 'i1'), ('order', '<i4'),
+               ('drag', '<f8'), ('orientation', '<f8', (2, 3))]
+
+
+class GrainRegistry(object):
+    """ the grains of the RVE with numbers 'ids', volumes 'volumes' and optionally the
+    orientations (grains, 2, 3) used for the self consistent matrix """
+
+    def __init__(self, ids, volumes, orientations=None, records=None):
+        if records is None:
+            records = np.zeros(len(ids), dtype=GRAIN_DTYPE)
+            records['id'] = ids
+            records['volume'] = volumes
+            records['phase'] = AUSTENITE
+            records['order'] = -1
+            records['drag'] = [material.calc_draggingForces(volume) if volume > 0 else np.nan
+                               for volume in records['volume']]
+            if orientations is not None:
+                records['orientation'] = np.asarray(orientations, dtype=float).reshape(len(ids), 2, 3)
+        self.records = records
+        self.row = dict((int(nr), i) for i, nr in enumerate(records['id']))
+        self.transformed = int((records['phase'] == MARTENSITE).sum())
+
+    @classmethod
+    def from_lists(cls, austenite_grains, martensite_grains, orientations=None):
+        """ the registry of the lists of a snapshot written before the registry existed.
+        The volumes of the transformed grains were not saved and are unknown (NaN) """
+        ids = [grain[0] for grain in austenite_grains] + [grain[0] for grain in martensite_grains]
+        volumes = [grain[1] for grain in austenite_grains] + [np.nan] * len(martensite_grains)
+        order = np.argsort(ids, kind='mergesort')
+        if orientations is not None and len(orientations) != len(ids):
+            orientations = None
+        registry = cls(np.array(ids)[order], np.array(volumes, dtype=float)[order], orientations)
+        for nr, laminate in martensite_grains:
+            registry.transform(nr, laminate)
+        return registry
+
+    def __len__(self):
+        return len(self.records)
+
+    # -----< columns >---------------------------------------------------------------------#
+
+    @property
+    def ids(self):
+        return self.records['id']
+
+    @property
+    def volumes(self):
+        return self.records['volume']
+
+    @property
+    def phases(self):
+        return self.records['phase']
+
+    @property
+    def laminates(self):
+        return self.records['laminate']
+
+    @property
+    def drag(self):
+        return self.records['drag']
+
+    def orientations(self):
+        """ the orientations (grains, 2, 3), None if they were not given """
+        if not self.records['orientation'].any():
+            return None
+        return self.records['orientation']
+
+    # -----< single grains >---------------------------------------------------------------#
+
+    def volume(self, grain_nr):
+        return float(self.records['volume'][self.row[grain_nr]])
+
+    def drag_energy(self, grain_nr):
+        """ the specific interface energy barrier of a grain """
+        return float(self.records['drag'][self.row[grain_nr]])
+
+    def austenite_grain(self, grain_nr):
+        """ the record [grainNr, grainvolume, grainmaterial] of a not transformed grain """
+        return [int(grain_nr), self.volume(grain_nr), 'AUSTENITE']
+
+    def transform(self, grain_nr, laminate):
+        """ the grain transforms to the laminate in the next increment """
+        i = self.row[grain_nr]
+        if self.records['phase'][i] == MARTENSITE:
+            raise ValueError('grain ' + str(grain_nr) + ' is already transformed')
+        self.records['phase'][i] = MARTENSITE
+        self.records['laminate'][i] = laminate
+        self.records['order'][i] = self.transformed
+        self.transformed += 1
+
+    # -----< lists >-----------------------------------------------------------------------#
+
+    def austenite_rows(self):
+        return np.flatnonzero(self.records['phase'] == AUSTENITE)
+
+    def austenite_grains(self):
+        """ [grainNr, grainvolume, grainmaterial] of the not transformed grains """
+        rows = self.austenite_rows()
+        return [[int(nr), float(volume), 'AUSTENITE']
+                for nr, volume in zip(self.records['id'][rows], self.records['volume'][rows])]
+
+    def graindata(self):
+        """ [grainNr, grainvolume, grainmaterial] of all grains, the material of a
+        transformed grain is its laminate """
+        return [[int(nr), float(volume), 'AUSTENITE' if phase == AUSTENITE else 'LAMINATE' + str(laminate)]
+                for nr, volume, phase, laminate in zip(self.records['id'], self.records['volume'],
+                                                       self.records['phase'], self.records['laminate'])]
+
+    def martensite_grains(self):
+        """ [grainNr, laminate] of the transformed grains in the order they transformed """
+        rows = np.flatnonzero(self.records['phase'] == MARTENSITE)
+        rows = rows[np.argsort(self.records['order'][rows])]
+        return [[int(nr), int(laminate)] for nr, laminate in zip(self.records['id'][rows],
+                                                                  self.records['laminate'][rows])]
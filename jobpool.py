@@ -0,0 +1,334 @@
+""" This module holds a pool of solver jobs. A fixed number of slots is kept busy: as soon
+as any job ends the next one from the queue is started. Each job is watched with its own
+timeout and only the process tree of that job is killed when it is exceeded. Solve times
+of finished jobs are recorded so that later increments can queue the longest jobs first."""
+
+import cPickle as pickle
+import glob
+import os
+import signal
+import socket
+import subprocess
+import time
+import psutil  # library for retrieving information on running processes
+
+ABAQUS_COMMAND = '/opt/abaqus/Commands/abq6123'
+# python with NumPy and SciPy for the native solver backend, see fesolver
+PYTHON_COMMAND = 'python'
+FESOLVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fesolver.py')
+# the stand-in solver of the benchmark, see benchmark
+BENCHMARK_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark.py')
+SOLVE_TIMES_FILENAME = 'saves/solve_times'
+CONCURRENCY_FILENAME = 'saves/concurrency'
+# concurrent solves of a calibration split, e.g. the license tokens available for them.
+# Splits with more jobs are not calibrated, so every split runs at most this many solves
+CALIBRATION_MAX_JOBS = 8
+
+
+class Job(object):
+    """ a single candidate calculation: grain 'grain_nr' transforms to 'laminate' in the
+    increment 'martensite_amount' """
+
+    def __init__(self, martensite_amount, grain_nr, laminate, grain_volume=None):
+        self.martensite_amount = martensite_amount
+        self.grain_nr = grain_nr
+        self.laminate = laminate
+        self.grain_volume = grain_volume
+        suffix = str(martensite_amount) + '_' + str(grain_nr) + '_' + str(laminate)
+        self.inputname = 'Inputfile_' + suffix + '.inp'
+        self.outputname = 'Outputfile_' + suffix
+        # queued -> running -> completed | failed | timeout
+        self.status = 'queued'
+        self.returncode = None
+        self.process = None
+        self.queue_time = self.start_time = self.end_time = None
+        self.cpu_time = None  # cpu seconds of the solver processes, sampled while running
+
+    def key(self):
+        return self.grain_nr, self.laminate
+
+    def runtime(self):
+        """ wall clock time of the job in seconds (up to now if it is still running) """
+        if self.start_time is None:
+            return 0.
+        end_time = self.end_time if self.end_time is not None else time.time()
+        return end_time - self.start_time
+
+    def command(self, cpus=2, mp_mode='threads', scratch='/dev/shm', backend='abaqus'):
+        """ the command line invoking the standard solver, the native solver if 'backend'
+        is 'native' or the stand-in solver of the benchmark if it is 'fake', for this job """
+        if backend == 'native':
+            return [PYTHON_COMMAND, FESOLVER_SCRIPT, 'job=' + self.outputname, 'input=' + self.inputname]
+        if backend == 'fake':
+            return [PYTHON_COMMAND, BENCHMARK_SCRIPT, 'solve', 'job=' + self.outputname, 'input=' + self.inputname]
+        return [ABAQUS_COMMAND, 'job=' + self.outputname, 'interactive', 'cpus=' + str(cpus),
+                'scratch=' + scratch, 'input=' + self.inputname, 'mp_mode=' + mp_mode,
+                'standard_parallel=all']
+
+
+def kill_process_tree(pid):
+    """ kills the process 'pid' together with all of its descendants, e.g. the abaqus
+    driver and the standard.exe it started, without touching any other job """
+    try:
+        parent = psutil.Process(pid)
+        processes = parent.children(recursive=True) + [parent]
+    except psutil.NoSuchProcess:
+        processes = []
+    for process in processes:
+        try:
+            process.kill()
+        except psutil.NoSuchProcess:
+            pass
+    psutil.wait_procs(processes, timeout=30)
+    # the job was started in its own session, remove whatever is left of the group
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+class SolveTimes(object):
+    """ solve times of earlier increments, used to estimate how long a job will take.
+    The file holds one line per finished job: incrementNr grainNr laminateNr solveTime """
+
+    def __init__(self, filename=SOLVE_TIMES_FILENAME):
+        self.filename = filename
+        self.times = {}  # (grainNr, laminate) -> latest solve time
+        if os.path.isfile(filename):
+            with open(filename, 'r') as solve_times:
+                for index, line in enumerate(solve_times):
+                    if index == 0:
+                        continue  # ignore the headerline
+                    data = line.split()
+                    self.times[(int(data[1]), int(data[2]))] = float(data[3])
+
+    def estimate(self, job):
+        """ latest solve time of the same candidate, else the mean of the same grain,
+        else the mean of all known jobs """
+        if job.key() in self.times:
+            return self.times[job.key()]
+        same_grain = [t for (grain_nr, laminate), t in self.times.items() if grain_nr == job.grain_nr]
+        if same_grain:
+            return sum(same_grain) / len(same_grain)
+        if self.times:
+            return sum(self.times.values()) / len(self.times)
+        return 0.
+
+    def order_longest_first(self, jobs):
+        """ returns the jobs sorted by descending estimated solve time. Starting the long
+        jobs first keeps a single slow candidate from becoming the tail of the increment """
+        return sorted(jobs, key=self.estimate, reverse=True)
+
+    def record(self, jobs):
+        """ appends the solve times of the finished jobs to the file """
+        write_header = not os.path.isfile(self.filename)
+        with open(self.filename, 'a') as solve_times:
+            if write_header:
+                solve_times.write('incrementNr\tgrainNr\tlaminateNr\tsolveTime\tstatus\n')
+            for job in jobs:
+                if job.start_time is None:
+                    continue
+                self.times[job.key()] = job.runtime()
+                solve_times.write(str(job.martensite_amount) + '\t' + str(job.grain_nr) + '\t' +
+                                  str(job.laminate) + '\t' + '{0:.1f}'.format(job.runtime()) +
+                                  '\t' + job.status + '\n')
+
+
+class JobPool(object):
+    """ runs jobs with at most 'slots' of them at the same time. A free slot is refilled
+    as soon as any job ends and every job is killed on its own after 'timeout' seconds """
+
+    def __init__(self, slots=6, timeout=1200, cpus=2, mp_mode='threads', scratch='/dev/shm',
+                 poll_interval=1., backend='abaqus'):
+        self.slots = slots
+        self.timeout = timeout
+        self.cpus = cpus
+        self.mp_mode = mp_mode
+        self.scratch = scratch
+        self.poll_interval = poll_interval
+        self.backend = backend
+
+    def launch(self, job):
+        """ starts the solver for the job in a new session so that its process tree can
+        be killed as a whole """
+        environment = dict(os.environ)
+        # the native solver uses the threads of the BLAS behind NumPy and SciPy
+        environment['OMP_NUM_THREADS'] = str(self.cpus)
+        job.process = subprocess.Popen(job.command(self.cpus, self.mp_mode, self.scratch, self.backend),
+                                       preexec_fn=os.setsid, env=environment)
+        job.start_time = time.time()
+        job.status = 'running'
+
+    def sample_cpu_time(self, job):
+        """ cpu seconds of the job's process tree so far """
+        try:
+            parent = psutil.Process(job.process.pid)
+            processes = parent.children(recursive=True) + [parent]
+            cpu_time = 0.
+            for process in processes:
+                times = process.cpu_times()
+                cpu_time += times.user + times.system
+        except psutil.Error:
+            return  # the job has just ended, keep the last sample
+        job.cpu_time = max(cpu_time, job.cpu_time or 0.)
+
+    def check(self, job, now):
+        """ updates the status of a running job, returns True if the job has ended """
+        self.sample_cpu_time(job)
+        returncode = job.process.poll()
+        if returncode is not None:
+            job.returncode = returncode
+            job.status = 'completed' if returncode == 0 else 'failed'
+        elif now - job.start_time > self.timeout:
+            print('job ' + job.outputname + ' running after timeout, killing its processes...')
+            kill_process_tree(job.process.pid)
+            job.process.wait()
+            job.status = 'timeout'
+        else:
+            return False
+        job.end_time = now
+        return True
+
+    def run(self, jobs, on_complete=None, should_stop=None, on_launch=None, admit=None):
+        """ runs all jobs in the given order and returns them once every job has ended.
+        'on_complete' is called with each job right after it has ended, 'on_launch' right
+        after it was started. 'should_stop' is asked with the queued jobs before a job is
+        launched; once it returns True no further job is launched and the queued jobs are
+        kept in 'skipped'. While 'admit' returns False no further job is launched as long
+        as others are running, e.g. to wait for disk space (see retention) """
+        queue = list(jobs)
+        queue.reverse()  # pop from the end keeps the given order
+        for job in queue:
+            job.queue_time = time.time()
+        running = []
+        finished = []
+        self.skipped = []
+        try:
+            while queue or running:
+                while queue and len(running) < self.slots:
+                    if admit is not None and running and not admit():
+                        break
+                    if should_stop is not None and should_stop(queue):
+                        for job in queue:
+                            job.status = 'skipped'
+                        self.skipped = queue[::-1]
+                        queue = []
+                        break
+                    job = queue.pop()
+                    self.launch(job)
+                    running.append(job)
+                    if on_launch is not None:
+                        on_launch(job)
+                if not running:
+                    break
+                time.sleep(self.poll_interval)
+                now = time.time()
+                for job in list(running):
+                    if self.check(job, now):
+                        running.remove(job)
+                        finished.append(job)
+                        if on_complete is not None:
+                            on_complete(job)
+        finally:
+            # do not leave orphaned solvers behind if the driver itself is interrupted
+            for job in running:
+                kill_process_tree(job.process.pid)
+        return finished
+
+
+def job_runner(backend='abaqus', timeout=1200, slots=6, cpus=2, mp_mode='threads'):
+    """ the runner of the candidate jobs of a 'backend': a JobPool of the standard solver
+    ('abaqus'), of the native solver of fesolver run as separate jobs ('native') or of the
+    stand-in solver of the benchmark ('fake'), fesolver's CandidateSolver in this process,
+    which reuses one factorization for all candidates ('native-update'), or the workers of
+    the distributed coordinator ('distributed'). All of them run jobs like JobPool.run.
+    'timeout' is the time in seconds a single job may run before it is killed """
+    if backend == 'native-update':
+        import fesolver  # needs SciPy in this interpreter
+        return fesolver.CandidateSolver()
+    if backend == 'distributed':
+        import distributed
+        return distributed.coordinator(timeout)
+    return JobPool(slots=slots, timeout=timeout, cpus=cpus, mp_mode=mp_mode, backend=backend)
+
+
+# -----< calibration of the number of concurrent jobs and cpus per job >------------------#
+
+def host_key():
+    """ identifies the machine the jobs run on """
+    return socket.gethostname() + '_' + str(psutil.cpu_count(logical=False) or psutil.cpu_count())
+
+
+def candidate_splits(cores, max_jobs=CALIBRATION_MAX_JOBS):
+    """ the (jobs, cpus) splits of the given cores where cpus is a power of two and at
+    most 'max_jobs' jobs run at the same time """
+    splits = []
+    cpus = 1
+    while cpus <= cores:
+        if cores // cpus <= max_jobs:
+            splits.append((cores // cpus, cpus))
+        cpus *= 2
+    return splits
+
+
+class ConcurrencySettings(object):
+    """ the calibrated (jobs, cpus) split, stored per mesh and host in a small pickle """
+
+    def __init__(self, filename=CONCURRENCY_FILENAME):
+        self.filename = filename
+        self.settings = {}
+        if os.path.isfile(filename):
+            with open(filename, 'rb') as f:
+                self.settings = pickle.load(f)
+
+    def get(self, mesh_key, default=None):
+        return self.settings.get((mesh_key, host_key()), default)
+
+    def set(self, mesh_key, split):
+        self.settings[(mesh_key, host_key())] = split
+        with open(self.filename, 'wb') as f:
+            pickle.dump(self.settings, f)
+
+
+def calibrate(jobs, timeout=1200, mp_mode='threads', scratch='/dev/shm', samples=3, splits=None,
+              backend='abaqus', max_jobs=CALIBRATION_MAX_JOBS, on_launch=None):
+    """ runs the input files of a few representative jobs at different (jobs, cpus) splits
+    and returns the split with the highest throughput in jobs per hour. The jobs are taken
+    evenly spread over the given list, which is ordered by estimated solve time. For every
+    split as many copies as there are slots are run at the same time, so that the
+    measured throughput includes the contention of a fully loaded host. Splits of more
+    than 'max_jobs' slots are not run. 'on_launch' is called with every calibration job
+    that is started, so the caller can count them against the jobs of a session """
+    if splits is None:
+        splits = candidate_splits(psutil.cpu_count(logical=False) or psutil.cpu_count(), max_jobs)
+    splits = [(slots, cpus) for slots, cpus in splits if slots <= max_jobs]
+    samples = min(samples, len(jobs))
+    if not samples:
+        return None
+    step = float(len(jobs)) / samples
+    representatives = [jobs[int(i * step)] for i in range(samples)]
+    #
+    best_split = None
+    best_throughput = 0.
+    for slots, cpus in splits:
+        calibration_jobs = []
+        for i in range(slots):
+            template = representatives[i % samples]
+            job = Job(template.martensite_amount, template.grain_nr, template.laminate, template.grain_volume)
+            job.outputname = 'Calibration_' + str(slots) + 'x' + str(cpus) + '_' + str(i)
+            calibration_jobs.append(job)
+        pool = JobPool(slots=slots, timeout=timeout, cpus=cpus, mp_mode=mp_mode, scratch=scratch,
+                       backend=backend)
+        start = time.time()
+        finished = pool.run(calibration_jobs, on_launch=on_launch)
+        completed = len([job for job in finished if job.status == 'completed'])
+        throughput = completed * 3600. / (time.time() - start)
+        print('calibration: ' + str(slots) + ' jobs x ' + str(cpus) + ' cpus -> ' +
+              '{0:.1f}'.format(throughput) + ' jobs per hour')
+        if throughput > best_throughput:
+            best_split, best_throughput = (slots, cpus), throughput
+        # calibration outputs are not needed afterwards
+        for job in calibration_jobs:
+            for filename in glob.glob(job.outputname + '.*'):
+                os.remove(filename)
+    return best_split
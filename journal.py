@@ -0,0 +1,113 @@
+""" This module holds the journal of an increment. Every candidate's submission and
+evaluation is appended as one JSON line which is flushed to disk right away, so a driver
+that is restarted after a crash in the middle of an increment only solves the candidates
+that were not evaluated yet. A journal belongs to one state of the transformation: it is
+discarded if it was written for other transformed grains, and removed once the snapshot
+of the next increment is written or, after a crash in between, when the driver starts
+from that snapshot. A line that was cut off by the crash is dropped. """
+
+import glob
+import hashlib
+import json
+import os
+import time
+
+JOURNAL_VERSION = 1
+
+
+def journal_filename(martensite_amount):
+    return 'saves/journal_' + str(martensite_amount)
+
+
+def remove_stale(martensite_amount):
+    """ removes the journals of the increments before 'martensite_amount', the increment of
+    the snapshot. A driver that went down between writing the snapshot and removing the
+    journal leaves the journal of an increment that is saved already """
+    for filename in glob.glob(journal_filename('*')):
+        try:
+            increment = int(filename.rsplit('_', 1)[1])
+        except ValueError:
+            continue
+        if increment < martensite_amount:
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+
+def state_key(martensite_amount, martensite_grains):
+    """ identifies the state an increment starts from """
+    return hashlib.md5(repr((martensite_amount, martensite_grains)).encode('utf-8')).hexdigest()
+
+
+class Journal(object):
+    """ the journal of the increment 'martensite_amount' starting from 'state' (see
+    state_key). 'evaluated' holds {(grainNr, laminate): (status, total strain energy)} of
+    the candidates evaluated before a restart """
+
+    def __init__(self, martensite_amount, state):
+        self.filename = journal_filename(martensite_amount)
+        self.martensite_amount = martensite_amount
+        self.state = state
+        self.evaluated = {}
+        self.submitted = set()
+        valid = self.load()
+        self.journal = open(self.filename, 'r+' if valid else 'w')
+        # cut off a torn line or an outdated journal
+        self.journal.seek(valid)
+        self.journal.truncate()
+        if not valid:
+            self.record('start', state=state)
+
+    def load(self):
+        """ reads the records of the journal, returns the length of its valid part """
+        if not os.path.isfile(self.filename):
+            return 0
+        valid = 0
+        with open(self.filename, 'r') as journal:
+            for line in iter(journal.readline, ''):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # the last line was not written completely
+                if not line.endswith('\n'):
+                    break
+                if record.get('version') != JOURNAL_VERSION or \
+                        (record['event'] == 'start' and record['state'] != self.state):
+                    self.evaluated = {}
+                    self.submitted = set()
+                    return 0
+                key = (record.get('grain'), record.get('laminate'))
+                if record['event'] == 'submitted':
+                    self.submitted.add(key)
+                elif record['event'] == 'evaluated':
+                    self.evaluated[key] = (record['status'], record['energy'])
+                valid += len(line)
+        return valid
+
+    def record(self, event, **fields):
+        fields.update(event=event, version=JOURNAL_VERSION, increment=self.martensite_amount, time=time.time())
+        self.journal.write(json.dumps(fields, sort_keys=True) + '\n')
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+
+    def record_submission(self, job):
+        self.submitted.add(job.key())
+        self.record('submitted', grain=job.grain_nr, laminate=job.laminate)
+
+    def record_evaluation(self, job, total_strain_energy_cell):
+        """ the total strain energy of an evaluated job, None if it did not complete """
+        if total_strain_energy_cell is not None:
+            total_strain_energy_cell = float(total_strain_energy_cell)
+        self.evaluated[job.key()] = (job.status, total_strain_energy_cell)
+        self.record('evaluated', grain=job.grain_nr, laminate=job.laminate, status=job.status,
+                    energy=total_strain_energy_cell)
+
+    def close(self):
+        self.journal.close()
+
+    def remove(self):
+        """ removes the journal once the increment is saved in the snapshot """
+        self.close()
+        if os.path.isfile(self.filename):
+            os.remove(self.filename)
@@ -2,7 +2,9 @@
 all IEs constituting a part of the energy barrier in the transformation """
 
 import numpy as np  # used for a faster function of tensor rotation using outer products
+import hashlib
 import math
+import os
 # my modules
 import mathutils
 
@@ -22,7 +24,7 @@ def eigenstrains():
     e = [e1, e2, e3, e4, e5, e6]
     transforming_strains = []
     for i in e:
-        transforming_strains.append(mathutils.fillmatrix(i))
+        transforming_strains.append(mathutils.fillMatrix(i))
     return transforming_strains
 
 
@@ -67,12 +69,8 @@ def equal_lengths(volume):
     return diameter, surf
 
 
-def selfconsistent_matrix(oris, graindata, Vinner):
-    """This function averages anisotropic elastic constants ( refering to local coordinate
-    systems respectively) to global isotropic elastic constants considering phase fractions.
-    The nearly isotropic elastic constants are used as the matrix material property. In
-    micromechanics this is commonly called "self consistence scheme" """
-
+def austenite_stiffness():
+    """ returns the isotropic elastic constants of austenite as a fourth order tensor """
     #
     # define isotropic elastic constants for austenite
     e_aust = 70e-9
@@ -109,7 +107,23 @@ def selfconsistent_matrix(oris, graindata, Vinner):
     A1323 = A2313 = A3123 = A1332 = A3213 = A2331 = A3132 = A3231 = 0.
     A2323 = A3223 = A2332 = A3232 = prefactor_austenite * ((1 - 2 * poissons_ratio_aust) / 2)
 
-    # anisotropic elastic constants of martensite given in the basis of the tetragonal unit cell
+    #
+    Ca = [[[[A1111, A1112, A1113], [A1121, A1122, A1123], [A1131, A1132, A1133]],
+           [[A1211, A1212, A1213], [A1221, A1222, A1223], [A1231, A1232, A1233]],
+           [[A1311, A1312, A1313], [A1321, A1322, A1323], [A1331, A1332, A1333]]],
+          [[[A2111, A2112, A2113], [A2121, A2122, A2123], [A2131, A2132, A2133]],
+           [[A2211, A2212, A2213], [A2221, A2222, A2223], [A2231, A2232, A2233]],
+           [[A2311, A2312, A2313], [A2321, A2322, A2323], [A2331, A2332, A2333]]],
+          [[[A3111, A3112, A3113], [A3121, A3122, A3123], [A3131, A3132, A3133]],
+           [[A3211, A3212, A3213], [A3221, A3222, A3223], [A3231, A3232, A3233]],
+           [[A3311, A3312, A3313], [A3321, A3322, A3323], [A3331, A3332, A3333]]]]
+
+    return np.array(Ca)
+
+
+def martensite_stiffness():
+    """ returns the anisotropic elastic constants of martensite as a fourth order tensor,
+    given in the basis of the tetragonal unit cell """
     M1111 = 2.54e-07
     M1122 = M2211 = 1.04e-07
     M2222 = 1.8e-07
@@ -132,17 +146,6 @@ def selfconsistent_matrix(oris, graindata, Vinner):
     M1323 = M2313 = M3123 = M1332 = M3213 = M2331 = M3132 = M3231 = 0.
     M2323 = M3223 = M2332 = M3232 = 5.e-09
 
-    #
-    Ca = [[[[A1111, A1112, A1113], [A1121, A1122, A1123], [A1131, A1132, A1133]],
-           [[A1211, A1212, A1213], [A1221, A1222, A1223], [A1231, A1232, A1233]],
-           [[A1311, A1312, A1313], [A1321, A1322, A1323], [A1331, A1332, A1333]]],
-          [[[A2111, A2112, A2113], [A2121, A2122, A2123], [A2131, A2132, A2133]],
-           [[A2211, A2212, A2213], [A2221, A2222, A2223], [A2231, A2232, A2233]],
-           [[A2311, A2312, A2313], [A2321, A2322, A2323], [A2331, A2332, A2333]]],
-          [[[A3111, A3112, A3113], [A3121, A3122, A3123], [A3131, A3132, A3133]],
-           [[A3211, A3212, A3213], [A3221, A3222, A3223], [A3231, A3232, A3233]],
-           [[A3311, A3312, A3313], [A3321, A3322, A3323], [A3331, A3332, A3333]]]]
-
     #
     Cm = [[[[M1111, M1112, M1113], [M1121, M1122, M1123], [M1131, M1132, M1133]],
            [[M1211, M1212, M1213], [M1221, M1222, M1223], [M1231, M1232, M1233]],
@@ -154,23 +157,101 @@ def selfconsistent_matrix(oris, graindata, Vinner):
            [[M3211, M3212, M3213], [M3221, M3222, M3223], [M3231, M3232, M3233]],
            [[M3311, M3312, M3313], [M3321, M3322, M3323], [M3331, M3332, M3333]]]]
 
-    # create numpy arrays
-    Ca = np.array(Ca)
-    Cm = np.array(Cm)
-    C_ave = np.zeros((3, 3, 3, 3))
-    for i in range(len(graindata)):
-        # get rotationmatrix between local and global coordinate system.
-        rot_euler = np.array(mathutils.calc_rotmatrix_euler(oris[i][0], oris[i][1]))
-        # distinguish between austenite and martensite
-        if graindata[i][2] == 'AUSTENITE':
-            C = Ca
+    return np.array(Cm)
+
+
+# rotated elastic tensors of the grains, stored per set of orientations and stiffnesses
+ROTATED_STIFFNESS_FILENAME = 'saves/rotated_stiffness_{0}.npy'
+# relative deviation of the updated from the rebuilt average that is accepted
+UPDATE_TOLERANCE = 1e-10
+
+
+class SelfConsistentMatrix(object):
+    """ holds the average C_ave = sum_x[ (Vx/Vinner) * ( Rim Rjn Rkp Rlq Cmnpq ) ] of the
+    grains. The austenite and martensite tensors rotated to every grain orientation are
+    computed once and kept in a .npy file, which is memory-mapped when a new process
+    continues the run. The file is named by the md5 of the orientations and of the two
+    stiffness tensors, so a changed stiffness is rotated again. Since only one grain changes its phase per increment, C_ave is
+    updated by the change of that grain's contribution instead of summing all grains. """
+
+    def __init__(self, oris, filename=None):
+        self.oris = oris
+        self.stiffnesses = np.array([austenite_stiffness(), martensite_stiffness()], dtype=float)
+        md5 = hashlib.md5(repr([list(ori) for ori in oris]).encode('utf-8'))
+        md5.update(self.stiffnesses.tobytes())
+        key = md5.hexdigest()[:8]
+        self.filename = filename if filename is not None else ROTATED_STIFFNESS_FILENAME.format(key)
+        self.rotated = self.rotated_tensors()
+        self.C_ave = None
+        self.phases = None  # 0 for austenite, 1 for martensite of every grain
+        self.weights = None  # Vx/Vinner of every grain
+
+    def rotated_tensors(self):
+        """ (grains, 2, 3, 3, 3, 3) rotated austenite and martensite tensors """
+        if os.path.isfile(self.filename):
+            rotated = np.load(self.filename, mmap_mode='r')
+            if rotated.shape[0] == len(self.oris):
+                return rotated
+        # rotationmatrices between local and global coordinate system of all grains
+        rot_euler = mathutils.rotation_matrices_euler([ori[0] for ori in self.oris], [ori[1] for ori in self.oris])
+        rotated = np.empty((len(self.oris), 2, 3, 3, 3, 3))
+        for phase, C in enumerate(self.stiffnesses):
+            rotated[:, phase] = mathutils.rotate_elastic_tensors(C, rot_euler)
+        directory = os.path.dirname(self.filename)
+        if directory and os.path.isdir(directory):
+            tmpname = self.filename + '.tmp.npy'
+            np.save(tmpname, rotated)
+            os.rename(tmpname, self.filename)
+        return rotated
+
+    def rebuild(self, phases, weights):
+        """ the average summed over all grains """
+        return np.einsum('n,nijkl->ijkl', weights, self.rotated[np.arange(len(phases)), phases])
+
+    def average(self, graindata, Vinner, validate=False):
+        """ returns C_ave of the grains [grainnumber, grainvolume, grainmaterial]. Grains
+        which changed their phase since the last call are updated, everything else is
+        taken from the last average. With 'validate' the update is checked against the
+        rebuilt average """
+        phases = np.array([0 if grain[2] == 'AUSTENITE' else 1 for grain in graindata])
+        weights = np.array([grain[1] for grain in graindata], dtype=float) / Vinner
+        if self.C_ave is None or len(phases) != len(self.phases) or not np.allclose(weights, self.weights):
+            self.C_ave = self.rebuild(phases, weights)
         else:
-            C = Cm
-        Vi = graindata[i][1]
-        # calculate  C_averaged = sum_x[ (Vx/Vinner) * ( Rim Rjn Rkp Rlq Cmnpq ) ]
-        # where Cmnpq can be C_a or C_m
-        C_ave = np.add(C_ave, np.multiply((Vi / Vinner), rotateElasticTensor(C, rot_euler)))
-    C_selfconsistent_voigt = voigt_notation(C_ave)
+            for i in np.flatnonzero(phases != self.phases):
+                # subtract the grain's old contribution and add the new one
+                self.C_ave = self.C_ave + weights[i] * (self.rotated[i, phases[i]] - self.rotated[i, self.phases[i]])
+            if validate:
+                rebuilt = self.rebuild(phases, weights)
+                deviation = np.abs(self.C_ave - rebuilt).max() / np.abs(rebuilt).max()
+                if deviation > UPDATE_TOLERANCE:
+                    print('self consistent matrix: updated average deviates by ' + str(deviation) +
+                          ', using the rebuilt average')
+                    self.C_ave = rebuilt
+        self.phases = phases
+        self.weights = weights
+        return self.C_ave
+
+
+# SelfConsistentMatrix of the orientations of the run
+_matrix_cache = {}
+
+
+def selfconsistent_matrix(oris, graindata, Vinner, validate=False):
+    """This function averages anisotropic elastic constants ( refering to local coordinate
+    systems respectively) to global isotropic elastic constants considering phase fractions.
+    The nearly isotropic elastic constants are used as the matrix material property. In
+    micromechanics this is commonly called "self consistence scheme". The rotated tensors
+    and the average are cached between increments, see SelfConsistentMatrix """
+
+    key = repr([list(ori) for ori in oris])
+    if key not in _matrix_cache:
+        _matrix_cache.clear()
+        _matrix_cache[key] = SelfConsistentMatrix(oris)
+    # calculate  C_averaged = sum_x[ (Vx/Vinner) * ( Rim Rjn Rkp Rlq Cmnpq ) ]
+    # where Cmnpq can be C_a or C_m
+    C_ave = _matrix_cache[key].average(graindata, Vinner, validate)
+    C_selfconsistent_voigt = mathutils.voigt_notation(C_ave)
     # convert float entries to strings with five decimals in order to write to inputfile
     for i in range(len(C_selfconsistent_voigt)):
         C_selfconsistent_voigt[i] = '{0:.5e}'.format(float(C_selfconsistent_voigt[i]))
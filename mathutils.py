@@ -1,7 +1,7 @@
 """ This module contains all mathematical operations needed for the simulation """
 
 import math
-import izip
+from itertools import izip
 import numpy as np  # installed along with abaqus. Available after invoking abaqus python
 
 # -----< used matrix operations >---------------------------------------------------------#
@@ -52,13 +52,13 @@ def vecCrossProduct(vec1, vec2):
 def voigt_notation(C):
     """this function takes the elastic fourth order tensor and returns its Voigt notation,
 	    which is a 6 x 6 matrix """
-    return C_voigt = [C[0][0][0][0], C[0][0][1][1], C[1][1][1][1],
-                      C[0][0][2][2], C[1][1][2][2], C[2][2][2][2],
-                      C[0][0][0][1], C[1][1][0][1], C[2][2][0][1],
-                      C[0][1][0][1], C[0][0][0][2], C[1][1][0][2],
-                      C[2][2][0][2], C[0][1][0][2], C[0][2][0][2],
-                      C[0][0][1][2], C[1][1][1][2], C[2][2][1][2],
-                      C[0][1][1][2], C[0][2][1][2], C[1][2][1][2]]
+    return [C[0][0][0][0], C[0][0][1][1], C[1][1][1][1],
+            C[0][0][2][2], C[1][1][2][2], C[2][2][2][2],
+            C[0][0][0][1], C[1][1][0][1], C[2][2][0][1],
+            C[0][1][0][1], C[0][0][0][2], C[1][1][0][2],
+            C[2][2][0][2], C[0][1][0][2], C[0][2][0][2],
+            C[0][0][1][2], C[1][1][1][2], C[2][2][1][2],
+            C[0][1][1][2], C[0][2][1][2], C[1][2][1][2]]
 
 
 def calc_rotmatrix_euler(a, b):
@@ -106,9 +106,32 @@ def eulerian_angles(a, b, c):
     return alpha, beta, gamma
 
 
+def orientation_basis(a, b, axis=3, angle=0.):
+    """returns the matrix Q whose columns are the axes of the local coordinate system of an
+    abaqus *Orientation given by the point a on the local x axis and the point b in the
+    local x-y plane, followed by an additional rotation 'angle' (degrees) about the local
+    'axis'. A local tensor T is given in global coordinates as Q T Q^T """
+    x = np.asarray(a, dtype=float)
+    x = x / np.linalg.norm(x)
+    z = np.cross(x, np.asarray(b, dtype=float))
+    z = z / np.linalg.norm(z)
+    y = np.cross(z, x)
+    Q = np.array([x, y, z]).T
+    if angle:
+        c, s = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+        i, j = [(1, 2), (2, 0), (0, 1)][axis - 1]
+        rotation = np.identity(3)
+        rotation[i, i] = rotation[j, j] = c
+        rotation[i, j] = -s
+        rotation[j, i] = s
+        Q = np.dot(Q, rotation)
+    return Q
+
+
 def rotate_indicial(C, R):
     """calculates the rotation of a fourth order tensor C by the rotation defined by R,
         where both are given as standard python lists """
+    Crot = [[[[0. for l in range(3)] for k in range(3)] for j in range(3)] for i in range(3)]
     for i in range(3):
         for j in range(3):
             for k in range(3):
@@ -119,7 +142,7 @@ def rotate_indicial(C, R):
                                 for p in range(3):
                                     Crot[i][j][k][l] = R[i][m] * R[j][n] * R[k][o] * R[l][p] * C[m][n][o][p] + \
                                                        Crot[i][j][k][l]
-            return Crot
+    return Crot
 
 
 def rotateElasticTensor(C, R):
@@ -129,3 +152,120 @@ def rotateElasticTensor(C, R):
     RRRR = np.outer(RR, RR).reshape(4 * R.shape)
     axes = ((0, 2, 4, 6), (0, 1, 2, 3))
     return np.tensordot(RRRR, C, axes)
+
+
+# -----< batched operations >-------------------------------------------------------------#
+# The following functions take stacks of vectors, matrices or tensors along the leading
+# axes and return stacks, so that all grains are handled in one NumPy call.
+
+# index pairs of the Voigt order of abaqus [11, 22, 33, 12, 13, 23]
+VOIGT_PAIRS = [(0, 0), (1, 1), (2, 2), (0, 1), (0, 2), (1, 2)]
+# index pairs of the 21 independent entries in the order of voigt_notation
+VOIGT_ENTRIES = [(I, J) for J in range(6) for I in range(J + 1)]
+
+
+def fill_matrices(A):
+    """ symmetric 3x3 matrices (..., 3, 3) from their elements (..., 6) given as
+    [11, 22, 33, 12, 13, 23], the batched fillMatrix """
+    A = np.asarray(A, dtype=float)
+    M = np.empty(A.shape[:-1] + (3, 3))
+    for index, (i, j) in enumerate(VOIGT_PAIRS):
+        M[..., i, j] = M[..., j, i] = A[..., index]
+    return M
+
+
+def matrix_elements(M):
+    """ the elements [11, 22, 33, 12, 13, 23] (..., 6) of symmetric matrices (..., 3, 3) """
+    M = np.asarray(M, dtype=float)
+    return np.concatenate([M[..., i, j][..., np.newaxis] for (i, j) in VOIGT_PAIRS], axis=-1)
+
+
+def strain_vectors(eps):
+    """ strains (..., 3, 3) in Voigt notation with engineering shear strains (..., 6) """
+    return matrix_elements(eps) * np.array([1., 1., 1., 2., 2., 2.])
+
+
+def stiffness_matrices(C):
+    """ 6x6 stiffness matrices (..., 6, 6) of fourth order tensors (..., 3, 3, 3, 3) for
+    engineering shear strains """
+    C = np.asarray(C, dtype=float)
+    D = np.empty(C.shape[:-4] + (6, 6))
+    for I, (i, j) in enumerate(VOIGT_PAIRS):
+        for J, (k, l) in enumerate(VOIGT_PAIRS):
+            D[..., I, J] = C[..., i, j, k, l]
+    return D
+
+
+def stiffness_tensors(D):
+    """ fourth order tensors (..., 3, 3, 3, 3) of 6x6 stiffness matrices (..., 6, 6) """
+    D = np.asarray(D, dtype=float)
+    C = np.empty(D.shape[:-2] + (3, 3, 3, 3))
+    for I, (i, j) in enumerate(VOIGT_PAIRS):
+        for J, (k, l) in enumerate(VOIGT_PAIRS):
+            for a, b in [(i, j), (j, i)]:
+                for c, d in [(k, l), (l, k)]:
+                    C[..., a, b, c, d] = D[..., I, J]
+    return C
+
+
+def voigt_entries(C):
+    """ the 21 independent entries (..., 21) of fourth order tensors in the order of
+    voigt_notation, i.e. of the abaqus inputfile """
+    D = stiffness_matrices(C)
+    return np.concatenate([D[..., I, J][..., np.newaxis] for (I, J) in VOIGT_ENTRIES], axis=-1)
+
+
+def doubledot_products(A, B):
+    """ the double dot products (N, K) of N matrices A (N, 3, 3) with K matrices B
+    (K, 3, 3), e.g. of the grain stresses with the eigenstrains of the laminates """
+    return np.einsum('nij,kij->nk', np.asarray(A, dtype=float), np.asarray(B, dtype=float))
+
+
+def rotation_matrices_euler(a, b):
+    """ the batched calc_rotmatrix_euler: rotation matrices (N, 3, 3) of N pairs of the
+    orientation vectors a (N, 3) and b (N, 3) """
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    c = np.cross(a, b)
+    norm = np.linalg.norm(c, axis=1)
+    if (norm == 0.).any():
+        raise ValueError('the orientation vectors of grain index ' + str(int(np.flatnonzero(norm == 0.)[0])) +
+                         ' are parallel')
+    # the Eulerian angles as in eulerian_angles. If c is parallel to z its projection into
+    # the x-y plane vanishes and alpha is taken as 0, e.g. for the identity orientation
+    beta = np.arccos(np.clip(c[:, 2] / norm, -1., 1.))
+    projection = np.hypot(c[:, 0], c[:, 1])
+    alpha = np.arccos(np.clip(c[:, 0] / np.where(projection > 0., projection, 1.), -1., 1.))
+    alpha = np.where(projection > 0., alpha, 0.)
+    Y_rotated = np.column_stack([-np.sin(alpha), np.cos(alpha), np.zeros(len(alpha))])
+    gamma = np.arccos(np.clip(np.einsum('ni,ni->n', Y_rotated, b) / np.linalg.norm(b, axis=1), -1., 1.))
+    sa, ca = np.sin(alpha), np.cos(alpha)
+    sb, cb = np.sin(beta), np.cos(beta)
+    sg, cg = np.sin(gamma), np.cos(gamma)
+    R = np.empty((len(a), 3, 3))
+    R[:, 0, 0] = - sa * sg + ca * cb * cg
+    R[:, 0, 1] = ca * sg + sa * cb * cg
+    R[:, 0, 2] = - sb * cg
+    R[:, 1, 0] = - sa * cg - ca * cb * sg
+    R[:, 1, 1] = ca * cg - sa * cb * sg
+    R[:, 1, 2] = sb * sg
+    R[:, 2, 0] = ca * sb
+    R[:, 2, 1] = sa * sb
+    R[:, 2, 2] = cb
+    return R
+
+
+def rotate_elastic_tensors(C, R):
+    """ the batched rotateElasticTensor: C'_ijkl = R_mi R_nj R_ok R_pl C_mnop for stacks of
+    rotations R (..., 3, 3) and tensors C (..., 3, 3, 3, 3); a single C is rotated by every
+    R. The rotation is contracted index by index """
+    C = np.einsum('...mi,...mnop->...inop', R, C)
+    C = np.einsum('...nj,...inop->...ijop', R, C)
+    C = np.einsum('...ok,...ijop->...ijkp', R, C)
+    return np.einsum('...pl,...ijkp->...ijkl', R, C)
+
+
+def rotate_matrices(T, Q):
+    """ Q T Q^T for stacks of matrices T (..., 3, 3) and rotations Q (..., 3, 3), e.g.
+    local tensors to the global system with the orientation bases of orientation_basis """
+    return np.einsum('...ia,...ab,...jb->...ij', Q, T, Q)
@@ -0,0 +1,162 @@
+""" This module reads the output databases of the transformation step in a single pass.
+The integration point fields SENER, IVOL and S are pulled into NumPy arrays with the bulk
+data access of the odb API and all per-grain and per-phase values are computed by grouped
+reductions over the element set of each section. Needs the Abaqus Python environment. """
+
+import numpy as np
+
+# 'PART-1-1' is the default name of the first created part if none is specified
+INSTANCE_NAME = 'PART-1-1'
+STEP_NAME = 'Transformation'
+# Assembly Assembly-1 is the default repository key that is generated
+HISTORY_REGION = 'Assembly Assembly-1'
+
+# element labels of the element sets, equal for all candidates of a mesh
+_set_labels_cache = {}
+
+
+def mesh_fingerprint(instance):
+    """ the node and element counts and the first and last element labels of an instance.
+    The candidates of a mesh share them, the odbs of another mesh opened in the same
+    process (e.g. a parameter study) get a table of their own """
+    elements = instance.elements
+    n_elements = len(elements)
+    if n_elements == 0:
+        return (len(instance.nodes), 0, None, None)
+    return (len(instance.nodes), n_elements, elements[0].label, elements[n_elements - 1].label)
+
+
+def set_name_of(section):
+    """ the name of the element set a section is assigned to """
+    name = section.name
+    if name.startswith('Section-'):
+        name = name[len('Section-'):]
+    return name
+
+
+def read_allie(odb):
+    """ returns the total strain energy (ALLIE) of the model at the end of the step """
+    histreg = odb.steps[STEP_NAME].historyRegions[HISTORY_REGION]
+    # .data holds (time, value) pairs of the Allenergies (total energies)
+    return histreg.historyOutputs['ALLIE'].data[-1][1]
+
+
+def read_total_strain_energy(odbname):
+    """ opens the odb only to read ALLIE, no field output is touched """
+    from odbAccess import openOdb
+    odb = openOdb(path=odbname, readOnly=True)
+    try:
+        return read_allie(odb)
+    finally:
+        odb.close()
+
+
+def bulk_field(field):
+    """ returns the element labels, integration points and data of a field output
+    as NumPy arrays sorted by element label and integration point """
+    blocks = field.bulkDataBlocks
+    labels = np.concatenate([np.asarray(block.elementLabels) for block in blocks])
+    points = np.concatenate([np.asarray(block.integrationPoints) for block in blocks])
+    data = np.concatenate([np.asarray(block.data, dtype=np.float64) for block in blocks])
+    order = np.lexsort((points, labels))
+    return labels[order], points[order], data[order]
+
+
+def group_of_labels(instance, set_names, labels):
+    """ returns for every integration point the index of the element set in 'set_names'
+    its element belongs to (-1 if none). The label lookup table is built once per mesh """
+    key = (instance.name, tuple(set_names)) + mesh_fingerprint(instance)
+    if key not in _set_labels_cache:
+        max_label = int(labels.max())
+        lookup = -np.ones(max_label + 1, dtype=np.int64)
+        for index, set_name in enumerate(set_names):
+            set_labels = np.array([element.label for element in instance.elementSets[set_name].elements])
+            lookup[set_labels[set_labels <= max_label]] = index
+        _set_labels_cache[key] = lookup
+    lookup = _set_labels_cache[key]
+    groups = -np.ones(len(labels), dtype=np.int64)
+    inside = labels < len(lookup)
+    groups[inside] = lookup[labels[inside]]
+    return groups
+
+
+class OdbSummary(object):
+    """ compact per-job summary of an output database. For every element set with a
+    section it holds the material, the volume, the strain energy and the volume weighted
+    mean stress [S11, S22, S33, S12, S13, S23]; further the model and phase totals. """
+
+    def __init__(self, allie, set_names, materials, volumes, strain_energies, mean_stresses):
+        self.allie = allie
+        self.set_names = set_names
+        self.materials = materials
+        self.volumes = volumes
+        self.strain_energies = strain_energies
+        self.mean_stresses = mean_stresses
+        #
+        materials = np.array(materials)
+        austenite = materials == 'AUSTENITE'
+        martensite = np.array(['LAMINATE' in m for m in materials], dtype=bool)
+        # the volume of the matrix must not be considered for the random RVE cell !
+        grains = np.array(['TRANSIG' in s for s in set_names], dtype=bool)
+        self.total_strain_energy = strain_energies.sum()
+        self.ivol_total = volumes[grains].sum()
+        self.ivol_aust = volumes[austenite].sum()
+        self.ivol_mart = volumes[martensite].sum()
+        self.tot_strain_ener_aust = strain_energies[austenite].sum()
+        self.tot_strain_ener_mart = strain_energies[martensite].sum()
+
+    def model_data(self):
+        """ [0 - tot_strainEner, 1 - tot_aveSener, 2 - ivol_aust, 3 - ivol_mart,
+        4 - aveSener_aust,  5 - aveSener_mart ]. Note that for the random RVE the averaged
+        strain energy density refers only to the graincluster without the matrix """
+        ave_sener_aust = self.tot_strain_ener_aust / self.ivol_aust if self.ivol_aust else 0.
+        ave_sener_mart = self.tot_strain_ener_mart / self.ivol_mart if self.ivol_mart else 0.
+        return (self.total_strain_energy, self.total_strain_energy / self.ivol_total, self.ivol_aust,
+                self.ivol_mart, ave_sener_aust, ave_sener_mart)
+
+    def austenite_sets(self):
+        """ indices of the element sets which are still austenite """
+        return [i for i, m in enumerate(self.materials) if m == 'AUSTENITE']
+
+
+def summarize_odb(odbname):
+    """ reads the last frame of the transformation step of an odb in one pass and returns
+    its OdbSummary """
+    from odbAccess import openOdb
+    from abaqusConstants import INTEGRATION_POINT
+    # create odb singular object
+    odb = openOdb(path=odbname, readOnly=True)
+    try:
+        last_frame = odb.steps[STEP_NAME].frames[-1]  # [-1] gives last frame
+        instance = odb.rootAssembly.instances[INSTANCE_NAME]
+        # --- integration point variables ---
+        fields = last_frame.fieldOutputs
+        labels, points, sener = bulk_field(fields['SENER'].getSubset(position=INTEGRATION_POINT))
+        ivol_labels, ivol_points, ivol = bulk_field(fields['IVOL'].getSubset(position=INTEGRATION_POINT))
+        s_labels, s_points, stress = bulk_field(fields['S'].getSubset(position=INTEGRATION_POINT))
+        if not (np.array_equal(labels, ivol_labels) and np.array_equal(points, ivol_points) and
+                np.array_equal(labels, s_labels) and np.array_equal(points, s_points)):
+            raise ValueError('SENER, IVOL and S are not given at the same integration points in ' + odbname)
+        sener = sener[:, 0]
+        ivol = ivol[:, 0]
+        #
+        sections = odb.sections.values()
+        set_names = [set_name_of(section) for section in sections]
+        materials = [section.material for section in sections]
+        groups = group_of_labels(instance, set_names, labels)
+        allie = read_allie(odb)
+    finally:
+        odb.close()
+    #
+    # SENER must be weighted with the integration point volume since not all elements
+    # are of the same size. Points outside of any section set are dropped
+    inside = groups >= 0
+    groups, sener, ivol, stress = groups[inside], sener[inside], ivol[inside], stress[inside]
+    n_sets = len(set_names)
+    volumes = np.bincount(groups, weights=ivol, minlength=n_sets)
+    strain_energies = np.bincount(groups, weights=sener * ivol, minlength=n_sets)
+    mean_stresses = np.zeros((n_sets, 6))
+    for i in range(stress.shape[1]):
+        mean_stresses[:, i] = np.bincount(groups, weights=stress[:, i] * ivol, minlength=n_sets)
+    mean_stresses /= np.where(volumes > 0, volumes, 1.)[:, np.newaxis]
+    return OdbSummary(allie, set_names, materials, volumes, strain_energies, mean_stresses)
@@ -0,0 +1,173 @@
+""" This module holds the result cache: the total strain energy of a solved configuration
+kept across runs, restarts and parameter studies. The energy of a candidate only depends
+on the mesh, the material and job data (laminates, boundary conditions, step), the matrix
+stiffness and which grains are transformed to which laminate, not on the interface energy
+or the chemical driving force. A configuration is named by the md5 of these, so the same
+state reached in another run or in another order is not solved again. Every entry is a
+small JSON file in RESULT_CACHE_DIRECTORY; the least recently used entries are removed
+once the entries exceed the size of the cache. """
+
+import hashlib
+import json
+import os
+import time
+# my modules
+import deckparser
+import material
+
+RESULT_CACHE_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'transEnergymin', 'results')
+RESULT_CACHE_VERSION = 1
+
+
+def material_md5():
+    """ md5 of the source of the material module. The native solver takes the stiffnesses
+    and eigenstrains from it instead of the *Elastic data of the deck """
+    source = os.path.splitext(material.__file__)[0] + '.py'
+    if source not in _material_md5:
+        _material_md5[source] = deckparser.file_md5(source)
+    return _material_md5[source]
+
+
+_material_md5 = {}
+
+
+def configuration_key(inputs, pbc, C_ave, assignment, solver):
+    """ md5 of a configuration. 'inputs' are the md5s of the geometry and the material and
+    job data, 'assignment' the [grainNr, laminate] of all transformed grains including the
+    candidate and 'solver' the solver family, energies of different solvers are not mixed.
+    The energies of other solvers than the standard solver also depend on the material
+    module """
+    configuration = [RESULT_CACHE_VERSION, list(inputs), bool(pbc), C_ave if not pbc else 0,
+                     sorted([[int(grain_nr), int(laminate)] for grain_nr, laminate in assignment]), solver]
+    if solver != 'abaqus':
+        configuration.append(material_md5())
+    return hashlib.md5(json.dumps(configuration).encode('utf-8')).hexdigest()
+
+
+def solver_family(backend):
+    """ the native solver runs as separate jobs or in the driver's process. The workers
+    of the 'distributed' backend report their own backend, see
+    distributed.Coordinator.solver_family """
+    return 'native' if backend == 'native-update' else backend
+
+
+class ResultCache(object):
+    """ the entries in 'directory', at most 'max_bytes' of them """
+
+    def __init__(self, max_bytes=256 * 1024 ** 2, directory=RESULT_CACHE_DIRECTORY):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.size = None  # bytes of all entries, counted at the first eviction
+        self.hits = 0
+
+    def filename(self, key):
+        return os.path.join(self.directory, key[0:2], key + '.json')
+
+    def get(self, key):
+        """ the total strain energy of a configuration, None if it is not cached. A hit is
+        marked as recently used """
+        filename = self.filename(key)
+        try:
+            with open(filename, 'r') as entry:
+                record = json.load(entry)
+            os.utime(filename, None)
+        except (IOError, OSError, ValueError):
+            return None
+        if record.get('version') != RESULT_CACHE_VERSION:
+            return None
+        self.hits += 1
+        return record['energy']
+
+    def put(self, key, energy):
+        filename = self.filename(key)
+        if os.path.isfile(filename):
+            return
+        directory = os.path.dirname(filename)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                pass  # created by another run in the meantime
+        # written under a temporary name, so a run reading the cache never sees half an entry
+        tmpname = filename + '.' + str(os.getpid()) + '.tmp'
+        with open(tmpname, 'w') as entry:
+            json.dump({'version': RESULT_CACHE_VERSION, 'energy': energy, 'time': time.time()}, entry)
+        os.rename(tmpname, filename)
+        if self.size is not None:
+            self.size += os.path.getsize(filename)
+
+    def entries(self):
+        """ (last use, bytes, filename) of all entries """
+        entries = []
+        for root, directories, filenames in os.walk(self.directory):
+            for name in filenames:
+                if name.endswith('.json'):
+                    stat = os.stat(os.path.join(root, name))
+                    entries.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+        return entries
+
+    def evict(self):
+        """ removes the least recently used entries while the cache exceeds its size. The
+        directory is only scanned once per process and when the size is exceeded """
+        if self.max_bytes is None or (self.size is not None and self.size <= self.max_bytes):
+            return
+        entries = sorted(self.entries())
+        self.size = sum([size for _, size, _ in entries])
+        for _, size, filename in entries:
+            if self.size <= self.max_bytes:
+                break
+            try:
+                os.remove(filename)
+            except OSError:
+                pass  # evicted by another run
+            self.size -= size
+
+
+class IncrementCache(object):
+    """ the entries of the candidates of an increment: the state with 'martensite_grains'
+    transformed and the matrix 'C_ave'. The lookups of an increment are kept, so the
+    driver and the job submission can ask for the same candidates """
+
+    def __init__(self, cache, inputs, pbc, C_ave, martensite_grains, solver):
+        self.cache = cache
+        self.inputs = inputs
+        self.pbc = pbc
+        self.C_ave = C_ave
+        self.martensite_grains = [list(grain) for grain in martensite_grains]
+        self.solver = solver
+        self.energies = {}  # (grainNr, laminate) -> total strain energy or None
+
+    def key(self, grain_nr, laminate):
+        return configuration_key(self.inputs, self.pbc, self.C_ave, self.martensite_grains + [[grain_nr, laminate]],
+                                 self.solver)
+
+    def lookup(self, grain_nr, laminate):
+        if (grain_nr, laminate) not in self.energies:
+            self.energies[(grain_nr, laminate)] = self.cache.get(self.key(grain_nr, laminate))
+        return self.energies[(grain_nr, laminate)]
+
+    def cached(self, space):
+        """ {(grainNr, laminate): total strain energy} of the cached candidates of a
+        candidates.CandidateSpace """
+        energies = {}
+        for austenite_grain, laminate in space:
+            energy = self.lookup(austenite_grain[0], laminate)
+            if energy is not None:
+                energies[(austenite_grain[0], laminate)] = energy
+        return energies
+
+    def store(self, grain_nr, laminate, energy, backend=None):
+        """ keeps the energy of a candidate. An energy solved by a 'backend' of another
+        solver family, e.g. on a worker that connected later, is not kept """
+        if energy is None or self.energies.get((grain_nr, laminate)) is not None:
+            return
+        if backend is not None and solver_family(backend) != self.solver:
+            return
+        self.energies[(grain_nr, laminate)] = energy
+        self.cache.put(self.key(grain_nr, laminate), energy)
+
+
+def input_md5s(geometry_filename, material_jobdata_filename):
+    """ the md5s of the input files a configuration depends on. Files included by them are
+    assumed not to change """
+    return [deckparser.file_md5(filename.strip()) for filename in (geometry_filename, material_jobdata_filename)]
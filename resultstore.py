@@ -0,0 +1,200 @@
+""" This module stores the results of the increments in append-only binary columns instead
+of the text files 'allruns_<increment>', 'save_grain' and 'save_model'. Every column is a
+raw little endian file which is appended to and read back as a NumPy memmap, so the runs
+of many increments are queried with array operations. The text files can be exported in
+their old format at any time.
+
+Tables (one directory each in saves/results):
+    runs  - every candidate of an increment, the fields of the evaluation data
+    grains - the energy minimizing candidate of every increment
+    model - the model data of the energy minimizing state of every increment
+An increment that is calculated again after an interruption is appended again, the last
+record of an increment (and candidate) is the valid one. """
+
+import os
+
+import numpy as np
+
+RESULTS_DIRECTORY = 'saves/results'
+
+# evaluation data = [0-delta_G, 1-GrainNr, 2-GrainLaminate, 3-GrainVol, 4-dragEner_spec,
+#                    5-delta_totalStrain_spec, 6-total_strainEner_cell]
+RUN_COLUMNS = [('increment', '<i4'), ('delta_G', '<f8'), ('grain', '<i4'), ('laminate', '<i4'),
+               ('grain_volume', '<f8'), ('drag_energy_spec', '<f8'), ('delta_total_strain_spec', '<f8'),
+               ('total_strain_energy_cell', '<f8')]
+GRAIN_COLUMNS = [('increment', '<i4'), ('grain', '<i4'), ('laminate', '<i4'), ('grain_volume', '<f8'),
+                 ('drag_energy_spec', '<f8'), ('delta_total_strain_spec', '<f8'), ('delta_G', '<f8'),
+                 ('transforming_energy', '<f8')]
+# md = [0 - tot_strainEner, 1 - tot_aveSener, 2 - ivol_aust, 3 - ivol_mart,
+#       4 - aveSener_aust,  5 - aveSener_mart ] and the delta of the total strain energy
+MODEL_COLUMNS = [('increment', '<i4'), ('total_strain_energy', '<f8'), ('delta_total_strain_energy', '<f8'),
+                 ('total_ave_sener', '<f8'), ('ivol_aust', '<f8'), ('ivol_mart', '<f8'),
+                 ('ave_sener_aust', '<f8'), ('ave_sener_mart', '<f8')]
+
+
+class ColumnTable(object):
+    """ a table of typed columns, each in its own append-only file. A record that was only
+    partly written, e.g. because the job was killed, is ignored: the table is as long as
+    its shortest column """
+
+    def __init__(self, directory, columns):
+        self.directory = directory
+        self.columns = columns
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def filename(self, name):
+        return os.path.join(self.directory, name + '.bin')
+
+    def __len__(self):
+        lengths = []
+        for name, dtype in self.columns:
+            filename = self.filename(name)
+            size = os.path.getsize(filename) if os.path.isfile(filename) else 0
+            lengths.append(size // np.dtype(dtype).itemsize)
+        return min(lengths)
+
+    def append(self, rows):
+        """ appends the records given as sequences in the order of the columns """
+        if not len(rows):
+            return
+        length = len(self)
+        for index, (name, dtype) in enumerate(self.columns):
+            values = np.array([row[index] for row in rows], dtype=dtype)
+            with open(self.filename(name), 'r+b' if os.path.isfile(self.filename(name)) else 'wb') as column:
+                # drop the tail of an interrupted append before writing
+                column.seek(length * np.dtype(dtype).itemsize)
+                column.truncate()
+                column.write(values.tobytes())
+                column.flush()
+                os.fsync(column.fileno())
+
+    def column(self, name):
+        """ the values of a column as a read only memmap """
+        dtype = dict(self.columns)[name]
+        length = len(self)
+        if not length:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(self.filename(name), dtype=dtype, mode='r', shape=(length,))
+
+    def read(self, mask=None):
+        """ all columns as a dict of arrays, only the rows of 'mask' if given """
+        data = {}
+        for name, dtype in self.columns:
+            values = self.column(name)
+            data[name] = np.array(values[mask] if mask is not None else values)
+        return data
+
+
+def last_of(keys):
+    """ indices of the last occurrence of every key (rows of an integer array), in order """
+    if not len(keys):
+        return np.zeros(0, dtype=np.int64)
+    reversed_keys = np.ascontiguousarray(keys[::-1])
+    unique, first = np.unique(reversed_keys.view([('', keys.dtype)] * keys.shape[1]).ravel(), return_index=True)
+    return np.sort(len(keys) - 1 - first)
+
+
+class ResultStore(object):
+    """ the results of all increments of a run """
+
+    def __init__(self, directory=RESULTS_DIRECTORY):
+        self.directory = directory
+        self.run_table = ColumnTable(os.path.join(directory, 'runs'), RUN_COLUMNS)
+        self.grain_table = ColumnTable(os.path.join(directory, 'grains'), GRAIN_COLUMNS)
+        self.model_table = ColumnTable(os.path.join(directory, 'model'), MODEL_COLUMNS)
+
+    # -----< writing >---------------------------------------------------------------------#
+
+    def add_runs(self, increment, evaluation_data):
+        self.run_table.append([[increment] + list(row[0:7]) for row in evaluation_data])
+
+    def add_grain(self, increment, found_grain, transforming_energy):
+        fg = found_grain
+        self.grain_table.append([[increment, fg[1], fg[2], fg[3], fg[4], fg[5], fg[0], transforming_energy]])
+
+    def add_model(self, increment, model_data, delta_total_strain_energy):
+        md = model_data
+        self.model_table.append([[increment, md[0], delta_total_strain_energy, md[1], md[2], md[3], md[4], md[5]]])
+
+    # -----< queries >---------------------------------------------------------------------#
+
+    def increments(self):
+        return np.unique(self.run_table.column('increment'))
+
+    def runs(self, increment):
+        """ the candidates of an increment as a dict of arrays, the last record of every
+        candidate if the increment was written more than once """
+        rows = np.flatnonzero(self.run_table.column('increment') == increment)
+        grains = self.run_table.column('grain')[rows]
+        laminates = self.run_table.column('laminate')[rows]
+        rows = rows[last_of(np.column_stack([grains, laminates]))]
+        return self.run_table.read(rows)
+
+    def deltas(self, increment):
+        """ {(grainNr, laminate): delta_G} of an increment """
+        runs = self.runs(increment)
+        return dict(((int(g), int(l)), float(d)) for g, l, d in zip(runs['grain'], runs['laminate'], runs['delta_G']))
+
+    def top(self, increment, amount, field='delta_G', descending=True):
+        """ [grainNr, laminate] of the 'amount' candidates of an increment with the largest
+        (or smallest) values of 'field' """
+        runs = self.runs(increment)
+        order = np.argsort(runs[field], kind='mergesort')
+        if descending:
+            order = order[::-1]
+        order = order[0: amount]
+        return [[int(g), int(l)] for g, l in zip(runs['grain'][order], runs['laminate'][order])]
+
+    def history(self, grain):
+        """ the candidates of a grain in all increments, ordered by increment """
+        increments = self.run_table.column('increment')
+        grains = self.run_table.column('grain')
+        laminates = self.run_table.column('laminate')
+        rows = np.flatnonzero(grains == grain)
+        rows = rows[last_of(np.column_stack([increments[rows], laminates[rows]]))]
+        rows = rows[np.argsort(increments[rows], kind='mergesort')]
+        return self.run_table.read(rows)
+
+    def accepted(self):
+        """ the energy minimizing candidates and the model data of all increments """
+        grains = self.grain_table.read()
+        grains = dict((name, values[last_of(grains['increment'][:, np.newaxis])]) for name, values in grains.items())
+        model = self.model_table.read()
+        model = dict((name, values[last_of(model['increment'][:, np.newaxis])]) for name, values in model.items())
+        return grains, model
+
+    # -----< text export >-----------------------------------------------------------------#
+
+    def export(self, directory='saves'):
+        """ writes 'allruns_<increment>', 'save_grain' and 'save_model' in the old format """
+        for increment in self.increments():
+            runs = self.runs(increment)
+            with open(os.path.join(directory, 'allruns_' + str(increment)), 'w') as save_all:
+                save_all.write('grainNr\tlaminateNr\tgrainVol\tdragEner_spec\t\t' +
+                               'delta_totStrainEner_spec\tdelta_allEnergies\n')
+                for i in range(len(runs['grain'])):
+                    save_all.write(str(runs['grain'][i]) + '\t' + str(runs['laminate'][i]) + '\t\t' +
+                                   repr(runs['grain_volume'][i]) + '\t' + repr(runs['drag_energy_spec'][i]) +
+                                   '\t' + repr(runs['delta_total_strain_spec'][i]) + '\t\t' +
+                                   repr(runs['delta_G'][i]) + '\n')
+        grains, model = self.accepted()
+        with open(os.path.join(directory, 'save_grain'), 'w') as save_grain:
+            save_grain.write('grainNr\tlaminateNr\tgrainVol\tdragEner_spec\t\t' +
+                             'delta_totStrainEner_spec\tdelta_allEnergies\ttransformingEnergy\n')
+            for i in range(len(grains['grain'])):
+                save_grain.write(str(grains['grain'][i]) + '\t' + str(grains['laminate'][i]) + '\t\t' +
+                                 repr(grains['grain_volume'][i]) + '\t' + repr(grains['drag_energy_spec'][i]) +
+                                 '\t' + repr(grains['delta_total_strain_spec'][i]) + '\t\t' +
+                                 repr(grains['delta_G'][i]) + '\t' + repr(grains['transforming_energy'][i]) + '\n')
+        with open(os.path.join(directory, 'save_model'), 'w') as save_model:
+            save_model.write('tot_strainEner\t\tdelta_tot_strainEner\ttot_aveSener' +
+                             '\t\tivol_aust\t\tivol_mart\t\tave_sener_aust\t\tave_sener_mart\n')
+            for i in range(len(model['increment'])):
+                save_model.write('\t'.join([repr(model[name][i]) for name, dtype in MODEL_COLUMNS[1:]]) + '\n')
+
+
+if __name__ == '__main__':
+    # python resultstore.py [directory] writes the text files of a run's results
+    import sys
+    ResultStore().export(sys.argv[1] if len(sys.argv) > 1 else 'saves')
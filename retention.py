@@ -0,0 +1,130 @@
+""" This module manages the outputs of the candidate jobs of an increment. Every candidate's
+deck and outputs (.odb, .dat, .msg, .sta, ...) are removed as soon as its energy is
+evaluated and it is no longer one of the best 'keep' candidates, since only the energy
+minimizing candidate is saved. Only the files of the tracked jobs are touched: the deck
+'Inputfile_<..>.inp' and the files 'Outputfile_<..>' with an extension of
+OUTPUT_EXTENSIONS, at the end of the increment all files 'Outputfile_<..>.*'. With a
+budget the job submission waits while the outputs of the increment exceed it or while the
+scratch file system (e.g. the tmpfs /dev/shm) has too little free space. The bytes of the
+outputs are kept as a running total, so the directory is not listed before every launch. """
+
+import os
+
+# the files a job may leave next to its deck 'Outputfile_<..>' + extension, the standard
+# solver's and those of the native solver and the workers (.dat, .sta)
+OUTPUT_EXTENSIONS = ['.odb', '.dat', '.msg', '.sta', '.prt', '.com', '.sim', '.log', '.lck', '.res', '.mdl',
+                     '.stt', '.abq', '.pac', '.sel', '.fil', '.ipm', '.023']
+
+
+def free_space(path):
+    """ bytes available on the file system of 'path' """
+    stat = os.statvfs(path)
+    return stat.f_bavail * stat.f_frsize
+
+
+def file_size(filename):
+    try:
+        return os.path.getsize(filename)
+    except OSError:
+        return None
+
+
+class OutputRetention(object):
+    """ the outputs of the candidates of an increment in 'directory'. 'budget' limits the
+    bytes of the outputs, 'min_free' the free bytes of 'scratch', None disables a limit.
+    The files of a job are counted once it has ended, a running job's files are not. The
+    scratch files of the standard solver are not in 'directory' and not counted, only the
+    free space of 'scratch' limits them """
+
+    def __init__(self, keep=3, budget=None, scratch=None, min_free=None, directory='.'):
+        self.keep = max(1, keep)
+        self.budget = budget
+        self.scratch = scratch
+        self.min_free = min_free
+        self.directory = directory
+        self.tracked = {}  # outputname -> inputname
+        self.sizes = {}  # outputname -> {filename: bytes} of the files of an ended job
+        self.bytes = 0  # bytes of the files in 'sizes'
+        self.best = []  # (|delta_G|, outputname) of the evaluated candidates whose outputs are kept
+        self.removed_bytes = 0
+
+    def track(self, outputname, inputname):
+        """ the deck and outputs of a job belong to the increment """
+        self.tracked[outputname] = inputname
+
+    def files(self, outputnames):
+        """ the possible files of the given tracked jobs """
+        filenames = []
+        for outputname in outputnames:
+            filenames.append(os.path.join(self.directory, self.tracked[outputname]))
+            filenames.extend([os.path.join(self.directory, outputname + extension) for extension in OUTPUT_EXTENSIONS])
+        return filenames
+
+    def ended(self, outputname):
+        """ counts the files of a job that has ended """
+        if outputname in self.sizes:
+            self.bytes -= sum(self.sizes[outputname].values())
+        sizes = {}
+        for filename in self.files([outputname]):
+            size = file_size(filename)
+            if size is not None:
+                sizes[filename] = size
+        self.sizes[outputname] = sizes
+        self.bytes += sum(sizes.values())
+
+    def usage(self):
+        """ bytes of the decks and outputs of the ended jobs """
+        return self.bytes
+
+    def admit(self):
+        """ whether another job may be launched """
+        if self.budget is not None and self.bytes >= self.budget:
+            return False
+        if self.min_free is not None and self.scratch is not None and free_space(self.scratch) < self.min_free:
+            return False
+        return True
+
+    def remove(self, outputnames):
+        for outputname in outputnames:
+            sizes = self.sizes.pop(outputname, {})
+            self.bytes -= sum(sizes.values())
+            for filename in self.files([outputname]):
+                try:
+                    size = sizes.get(filename)
+                    if size is None:
+                        size = os.path.getsize(filename)
+                    os.remove(filename)
+                    self.removed_bytes += size
+                except OSError:
+                    pass  # not written, moved to the saves or removed in the meantime
+
+    def evaluated(self, outputname, delta_G):
+        """ a candidate was evaluated, delta_G is None if it did not complete. The outputs
+        of candidates that can not be among the best any more are removed """
+        if outputname not in self.tracked:
+            return
+        if delta_G is None:
+            self.remove([outputname])
+            return
+        self.ended(outputname)
+        self.best.append((abs(delta_G), outputname))
+        self.best.sort()
+        if len(self.best) > self.keep:
+            self.remove([outputname for _, outputname in self.best[self.keep:]])
+            self.best = self.best[0: self.keep]
+
+    def finish(self):
+        """ removes the decks and outputs left of the increment, after the files of the
+        energy minimizing candidate are moved to the saves. Returns the bytes removed """
+        self.remove(self.tracked.keys())
+        # files of other extensions, the directory is listed once per increment
+        for name in os.listdir(self.directory):
+            if name.split('.')[0] in self.tracked:
+                filename = os.path.join(self.directory, name)
+                try:
+                    size = os.path.getsize(filename)
+                    os.remove(filename)
+                    self.removed_bytes += size
+                except OSError:
+                    pass
+        return self.removed_bytes
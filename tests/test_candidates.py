@@ -0,0 +1,115 @@
+""" checks of the candidate space of an increment and of the early stopping of the job
+submission """
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import automate
+import candidates
+import jobpool
+import resultstore
+
+AUSTENITE_GRAINS = [[2, 10., 'AUSTENITE'], [5, 12., 'AUSTENITE'], [9, 8., 'AUSTENITE']]
+
+
+class CandidateSpaceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.space = candidates.CandidateSpace(AUSTENITE_GRAINS, [1, 4])
+
+    def test_all_candidates(self):
+        self.assertEqual(len(self.space), 6)
+        self.assertEqual(self.space.pairs(), [[2, 1], [2, 4], [5, 1], [5, 4], [9, 1], [9, 4]])
+        self.assertEqual([grain for grain, laminate in self.space][0], AUSTENITE_GRAINS[0])
+        self.assertTrue([5, 4] in self.space)
+        self.assertFalse([5, 3] in self.space)
+        self.assertFalse([7, 1] in self.space)
+
+    def test_select(self):
+        # candidates of transformed grains or unknown laminates are ignored
+        self.space.select([[9, 1], [2, 4], [7, 1], [5, 6]])
+        self.assertEqual(self.space.pairs(), [[2, 4], [9, 1]])
+        self.assertEqual(len(self.space), 2)
+        self.assertFalse([5, 1] in self.space)
+
+    def test_remove_grain(self):
+        self.space.select([[5, 1], [9, 4]])
+        self.space.remove_grain(5)
+        self.space.remove_grain(7)
+        self.assertEqual(self.space.pairs(), [[9, 4]])
+        self.assertFalse([5, 1] in self.space)
+        self.assertEqual(self.space.index([9, 4]), (1, 1))
+
+    def test_candidate_space(self):
+        self.assertEqual(len(candidates.candidate_space(AUSTENITE_GRAINS, [1, 4], False, [[2, 1]])), 6)
+        self.assertEqual(candidates.candidate_space(AUSTENITE_GRAINS, [1, 4], True, [[2, 1]]).pairs(), [[2, 1]])
+
+
+class Evaluator(object):
+    """ the best evaluation row found so far, as kept by automate.CandidateEvaluator """
+
+    def __init__(self, best=None):
+        self.best = best
+
+
+class EarlyStoppingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def store(self, increment, deltas):
+        resultstore.ResultStore().add_runs(increment, [[delta, grain_nr, laminate, 10., 1e-4, 2e-4, 1e-3]
+                                                       for (grain_nr, laminate), delta in sorted(deltas.items())])
+
+    def jobs(self, keys):
+        return [jobpool.Job(3, grain_nr, laminate) for grain_nr, laminate in keys]
+
+    def test_bounds(self):
+        # every delta moved by -1 between the increments, the margin is zero
+        self.store(1, {(1, 1): -2., (2, 1): 0., (3, 4): 3.})
+        self.store(2, {(1, 1): -3., (2, 1): -1., (3, 4): 2.})
+        stopping = automate.EarlyStopping(3, Evaluator())
+        lower_bounds = [stopping.lower_bound(job) for job in self.jobs([(1, 1), (2, 1), (3, 4), (9, 9)])]
+        self.assertEqual(lower_bounds, [4., 2., 1., 0.])
+        ordered = stopping.order_best_first(self.jobs([(1, 1), (3, 4), (9, 9), (2, 1)]))
+        self.assertEqual([job.key() for job in ordered], [(9, 9), (3, 4), (2, 1), (1, 1)])
+
+    def test_stop(self):
+        self.store(1, {(1, 1): -2., (2, 1): 0., (3, 4): 3.})
+        self.store(2, {(1, 1): -3., (2, 1): -1., (3, 4): 2.})
+        evaluator = Evaluator()
+        stopping = automate.EarlyStopping(3, evaluator)
+        self.assertFalse(stopping(self.jobs([(1, 1)])))  # nothing evaluated yet
+        evaluator.best = [-1.5, 5, 2, 10., 1e-4, 2e-4, 1e-3]
+        self.assertTrue(stopping(self.jobs([(1, 1), (2, 1)])))
+        self.assertFalse(stopping(self.jobs([(1, 1), (3, 4)])))
+        self.assertFalse(stopping(self.jobs([(1, 1), (9, 9)])))
+
+    def test_margin(self):
+        self.store(1, {(1, 1): -2., (2, 1): 0., (3, 4): 3.})
+        self.store(2, {(1, 1): -3., (2, 1): -2., (3, 4): 2.})
+        # the shifts -1, -2, -1 have the mean -4/3 and the standard deviation 1/sqrt(3)
+        stopping = automate.EarlyStopping(3, Evaluator(), confidence=2.)
+        margin = 2. / 3. ** 0.5
+        self.assertAlmostEqual(stopping.lower_bound(self.jobs([(1, 1)])[0]), 3. + 4. / 3. - margin)
+        self.assertEqual(stopping.lower_bound(self.jobs([(3, 4)])[0]), 0.)
+
+    def test_without_history(self):
+        self.store(2, {(1, 1): -3.})
+        stopping = automate.EarlyStopping(3, Evaluator([-0.1]))
+        self.assertEqual(stopping.lower_bound(self.jobs([(1, 1)])[0]), 0.)
+        self.assertFalse(stopping(self.jobs([(1, 1)])))
+
+
+if __name__ == '__main__':
+    unittest.main()
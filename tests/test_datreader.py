@@ -0,0 +1,119 @@
+""" checks of the text output reader on excerpts of the .dat and .sta files """
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import datreader
+
+# the end of a .dat file of a step with *ENERGY PRINT
+ENERGY_PRINT = """
+                              S T E P       1     S T A T I C   A N A L Y S I S
+
+
+                                                                                          INCREMENT     1 SUMMARY
+
+
+ TIME INCREMENT COMPLETED   1.00    ,  FRACTION OF STEP COMPLETED   1.00
+ STEP TIME COMPLETED        1.00    ,  TOTAL TIME COMPLETED         1.00
+
+
+                                 E N E R G Y   O U T P U T
+
+
+   RECOVERABLE STRAIN ENERGY                   3.412887E-03
+   KINETIC ENERGY                              0.00
+   EXTERNAL WORK                               3.412887E-03
+   PLASTIC DISSIPATION                         0.00
+   CREEP DISSIPATION                           0.00
+   VISCOUS DISSIPATION (IN DAMPERS ETC)        0.00
+   STATIC DISSIPATION (STABILIZATION)          0.00
+   INTERNAL ENERGY                             3.412887E-03
+   ARTIFICIAL STRAIN ENERGY                    0.00
+
+
+          THE ANALYSIS HAS BEEN COMPLETED
+
+
+
+                              ANALYSIS COMPLETE
+
+
+ JOB TIME SUMMARY
+   USER TIME (SEC)      =   41.200
+   SYSTEM TIME (SEC)    =   1.3000
+"""
+
+STA_COMPLETED = """ SUMMARY OF JOB INFORMATION:
+ STEP  INC ATT SEVERE EQUIL TOTAL  TOTAL      STEP       INC OF       DOF    IF
+               DISCON ITERS ITERS  TIME/    TIME/LPF    TIME/LPF    MONITOR RIKS
+               ITERS               FREQ
+   1     1   1     0     1     1  1.00       1.00       1.000
+ THE ANALYSIS HAS COMPLETED SUCCESSFULLY
+"""
+
+STA_FAILED = """ SUMMARY OF JOB INFORMATION:
+   1     1   1U    0     5     5  0.00       0.00       1.000
+ THE ANALYSIS HAS NOT BEEN COMPLETED
+"""
+
+
+class LastAllieTest(unittest.TestCase):
+
+    def test_energy_print(self):
+        self.assertEqual(datreader.last_allie(ENERGY_PRINT), 3.412887e-3)
+
+    def test_native_solver_line(self):
+        self.assertEqual(datreader.last_allie(' INTERNAL ENERGY (ALLIE)\t1.250000000e-03\n'), 1.25e-3)
+
+    def test_fortran_exponent(self):
+        self.assertEqual(datreader.last_allie('   INTERNAL ENERGY        2.5D-03\n'), 2.5e-3)
+
+    def test_value_of_a_later_line(self):
+        self.assertEqual(datreader.last_allie(' INTERNAL ENERGY\n\n   STEP  1 ...\n   ALLSE 3.5E-03'), None)
+
+    def test_table_header(self):
+        self.assertEqual(datreader.last_allie('   ALLIE      ALLSE\n   1.0E-03    2.0E-03\n'), None)
+
+    def test_whole_word(self):
+        self.assertEqual(datreader.last_allie(' ALLIEX 4.0\n INTERNAL ENERGYDENS 5.0\n'), None)
+
+
+class ReadEnergyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.jobname = os.path.join(self.directory, 'Outputfile_1_3_2')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, extension, text):
+        with open(self.jobname + extension, 'w') as output:
+            output.write(text)
+
+    def test_completed(self):
+        self.write('.dat', ENERGY_PRINT)
+        self.write('.sta', STA_COMPLETED)
+        self.assertEqual(datreader.read_energy(self.jobname), ('completed', 3.412887e-3))
+
+    def test_failed(self):
+        self.write('.dat', ENERGY_PRINT)
+        self.write('.sta', STA_FAILED)
+        self.assertEqual(datreader.read_energy(self.jobname), ('failed', None))
+
+    def test_missing(self):
+        self.assertEqual(datreader.read_energy(self.jobname), ('missing', None))
+
+    def test_beyond_the_tail(self):
+        # the energy print is followed by more than TAIL_SIZE bytes, the whole file is read
+        self.write('.dat', ENERGY_PRINT + (' ' * 79 + '\n') * (datreader.TAIL_SIZE // 80 + 1))
+        self.write('.sta', STA_COMPLETED)
+        self.assertEqual(datreader.read_energy(self.jobname), ('completed', 3.412887e-3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+""" checks of the distributed backend: a coordinator on an ephemeral port of localhost and
+two workers with the stand-in solver of the benchmark """
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import benchmark
+import datreader
+import distributed
+import jobpool
+
+DISTRIBUTED_SCRIPT = os.path.abspath(distributed.__file__).replace('.pyc', '.py')
+TOKEN = 'test-token'
+# the grains and laminates of the candidates, more than the four slots of both workers
+CANDIDATES = [(grain_nr, laminate) for grain_nr in (1, 2, 3, 4) for laminate in (1, 4)]
+
+MESH = """*Node
+1, 0., 0., 0.
+"""
+
+
+def deck(grain_nr, laminate):
+    return ('*Heading\n*INCLUDE, INPUT=mesh.inp\n*Solid Section, elset=transig_' + str(grain_nr) +
+            ', orientation=Ori_' + str(grain_nr) + ', material=laminate' + str(laminate) + '\n')
+
+
+class DistributedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+        with open('mesh.inp', 'w') as mesh:
+            mesh.write(MESH)
+        self.coordinator = distributed.Coordinator('127.0.0.1', 0, timeout=60, token=TOKEN)
+        self.port = self.coordinator.server.getsockname()[1]
+        self.workers = []
+
+    def tearDown(self):
+        for process in self.workers:
+            process.kill()
+            process.wait()
+        self.coordinator.close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def start_worker(self, name, token=TOKEN):
+        environment = dict(os.environ)
+        environment[benchmark.RUNTIME_VARIABLE] = '1.'
+        self.workers.append(subprocess.Popen([sys.executable, DISTRIBUTED_SCRIPT, 'worker', 'host=127.0.0.1',
+                                              'port=' + str(self.port), 'slots=2', 'cpus=1', 'backend=fake',
+                                              'directory=' + os.path.join(self.directory, name), 'name=' + name,
+                                              'token=' + token], env=environment))
+
+    def wait_for_events(self, condition, timeout=30.):
+        """ handles the messages of the workers until 'condition' holds """
+        deadline = time.time() + timeout
+        while not condition():
+            self.assertTrue(time.time() < deadline)
+            try:
+                worker, message = self.coordinator.events.get(timeout=1.)
+            except distributed.Queue.Empty:
+                continue
+            self.coordinator.handle(worker, message, [], [], None)
+
+    def test_jobs_spread_over_workers(self):
+        self.start_worker('worker1')
+        self.start_worker('worker2')
+        self.wait_for_events(lambda: len(self.coordinator.workers) == 2)
+        jobs = []
+        for grain_nr, laminate in CANDIDATES:
+            job = jobpool.Job(1, grain_nr, laminate)
+            with open(job.inputname, 'w') as inputfile:
+                inputfile.write(deck(grain_nr, laminate))
+            jobs.append(job)
+        finished = self.coordinator.run(jobs)
+        self.assertEqual(len(finished), len(CANDIDATES))
+        self.assertEqual(set([job.worker for job in finished]), set(['worker1', 'worker2']))
+        for job in finished:
+            self.assertEqual(job.status, 'completed')
+            status, allie = datreader.read_energy(job.outputname)
+            expected = benchmark.BASE_ENERGY + benchmark.ENERGY_SCALE * (0.5 + benchmark.unit_hash(job.grain_nr,
+                                                                                                   job.laminate))
+            self.assertEqual(status, 'completed')
+            self.assertAlmostEqual(allie / expected, 1., places=8)
+
+    def test_worker_without_token(self):
+        self.start_worker('intruder', token='wrong')
+        self.start_worker('worker1')
+        self.wait_for_events(lambda: len(self.coordinator.workers) == 1)
+        time.sleep(2.)
+        self.wait_for_events(lambda: self.coordinator.events.empty())
+        self.assertEqual([worker.name for worker in self.coordinator.workers], ['worker1'])
+
+
+class WorkerFileNameTest(unittest.TestCase):
+
+    def setUp(self):
+        self.worker = distributed.Worker('127.0.0.1', backend='fake', token=TOKEN)
+
+    def message(self, **fields):
+        message = {'type': 'job', 'id': 'Outputfile_1_2_3', 'increment': 1, 'grain': 2, 'laminate': 3,
+                   'inputname': 'Inputfile_1_2_3.inp', 'deck': '', 'includes': {}, 'timeout': 60}
+        message.update(fields)
+        return message
+
+    def test_input_outside_the_directory(self):
+        self.assertRaises(ValueError, self.worker.handle, self.message(inputname='../Inputfile_1_2_3.inp'))
+        self.assertRaises(ValueError, self.worker.handle, self.message(inputname='/tmp/Inputfile_1_2_3.inp'))
+
+    def test_output_outside_the_directory(self):
+        self.assertRaises(ValueError, self.worker.handle, self.message(id='../Outputfile_1_2_3'))
+
+    def test_include_outside_the_directory(self):
+        self.assertRaises(ValueError, self.worker.handle, self.message(includes={'/../../x': ''}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+""" checks of the native solver: the element operators, the Woodbury update of a candidate
+against a factorization of its own, and the interaction matrix against the exact energy """
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import deckparser
+import fesolver
+import material
+
+# an affine map of the reference elements, the patch is not aligned with the axes
+AFFINE = np.array([[1.2, 0.1, -0.2], [0.3, 0.9, 0.1], [-0.1, 0.2, 1.1]])
+SHIFT = np.array([0.5, -1., 2.])
+GRADIENT = np.array([[1e-3, 2e-4, -5e-4], [3e-4, -2e-3, 1e-4], [-1e-4, 6e-4, 1.5e-3]])
+
+TET_CORNERS = np.array([[0., 0., 0.], [1., 0., 0.], [0., 1., 0.], [0., 0., 1.]])
+TET_EDGES = [(0, 1), (1, 2), (2, 0), (0, 3), (1, 3), (2, 3)]
+REFERENCE_NODES = {
+    'C3D4': TET_CORNERS,
+    'C3D10': np.vstack([TET_CORNERS] + [0.5 * (TET_CORNERS[a] + TET_CORNERS[b]) for a, b in TET_EDGES]),
+    'C3D8': 0.5 * (fesolver.HEX_CORNERS + 1.),
+    'C3D8R': 0.5 * (fesolver.HEX_CORNERS + 1.),
+}
+REFERENCE_VOLUMES = {'C3D4': 1. / 6, 'C3D10': 1. / 6, 'C3D8': 1., 'C3D8R': 1.}
+
+# two hexahedra side by side, each one grain. The face x = 0 is clamped, the face x = 2
+# is displaced, so the prescribed displacements are not zero
+DECK = """*Node
+1, 0., 0., 0.
+2, 1., 0., 0.
+3, 2., 0., 0.
+4, 0., 1., 0.
+5, 1., 1., 0.
+6, 2., 1., 0.
+7, 0., 0., 1.
+8, 1., 0., 1.
+9, 2., 0., 1.
+10, 0., 1., 1.
+11, 1., 1., 1.
+12, 2., 1., 1.
+*Element, type=C3D8
+1, 1, 2, 5, 4, 7, 8, 11, 10
+2, 2, 3, 6, 5, 8, 9, 12, 11
+*Elset, elset=transig_1
+1
+*Elset, elset=transig_2
+2
+*Nset, nset=left
+1, 4, 7, 10
+*Nset, nset=right
+3, 6, 9, 12
+*Orientation, name=Ori_1
+0.6, 0.8, 0., -0.8, 0.6, 0.2
+*Orientation, name=Ori_2
+0.3, -0.2, 0.9, 0.1, 0.95, 0.1
+*Solid Section, elset=transig_1, orientation=Ori_1, material=austenite
+*Solid Section, elset=transig_2, orientation=Ori_2, material=austenite
+*Boundary
+left, ENCASTRE
+right, 1, 1, 0.002
+"""
+
+
+class ElementPatchTest(unittest.TestCase):
+    """ a linear displacement field gives its constant strain at every integration point
+    and the weights sum up to the volume, for every element type """
+
+    def check(self, element_type):
+        X = np.dot(REFERENCE_NODES[element_type], AFFINE.T) + SHIFT
+        B, wdet = fesolver.strain_operator(element_type, X[np.newaxis])
+        u = np.dot(X, GRADIENT.T).ravel()
+        strain = np.einsum('egia,a->egi', B, u)
+        expected = fesolver.voigt_strain(0.5 * (GRADIENT + GRADIENT.T))
+        self.assertTrue(np.allclose(strain, expected, rtol=1e-10, atol=1e-14))
+        self.assertAlmostEqual(wdet.sum(), REFERENCE_VOLUMES[element_type] * np.linalg.det(AFFINE))
+
+    def test_tet4(self):
+        self.check('C3D4')
+
+    def test_tet10(self):
+        self.check('C3D10')
+
+    def test_hex8(self):
+        self.check('C3D8')
+
+    def test_hex8_reduced(self):
+        self.check('C3D8R')
+
+
+class CandidateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        inputname = os.path.join(self.directory, 'two_grains.inp')
+        with open(inputname, 'w') as deck:
+            deck.write(DECK)
+        self.model = fesolver.Model(deckparser.parse(inputname, cache=False))
+        fesolver._base_cache.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_update_equals_factorization(self):
+        """ the Woodbury update of a transforming grain gives the solution of the
+        candidate's own factorization, also with prescribed displacements """
+        base = fesolver.BaseSystem(self.model, self.model.materials)
+        section = self.model.section_of_grain(2)
+        for laminate in (1, 4):
+            updated = base.solve_candidate(section, 'LAMINATE' + str(laminate))
+            factorized = self.model.solve(base.replaced(section, 'LAMINATE' + str(laminate)))
+            self.assertTrue(np.allclose(updated.strain_energies, factorized.strain_energies, rtol=1e-8))
+            self.assertTrue(np.allclose(updated.mean_stresses, factorized.mean_stresses, rtol=1e-6,
+                                        atol=1e-10 * np.abs(factorized.mean_stresses).max()))
+
+    def test_interaction_energies_without_stiffness_change(self):
+        """ if the laminates had the austenite stiffness, the energy is quadratic in the
+        eigenstrain and the interaction matrix is exact """
+        martensite_stiffness = material.martensite_stiffness
+        material.martensite_stiffness = material.austenite_stiffness
+        try:
+            base = fesolver.BaseSystem(self.model, self.model.materials)
+            sections = [self.model.section_of_grain(1), self.model.section_of_grain(2)]
+            laminates = [1, 2, 3]
+            estimates = fesolver.InteractionMatrix(base, sections).energies(laminates)
+            for i, section in enumerate(sections):
+                for k, laminate in enumerate(laminates):
+                    exact = self.model.solve(base.replaced(section, 'LAMINATE' + str(laminate))).allie
+                    self.assertAlmostEqual(estimates[i, k] / exact, 1., places=8)
+        finally:
+            material.martensite_stiffness = martensite_stiffness
+
+
+if __name__ == '__main__':
+    unittest.main()
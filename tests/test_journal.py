@@ -0,0 +1,87 @@
+""" checks of the crash safety of the increment journal: a restarted increment takes the
+records of its journal, a torn last line is cut off, a journal of another state is
+discarded and the journals of saved increments are removed """
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import jobpool
+import journal
+
+STATE = journal.state_key(3, [[5, 1], [7, 4]])
+
+
+def ended_job(grain_nr, laminate, status='completed'):
+    job = jobpool.Job(3, grain_nr, laminate)
+    job.status = status
+    return job
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+        os.makedirs('saves')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def write_journal(self):
+        increment_journal = journal.Journal(3, STATE)
+        increment_journal.record_submission(ended_job(2, 1))
+        increment_journal.record_submission(ended_job(4, 6))
+        increment_journal.record_evaluation(ended_job(2, 1), 1.5e-3)
+        increment_journal.record_evaluation(ended_job(4, 6, 'timeout'), None)
+        increment_journal.close()
+
+    def test_restart(self):
+        self.write_journal()
+        increment_journal = journal.Journal(3, STATE)
+        self.assertEqual(increment_journal.submitted, set([(2, 1), (4, 6)]))
+        self.assertEqual(increment_journal.evaluated, {(2, 1): ('completed', 1.5e-3), (4, 6): ('timeout', None)})
+        increment_journal.close()
+
+    def test_torn_line(self):
+        self.write_journal()
+        with open(journal.journal_filename(3), 'r') as journal_file:
+            valid = journal_file.read()
+        with open(journal.journal_filename(3), 'a') as journal_file:
+            journal_file.write('{"energy": 2.0e-3, "event": "evaluated", "gra')
+        increment_journal = journal.Journal(3, STATE)
+        self.assertEqual(len(increment_journal.evaluated), 2)
+        increment_journal.close()
+        with open(journal.journal_filename(3), 'r') as journal_file:
+            self.assertEqual(journal_file.read(), valid)
+        # the records appended after the restart are read again
+        increment_journal = journal.Journal(3, STATE)
+        increment_journal.record_evaluation(ended_job(6, 2), 2.0e-3)
+        increment_journal.close()
+        self.assertEqual(journal.Journal(3, STATE).evaluated[(6, 2)], ('completed', 2.0e-3))
+
+    def test_other_state(self):
+        self.write_journal()
+        increment_journal = journal.Journal(3, journal.state_key(3, [[5, 1], [8, 4]]))
+        self.assertEqual(increment_journal.evaluated, {})
+        self.assertEqual(increment_journal.submitted, set())
+        increment_journal.close()
+        with open(journal.journal_filename(3), 'r') as journal_file:
+            self.assertEqual(len(journal_file.readlines()), 1)  # the start record of the new state
+
+    def test_remove_stale(self):
+        for martensite_amount in (1, 2, 3):
+            journal.Journal(martensite_amount, STATE).close()
+        with open('saves/journal_backup', 'w'):
+            pass
+        journal.remove_stale(3)
+        self.assertEqual(sorted(os.listdir('saves')), ['journal_3', 'journal_backup'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+""" checks of the batched operations of mathutils against their scalar versions """
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import material
+import mathutils
+
+# pairs of orientation vectors a, b of a few grains
+ORIENTATIONS = [([1., 0., 0.], [0., 1., 0.]),
+                ([0.6, 0.8, 0.], [-0.8, 0.6, 0.2]),
+                ([0.3, -0.2, 0.9], [0.1, 0.95, 0.1]),
+                ([-0.5, 0.5, 0.7], [0.7, 0.7, 0.])]
+
+
+class BatchedRotationTest(unittest.TestCase):
+
+    def test_rotate_elastic_tensors(self):
+        C = np.array(material.martensite_stiffness(), dtype=float)
+        R = np.array([mathutils.orientation_basis(a, b) for a, b in ORIENTATIONS])
+        rotated = mathutils.rotate_elastic_tensors(C, R)
+        for i in range(len(R)):
+            expected = mathutils.rotateElasticTensor(C, R[i])
+            self.assertTrue(np.allclose(rotated[i], expected, rtol=1e-12, atol=1e-12 * np.abs(C).max()))
+
+    def test_rotate_elastic_tensors_of_stacks(self):
+        C = np.array([material.austenite_stiffness(), material.martensite_stiffness()], dtype=float)
+        R = np.array([mathutils.orientation_basis(a, b) for a, b in ORIENTATIONS[0:2]])
+        rotated = mathutils.rotate_elastic_tensors(C, R)
+        for i in range(2):
+            self.assertTrue(np.allclose(rotated[i], mathutils.rotateElasticTensor(C[i], R[i]),
+                                        atol=1e-12 * np.abs(C).max()))
+
+    def test_rotation_matrices_euler(self):
+        # the scalar version needs a x b off the z axis
+        orientations = ORIENTATIONS[1:]
+        R = mathutils.rotation_matrices_euler([a for a, b in orientations], [b for a, b in orientations])
+        for i, (a, b) in enumerate(orientations):
+            expected = np.array(mathutils.calc_rotmatrix_euler(a, b))
+            self.assertTrue(np.allclose(R[i], expected, atol=1e-10))
+
+    def test_rotation_matrices_euler_identity(self):
+        R = mathutils.rotation_matrices_euler([[1., 0., 0.]], [[0., 1., 0.]])
+        self.assertTrue(np.isfinite(R).all())
+        self.assertTrue(np.allclose(R[0], np.identity(3)))
+
+    def test_rotation_matrices_euler_parallel(self):
+        self.assertRaises(ValueError, mathutils.rotation_matrices_euler, [[1., 0., 0.]], [[2., 0., 0.]])
+
+
+class BatchedVoigtTest(unittest.TestCase):
+
+    def test_stiffness_round_trip(self):
+        C = np.array(material.martensite_stiffness(), dtype=float)
+        self.assertTrue(np.allclose(mathutils.stiffness_tensors(mathutils.stiffness_matrices(C)), C))
+
+    def test_voigt_entries(self):
+        C = np.array(material.martensite_stiffness(), dtype=float)
+        self.assertTrue(np.allclose(mathutils.voigt_entries(C), mathutils.voigt_notation(C.tolist())))
+
+    def test_matrix_elements(self):
+        elements = np.array([[1., 2., 3., 4., 5., 6.], [-1., 0.5, 2., 0., 1., -3.]])
+        M = mathutils.fill_matrices(elements)
+        self.assertTrue(np.allclose(M, np.swapaxes(M, 1, 2)))
+        self.assertTrue(np.allclose(mathutils.matrix_elements(M), elements))
+        for i in range(2):
+            self.assertTrue(np.allclose(M[i], mathutils.fillMatrix(list(elements[i]))))
+
+    def test_doubledot_products(self):
+        A = np.random.RandomState(1).rand(3, 3, 3)
+        B = np.random.RandomState(2).rand(2, 3, 3)
+        products = mathutils.doubledot_products(A, B)
+        for n in range(3):
+            for k in range(2):
+                self.assertAlmostEqual(products[n, k], mathutils.doubledot_product(A[n].tolist(), B[k].tolist()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+""" checks of the result store: the last record of an increment and candidate is the valid
+one after an increment was appended again, and a partly written record is ignored """
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import resultstore
+
+
+def evaluation_data(deltas):
+    """ the evaluation rows of the candidates {(grainNr, laminate): delta_G} """
+    return [[delta, grain_nr, laminate, 10., 1e-4, 2e-4, 1e-3]
+            for (grain_nr, laminate), delta in sorted(deltas.items())]
+
+
+class LastOfTest(unittest.TestCase):
+
+    def test_last_occurrence(self):
+        keys = np.array([[1, 1], [2, 1], [1, 1], [3, 2], [2, 1]])
+        self.assertEqual(list(resultstore.last_of(keys)), [2, 3, 4])
+
+    def test_empty(self):
+        self.assertEqual(len(resultstore.last_of(np.zeros((0, 2), dtype=np.int32))), 0)
+
+
+class ResultStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = resultstore.ResultStore(os.path.join(self.directory, 'results'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_reappended_increment(self):
+        self.store.add_runs(1, evaluation_data({(1, 1): -3., (2, 1): -1., (3, 4): -2.}))
+        self.store.add_runs(2, evaluation_data({(1, 1): -5.}))
+        # the increment is calculated again after an interruption
+        self.store.add_runs(1, evaluation_data({(2, 1): -4., (3, 4): -2.5}))
+        self.assertEqual(list(self.store.increments()), [1, 2])
+        self.assertEqual(self.store.deltas(1), {(1, 1): -3., (2, 1): -4., (3, 4): -2.5})
+        self.assertEqual(self.store.deltas(2), {(1, 1): -5.})
+        self.assertEqual(self.store.top(1, 2), [[3, 4], [1, 1]])
+        self.assertEqual(self.store.top(1, 1, descending=False), [[2, 1]])
+        history = self.store.history(1)
+        self.assertEqual(list(history['increment']), [1, 2])
+        self.assertEqual(list(history['delta_G']), [-3., -5.])
+
+    def test_reappended_grain(self):
+        self.store.add_grain(1, [-3., 1, 1, 10., 1e-4, 2e-4, 1e-3], 0.5)
+        self.store.add_grain(2, [-5., 2, 4, 10., 1e-4, 2e-4, 1e-3], 0.6)
+        self.store.add_grain(2, [-6., 3, 5, 10., 1e-4, 2e-4, 1e-3], 0.7)
+        grains, model = self.store.accepted()
+        self.assertEqual(list(grains['increment']), [1, 2])
+        self.assertEqual(list(grains['grain']), [1, 3])
+        self.assertEqual(len(model['increment']), 0)
+
+    def test_partly_written_record(self):
+        self.store.add_runs(1, evaluation_data({(1, 1): -3.}))
+        table = self.store.run_table
+        # the append of the next record was interrupted after the first column
+        with open(table.filename('increment'), 'ab') as column:
+            column.write(np.array([2], dtype='<i4').tobytes())
+        self.assertEqual(len(table), 1)
+        self.store.add_runs(3, evaluation_data({(2, 2): -1.}))
+        self.assertEqual(len(table), 2)
+        self.assertEqual(list(table.column('increment')), [1, 3])
+        self.assertEqual(self.store.deltas(3), {(2, 2): -1.})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+""" This module writes a trace of every increment: one JSON line per stage of the increment
+and per candidate job to 'saves/traces/increment_<increment>.jsonl'. A stage record holds
+the wall clock time of the stage, a job record the grain, laminate, status, the time the
+job waited in the queue, its wall clock and cpu time, and the size of its outputs. A
+'screening' record notes an increment whose stress screening fell back to the preselection
+table. An increment that is restarted appends to its trace. The summary aggregates the traces of
+all increments:
+
+    python tracing.py [directory]   (default saves/traces)
+"""
+
+import glob
+import json
+import os
+import sys
+import time
+# my modules
+import retention
+
+TRACE_DIRECTORY = 'saves/traces'
+
+
+def trace_filename(martensite_amount, directory=TRACE_DIRECTORY):
+    return os.path.join(directory, 'increment_' + str(martensite_amount) + '.jsonl')
+
+
+def output_size(outputname):
+    """ bytes of the outputs of a job, e.g. .odb, .dat, .msg and .sta. Only the files of
+    retention.OUTPUT_EXTENSIONS are looked at, the directory is not listed """
+    sizes = [retention.file_size(outputname + extension) for extension in retention.OUTPUT_EXTENSIONS]
+    return sum([size for size in sizes if size is not None])
+
+
+class Stage(object):
+    """ times a stage of the increment, see Trace.stage """
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        self.trace.record('stage', stage=self.name, start=self.start, wall=time.time() - self.start,
+                          error=error_type.__name__ if error_type is not None else None)
+        return False
+
+
+class Trace(object):
+    """ the trace of the increment 'martensite_amount' """
+
+    def __init__(self, martensite_amount, directory=TRACE_DIRECTORY):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.martensite_amount = martensite_amount
+        self.start = time.time()
+        self.trace = open(trace_filename(martensite_amount, directory), 'a')
+        self.record('start')
+
+    def record(self, event, **fields):
+        fields.update(event=event, increment=self.martensite_amount, time=time.time())
+        self.trace.write(json.dumps(fields, sort_keys=True) + '\n')
+        self.trace.flush()
+
+    def stage(self, name):
+        """ with trace.stage('deck writing'): ... records the time of the block """
+        return Stage(self, name)
+
+    def record_job(self, job, timeout=None):
+        """ the record of an ended or skipped job (jobpool.Job) """
+        queue_time = getattr(job, 'queue_time', None)
+        wait = job.start_time - queue_time if job.start_time is not None and queue_time is not None else None
+        self.record('job', grain=job.grain_nr, laminate=job.laminate, status=job.status, returncode=job.returncode,
+                    timeout=job.status == 'timeout', timeout_limit=timeout, queue_wait=wait,
+                    wall=job.runtime() if job.start_time is not None else None,
+                    cpu=getattr(job, 'cpu_time', None), output_size=output_size(job.outputname))
+
+    def close(self, **fields):
+        """ the closing record with the wall clock time of the whole increment """
+        self.record('end', wall=time.time() - self.start, **fields)
+        self.trace.close()
+
+
+# -----< summary >-------------------------------------------------------------------------#
+
+def read_trace(filename):
+    """ the records of a trace, a line cut off by an interruption is ignored """
+    records = []
+    with open(filename, 'r') as trace:
+        for line in trace:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                pass
+    return records
+
+
+def summarize(directory=TRACE_DIRECTORY):
+    """ aggregates the traces of all increments: the time of every stage, the jobs by
+    status with their wall clock and cpu times, and the candidates that timed out """
+    stages = {}  # stage -> [total wall, number of records]
+    jobs = {}  # status -> list of job records
+    timeouts = []
+    increments = {}  # increment -> wall clock time of its completed runs
+    for filename in glob.glob(os.path.join(directory, 'increment_*.jsonl')):
+        for record in read_trace(filename):
+            if record['event'] == 'stage':
+                total = stages.setdefault(record['stage'], [0., 0])
+                total[0] += record['wall']
+                total[1] += 1
+            elif record['event'] == 'job':
+                jobs.setdefault(record['status'], []).append(record)
+                if record['timeout']:
+                    timeouts.append((record['increment'], record['grain'], record['laminate'], record['wall']))
+            elif record['event'] == 'end':
+                increments[record['increment']] = increments.get(record['increment'], 0.) + record['wall']
+    return stages, jobs, sorted(timeouts), increments
+
+
+def print_summary(directory=TRACE_DIRECTORY):
+    stages, jobs, timeouts, increments = summarize(directory)
+    total_time = sum(increments.values())
+    print('increments: ' + str(len(increments)) + '   wall clock: ' + '{0:.1f}'.format(total_time / 3600.) + ' h')
+    print('\nstage\t\t\ttotal [s]\tmean [s]\tshare')
+    for stage, (wall, count) in sorted(stages.items(), key=lambda item: -item[1][0]):
+        print(stage.ljust(16) + '\t' + '{0:.1f}'.format(wall) + '\t\t' + '{0:.2f}'.format(wall / count) + '\t\t' +
+              '{0:.1%}'.format(wall / total_time if total_time > 0 else 0.))
+    print('\nstatus\t\tjobs\tmean wall [s]\tmax wall [s]\tmean cpu [s]\tmean wait [s]\toutput [MB]')
+    for status, records in sorted(jobs.items()):
+        walls = [record['wall'] for record in records if record['wall'] is not None]
+        cpus = [record['cpu'] for record in records if record['cpu'] is not None]
+        waits = [record['queue_wait'] for record in records if record['queue_wait'] is not None]
+        print(status.ljust(10) + '\t' + str(len(records)) + '\t' +
+              '{0:.1f}'.format(sum(walls) / len(walls) if walls else 0.) + '\t\t' +
+              '{0:.1f}'.format(max(walls) if walls else 0.) + '\t\t' +
+              '{0:.1f}'.format(sum(cpus) / len(cpus) if cpus else 0.) + '\t\t' +
+              '{0:.1f}'.format(sum(waits) / len(waits) if waits else 0.) + '\t\t' +
+              '{0:.1f}'.format(sum([record['output_size'] for record in records]) / 1e6))
+    if timeouts:
+        print('\ntimed out (increment, grain, laminate, wall [s]):')
+        for increment, grain_nr, laminate, wall in timeouts:
+            print('\t' + str(increment) + '\t' + str(grain_nr) + '\t' + str(laminate) + '\t' + '{0:.0f}'.format(wall))
+
+
+if __name__ == '__main__':
+    print_summary(sys.argv[1] if len(sys.argv) > 1 else TRACE_DIRECTORY)
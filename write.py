@@ -1,7 +1,11 @@
 """This module creates the specified inputfiles and writes simulation results to files """
 
+import hashlib
+import os
 import shutil
 import automate
+import datreader
+import resultstore
 
 
 class AbaqusConfiguration(object):
@@ -22,106 +26,167 @@ class RunResults(object):
         self.found_grain = found_grain
 
 
+def section_line(grain_nr, material):
+    """ section assignment of a grain, the element set and orientation are named after it """
+    return '*Solid Section, elset=transig_' + str(grain_nr) + ', orientation=Ori_' + str(grain_nr) + \
+           ', material=' + material + '\n'
+
+
+def shared_directory():
+    """ directory of the shared include files of the run in the working directory. It is
+    placed in the tmpfs /dev/shm if available, named after the working directory so that
+    several runs on one host do not interfere """
+    run_name = 'transEnergymin_' + hashlib.md5(os.getcwd().encode('utf-8')).hexdigest()[:8]
+    if os.path.isdir('/dev/shm'):
+        return os.path.join('/dev/shm', run_name)
+    return os.path.abspath('shared')
+
+
+class SharedIncludes(object):
+    """ holds the parts of the input files that are equal for all candidates of a run:
+    the mesh with orientations and the material and job data (laminates, PBC equations,
+    step definition). Both are copied once per run into the shared directory and are
+    referenced from every candidate deck with *INCLUDE instead of copying them """
+
+    def __init__(self, geometry_filename, material_jobdata_filename, directory=None):
+        self.directory = directory if directory is not None else shared_directory()
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self.geometry = self.share(geometry_filename.strip(), 'geometry.inp')
+        self.material_jobdata = self.share(material_jobdata_filename.strip(), 'material_jobdata.inp')
+
+    def share(self, filename, shared_name):
+        """ copies the file into the shared directory unless an identical copy exists """
+        shared_filename = os.path.join(self.directory, shared_name)
+        source = os.stat(filename)
+        if os.path.isfile(shared_filename):
+            copy = os.stat(shared_filename)
+            if copy.st_size == source.st_size and copy.st_mtime == source.st_mtime:
+                return shared_filename
+        shutil.copy2(filename, shared_filename)
+        return shared_filename
+
+    def write_matrix(self, martensite_amount, C_ave):
+        """ writes the section and material of the self consistent matrix of an increment
+        to a shared file and returns its name """
+        matrix_filename = os.path.join(self.directory, 'matrix_' + str(martensite_amount) + '.inp')
+        with open(matrix_filename, 'w') as ifile:
+            # write section for self consistent matrix, an orientation is
+            # needed because self consistent isotropic properties are given as
+            # averaged anisotropic tensor
+            ifile.write('*Solid Section, elset=matrix, orientation=Ori_1,' + \
+                        'material=selfconsistentIsotropic\n')
+            ifile.write('*Material, name=selfconsistentIsotropic\n*Elastic, type=ANISOTROPIC\n')
+            # the specification due to abaqus is first and second line 8
+            # and third line 4 entries, see keyword *elastic, type=anisotropic
+            entry = 0
+            for i in C_ave:
+                entry = entry + 1
+                ifile.write(i + '\t,')
+                if entry == 8:
+                    ifile.write('\n')
+                    entry = 0
+            ifile.write('\n')
+        return matrix_filename
+
+    def remove(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class DeckTemplate(object):
+    """ the input file of a candidate only differs in the section of the transforming
+    grain. The template renders the section assignments of an increment once, a
+    candidate deck is then the template with the section of one grain exchanged """
+
+    def __init__(self, martensite_amount, austenite_grains, martensite_grains, pbc, includes, C_ave=0):
+        self.martensite_amount = martensite_amount
+        self.head = '*INCLUDE, INPUT=' + includes.geometry + '\n'
+        # ----- sections of the not transformed grains -----
+        # offsets of each grain's line in the block, so that it can be cut out
+        self.offsets = {}
+        lines = []
+        position = 0
+        for iGrain in austenite_grains:
+            string = section_line(iGrain[0], 'austenite')
+            self.offsets[iGrain[0]] = (position, position + len(string))
+            position += len(string)
+            lines.append(string)
+        self.austenite_block = ''.join(lines)
+        # ----- sections for already transformed grains -----
+        # iGrain = [ grainNr, laminate ]
+        self.martensite_block = ''.join([section_line(iGrain[0], 'laminate' + str(iGrain[1]))
+                                         for iGrain in martensite_grains])
+        # ---- material and jobdata -----
+        self.tail = ''
+        if not pbc:
+            self.tail += '*INCLUDE, INPUT=' + includes.write_matrix(martensite_amount, C_ave) + '\n'
+        self.tail += '*INCLUDE, INPUT=' + includes.material_jobdata + '\n'
+
+    def render(self, austenite_grain, laminate):
+        """ returns the input deck in which 'austenite_grain' transforms to 'laminate' """
+        start, end = self.offsets[austenite_grain[0]]
+        return self.head + self.austenite_block[:start] + self.austenite_block[end:] + \
+               self.martensite_block + section_line(austenite_grain[0], 'laminate' + str(laminate)) + self.tail
+
+    def write_inputfile(self, austenite_grain, laminate):
+        """ creates the inputfile of a candidate and returns its name """
+        inputFile_name = 'Inputfile_' + str(self.martensite_amount) + \
+                         '_' + str(austenite_grain[0]) + '_' + str(laminate) + '.inp'
+        with open(inputFile_name, 'w') as ifile:
+            ifile.write(self.render(austenite_grain, laminate))
+        return inputFile_name
+
+
 class FileInputWriter(object):
     def __init__(self, config, geometry_filename, material_jobdata_filename, C_ave=0):
         self.config = config
         self.geometry_filename = geometry_filename
         self.material_jobdata_filename = material_jobdata_filename
+        self.C_ave = C_ave
 
     def write_inputfile(self):
-        """ creates an inputfile according to the specified parameters """
-        #
-        # specify the name of the created inputfile
-        inputFile_name = 'Inputfile_' + str(self.config.martensite_amount) + \
-                         '_' + str(self.config.austenite_grain[0]) + '_' + str(self.config.laminate) + '.inp'
-        # the first section of the created inputfile is the used mesh from the specified
-        # external file. Copy this external file and rename it to the specified inputfile name
-        shutil.copy2(self.geometry_filename, inputFile_name)
-        # append section definitions and assignments to inputfile according to previous results
-        with open(inputFile_name, 'a') as ifile:
-            # ----- write sections -----
-            for iGrain in self.config.austenite_grains:
-                # only write currently transforming grain once
-                if self.config.austenite_grain == iGrain: continue
-                string = '*Solid Section, elset=transig_' + str(iGrain[0]) + \
-                         ', orientation=Ori_' + str(iGrain[0]) + ', material=austenite\n'
-                ifile.write(string)
-            # write sections for already transformed grains
-            for iGrain in self.config.martensite_grains:
-                # iGrain = [ grainNr, laminate ]
-                string = '*Solid Section, elset=transig_' + str(iGrain[0]) + \
-                         ', orientation=Ori_' + str(iGrain[0]) + ', material=laminate' + \
-                         str(iGrain[1]) + '\n'
-                ifile.write(string)
-            # write section of additional grain transforming in this increment
-            string = '*Solid Section, elset=transig_' + str(self.config.austenite_grain[0]) + \
-                     ', orientation=Ori_' + str(self.config.austenite_grain[0]) + ', material=laminate' + \
-                     str(self.config.laminate) + '\n'
-            ifile.write(string)
-            # ---- write material and jobdata -----
-            if not self.config.pbc:
-                # write section for self consistent matrix, an orientation is
-                # needed because self consistent isotropic properties are given as
-                # averaged anisotropic tensor
-                string = '*Solid Section, elset=matrix, orientation=Ori_1,' + \
-                         'material=selfconsistentIsotropic\n'
-                ifile.write(string)
-                ifile.write('*Material, name=selfconsistentIsotropic\n*Elastic, type=ANISOTROPIC\n')
-                # the specification due to abaqus is first and second line 8
-                # and third line 4 entries, see keyword *elastic, type=anisotropic
-                entry = 0
-                for i in self.C_ave:
-                    entry = entry + 1
-                    ifile.write(i + '\t,')
-                    if entry == 8:
-                        ifile.write('\n')
-                        entry = 0
-                ifile.write('\n')
-            # finally write laminate and job information
-            with open(self.material_jobdata_filename, 'r') as material_jobData:
-                for line in material_jobData:
-                    ifile.write(line)
+        """ creates an inputfile according to the specified parameters. To write all
+        candidates of an increment build one DeckTemplate and use it for each of them """
+        includes = SharedIncludes(self.geometry_filename, self.material_jobdata_filename)
+        template = DeckTemplate(self.config.martensite_amount, self.config.austenite_grains,
+                                self.config.martensite_grains, self.config.pbc, includes, self.C_ave)
+        return template.write_inputfile(self.config.austenite_grain, self.config.laminate)
+
 
 class FileOutputWriter(object):
     def __init__(self, results):
         self.results = results
 
     def write_saves(self):
-        """write data of Energy minimizing-configuration in the two files 'save_gain'
-        containing grain specific data and 'save_model' containing model specific data.
-        Also save the information of all other transformations in an increment as a reference.
+        """write data of Energy minimizing-configuration to the result store (see
+        resultstore), which replaces the two files 'save_gain' containing grain specific data
+        and 'save_model' containing model specific data. Also save the information of all
+        other transformations in an increment as a reference.
         foundGrain = [0 - delta_allEner, 1 - GrainNr, 2 - GrainLaminate, 3 - GrainVol,
                       4 - dragEner_spec, 5 - delta_totalStrain_spec,
-                      6 - stress_drivingForce, 7 - total_strainEner_cell ] """
+                      6 - total_strainEner_cell ] """
+        #
+        fg = self.results.found_grain
+        m = self.results.martensite_amount
+        # barrier the chemical driving force has to overcome for the found grain
+        hD = fg[4] + fg[5]
+        store = resultstore.ResultStore()
         #
-        # write data from all runs of the actual increment
-        with open('saves/allruns_' + str(self.results.martensite_amount), 'w') as save_all:
-            save_all.write('grainNr\tlaminateNr\tgrainVol\tdragEner_spec\t\t' +
-                           'delta_totStrainEner_spec\tdelta_allEnergies\n')
-            for dat in self.results.evaluation_data:
-                save_all.write(str(dat[1]) + '\t' + str(dat[2]) + '\t\t' + str(dat[3]) + '\t' +
-                               str(dat[4]) + '\t' + str(dat[5]) + '\t\t' + str(dat[0]) + '\n')
-                # write grain data:
-        with open('saves/save_grain', 'a') as save_grain:
-            save_grain.write(str(fg[1]) + '\t' + str(fg[2]) + '\t\t' + str(fg[3]) + '\t' + str(fg[4]) +
-                             '\t' + str(fg[5]) + '\t\t' + str(fg[0]) + '\t'
-                             + str(- hD + self.results.chemical_driving_force) + '\n')
+        # write data from all runs of the actual increment and the grain data
+        store.add_runs(m, self.results.evaluation_data)
+        store.add_grain(m, fg, - hD + self.results.chemical_driving_force)
 
         # gather and write model data:
-        odbname = 'Outputfile_' + str(self.results.martensite_amount) + '_' + str(fg[1]) + '_' + str(fg[2]) + '.odb'
-        md = automate.evaluate_odb(odbname, var=0)  # md ... modeldata
+        jobname = 'Outputfile_' + str(m) + '_' + str(fg[1]) + '_' + str(fg[2])
+        if os.path.isfile(jobname + '.odb'):
+            md = automate.evaluate_odb(jobname + '.odb', var=0)  # md ... modeldata
+        else:
+            # the native solver prints the model data to the .dat file
+            md = datreader.read_model_data(jobname)
         md_6 = fg[3] * fg[5]  # this is delta_total_strainEner
 
         # md = [0 - tot_strainEner, 1 - tot_aveSener, 2 - ivol_aust, 3 - ivol_mart,
         # 4 - aveSener_aust,  5 - aveSener_mart ]
-        with open('saves/save_model', 'a') as save_model:
-            save_model.write(str(md[0]) + '\t' + str(md_6) + '\t' + str(md[1]) + '\t' + str(md[2]) + '\t' +
-                             str(md[3]) + '\t' + str(md[4]) + '\t' + str(md[5]) + '\n')
-
-
-
-
-
-
-
-
+        # the states inside a batch of grains (see batch) are not solved and have no model data
+        if md is not None:
+            store.add_model(m, md, md_6)